@@ -0,0 +1,81 @@
+"""
+Compare the trigger and read calls per second of the CartPole and FastCartPole devices.
+
+Both devices use the NumPy cartpole so the device and RunEngine overhead
+dominates. The devices are measured alone and in a RunEngine plan setting
+the action and calling trigger_and_read, as train_agent() does:
+
+    python benchmarks/benchmark_cartpole_device.py --step-count 20000
+"""
+
+import argparse
+import time
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+from bluesky import RunEngine
+
+from bluesky_cartpole.cartpole import CartPole, FastCartPole
+
+
+def benchmark_device(cartpole_device, step_count):
+    """
+    Return the set-trigger-read calls per second of cartpole_device without a RunEngine.
+    """
+    cartpole_device.stage()
+    start_time = time.perf_counter()
+    for step_i in range(step_count):
+        cartpole_device.action.set(step_i % 2)
+        cartpole_device.trigger()
+        cartpole_device.read()
+    elapsed_time = time.perf_counter() - start_time
+    cartpole_device.unstage()
+    return step_count / elapsed_time
+
+
+def benchmark_plan(cartpole_device, step_count):
+    """
+    Return the steps per second of a RunEngine plan recording every step of cartpole_device.
+    """
+
+    @bpp.stage_decorator([cartpole_device])
+    @bpp.run_decorator()
+    def step_plan():
+        for step_i in range(step_count):
+            yield from bps.mv(cartpole_device.action, step_i % 2)
+            yield from bps.trigger_and_read([cartpole_device])
+
+    RE = RunEngine(context_managers=[])
+    start_time = time.perf_counter()
+    RE(step_plan())
+    elapsed_time = time.perf_counter() - start_time
+    return step_count / elapsed_time
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--step-count", default=20000, type=int)
+    args = arg_parser.parse_args()
+
+    for benchmark_name, benchmark in (
+        ("device", benchmark_device),
+        ("plan", benchmark_plan),
+    ):
+        steps_per_second = {}
+        for device_class in (CartPole, FastCartPole):
+            cartpole_device = device_class(backend="numpy")
+            steps_per_second[device_class] = benchmark(
+                cartpole_device, step_count=args.step_count
+            )
+            print(
+                f"{benchmark_name:6s} {device_class.__name__:12s}"
+                f" {steps_per_second[device_class]:10.0f} steps/s"
+            )
+        print(
+            f"{benchmark_name:6s} speedup"
+            f" {steps_per_second[FastCartPole] / steps_per_second[CartPole]:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
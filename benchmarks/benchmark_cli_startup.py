@@ -0,0 +1,65 @@
+"""
+Measure the startup time of the bluesky-cartpole command line interface.
+
+"bluesky-cartpole --help" and argument errors must not import tensorflow,
+tensorforce, gym, bluesky or databroker. Pass --budget-ms to exit with an
+error when the median startup time is over budget, for example in CI:
+
+    python benchmarks/benchmark_cli_startup.py --repeat 10 --budget-ms 150
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_command(command):
+    start_time = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start_time
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", default=10, type=int)
+    arg_parser.add_argument("--budget-ms", default=None, type=float)
+    args = arg_parser.parse_args()
+
+    commands = {
+        "interpreter startup": [sys.executable, "-c", "pass"],
+        "bluesky-cartpole --help": [
+            sys.executable,
+            "-m",
+            "bluesky_cartpole.run_cartpole",
+            "--help",
+        ],
+        "bluesky-cartpole argument error": [
+            sys.executable,
+            "-m",
+            "bluesky_cartpole.run_cartpole",
+            "--episode-count",
+            "not-a-number",
+        ],
+    }
+
+    over_budget = False
+    for command_name, command in commands.items():
+        median_time_ms = (
+            statistics.median(time_command(command) for _ in range(args.repeat)) * 1000
+        )
+        print(f"{command_name:32s} {median_time_ms:8.1f} ms")
+        if (
+            args.budget_ms is not None
+            and command_name != "interpreter startup"
+            and median_time_ms > args.budget_ms
+        ):
+            over_budget = True
+
+    if over_budget:
+        sys.exit(f"CLI startup is over the budget of {args.budget_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
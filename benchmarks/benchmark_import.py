@@ -0,0 +1,40 @@
+"""
+Measure the time taken by "import bluesky_cartpole" in a fresh interpreter.
+
+Importing the package must not construct the databroker catalog or import
+intake, tensorforce or bluesky:
+
+    python benchmarks/benchmark_import.py --repeat 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_import(module_name):
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module_name}"], check=True)
+    return time.perf_counter() - start_time
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", default=10, type=int)
+    arg_parser.add_argument("--module", default="bluesky_cartpole", type=str)
+    args = arg_parser.parse_args()
+
+    # the interpreter startup time is subtracted from the import time
+    startup_times = [time_import("sys") for _ in range(args.repeat)]
+    import_times = [time_import(args.module) for _ in range(args.repeat)]
+
+    startup_time = statistics.median(startup_times)
+    import_time = statistics.median(import_times) - startup_time
+    print(f"interpreter startup: {startup_time * 1000:8.1f} ms")
+    print(f"import {args.module}: {import_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
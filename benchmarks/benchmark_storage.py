@@ -0,0 +1,124 @@
+"""
+Compare the documents per second stored by per-document inserts and by
+BatchingDocumentSink event pages.
+
+The Mongo stand-in costs what a Mongo insert costs the client, so no Mongo
+server is needed: each call waits for one round trip, and each document is
+encoded as JSON and its bytes are sent at a fixed bandwidth. Like a Mongo
+serializer the stand-in unpacks an event page and encodes its events one by
+one, so batching removes round trips but not per-document work:
+
+    python benchmarks/benchmark_storage.py --event-count 10000 --latency 0.0005
+"""
+
+import argparse
+import json
+import time
+
+import event_model
+
+from bluesky_cartpole.storage import BatchingDocumentSink
+
+
+class MongoStandIn:
+    """
+    A document sink with the client-side cost of a Mongo insert.
+
+    Each call takes latency seconds for the round trip plus the time to send the
+    JSON encoding of its documents at bandwidth bytes per second.
+    """
+
+    def __init__(self, latency, bandwidth):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.document_count = 0
+        self.insert_count = 0
+
+    def __call__(self, name, doc):
+        if name == "event_page":
+            # a Mongo serializer stores the events of a page as separate documents
+            docs = list(event_model.unpack_event_page(doc))
+        else:
+            docs = [doc]
+        byte_count = sum(
+            len(json.dumps(doc, cls=event_model.NumpyEncoder)) for doc in docs
+        )
+        time.sleep(self.latency + byte_count / self.bandwidth)
+        self.insert_count += 1
+        self.document_count += len(docs)
+
+
+def compose_training_documents(event_count):
+    """
+    Build the documents of a training run with event_count cartpole steps.
+    """
+    run_bundle = event_model.compose_run()
+    documents = [("start", run_bundle.start_doc)]
+    data_keys = {
+        "cartpole_action": {"source": "", "dtype": "integer", "shape": []},
+        "cartpole_next_state": {"source": "", "dtype": "array", "shape": [4]},
+        "cartpole_reward": {"source": "", "dtype": "number", "shape": []},
+        "cartpole_terminal": {"source": "", "dtype": "integer", "shape": []},
+        "cartpole_state_after_reset": {"source": "", "dtype": "array", "shape": [4]},
+    }
+    descriptor_bundle = run_bundle.compose_descriptor(
+        name="primary", data_keys=data_keys
+    )
+    documents.append(("descriptor", descriptor_bundle.descriptor_doc))
+    for event_i in range(event_count):
+        data = {
+            "cartpole_action": event_i % 2,
+            "cartpole_next_state": [0.0, 0.0, 0.0, 0.0],
+            "cartpole_reward": 1.0,
+            "cartpole_terminal": 0,
+            "cartpole_state_after_reset": [0.0, 0.0, 0.0, 0.0],
+        }
+        documents.append(
+            (
+                "event",
+                descriptor_bundle.compose_event(
+                    data=data, timestamps={key: time.time() for key in data}
+                ),
+            )
+        )
+    documents.append(("stop", run_bundle.compose_stop()))
+    return documents
+
+
+def benchmark(documents, sink, stand_in):
+    start_time = time.perf_counter()
+    for name, doc in documents:
+        sink(name, doc)
+    elapsed_time = time.perf_counter() - start_time
+    return stand_in.document_count / elapsed_time, stand_in.insert_count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--event-count", default=10000, type=int)
+    arg_parser.add_argument("--latency", default=0.0005, type=float)
+    # bytes per second, about a gigabit network
+    arg_parser.add_argument("--bandwidth", default=1.0e8, type=float)
+    arg_parser.add_argument("--batch-size", default=100, type=int)
+    args = arg_parser.parse_args()
+
+    documents = compose_training_documents(event_count=args.event_count)
+
+    stand_in = MongoStandIn(latency=args.latency, bandwidth=args.bandwidth)
+    documents_per_second, insert_count = benchmark(documents, stand_in, stand_in)
+    print(
+        f"per-document inserts: {documents_per_second:12.0f} documents/s"
+        f" with {insert_count} inserts"
+    )
+
+    stand_in = MongoStandIn(latency=args.latency, bandwidth=args.bandwidth)
+    sink = BatchingDocumentSink(stand_in, batch_size=args.batch_size)
+    documents_per_second, insert_count = benchmark(documents, sink, stand_in)
+    print(
+        f"event page inserts:   {documents_per_second:12.0f} documents/s"
+        f" with {insert_count} inserts"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,58 @@
-import intake
+import functools
+import os
 
 from ._version import get_versions
 
 __version__ = get_versions()["version"]
 del get_versions
 
-# Look up a driver class by its name in the registry.
-catalog_class = intake.registry["bluesky-mongo-normalized-catalog"]
 
-bluesky_cartpole_catalog_instance = catalog_class(
-    metadatastore_db="mongodb://localhost:27017/md",
-    asset_registry_db="mongodb://localhost:27017/ar",
-)
+@functools.lru_cache(maxsize=None)
+def get_catalog():
+    """
+    Return the bluesky-cartpole databroker catalog, constructing it on first use.
+
+    The Mongo databases are taken from, in order of precedence:
+      - the BLUESKY_CARTPOLE_METADATASTORE_DB and BLUESKY_CARTPOLE_ASSET_REGISTRY_DB
+        environment variables
+      - the args of the bluesky_cartpole source in the YAML catalog file named by the
+        BLUESKY_CARTPOLE_CATALOG_CONFIG environment variable, for example
+        databroker/bluesky_cartpole.yml
+      - mongodb://localhost:27017/md and mongodb://localhost:27017/ar
+
+    Return
+    ------
+        a bluesky-mongo-normalized-catalog
+    """
+    # importing intake is slow so it is deferred until the catalog is needed
+    import intake
+
+    catalog_args = {
+        "metadatastore_db": "mongodb://localhost:27017/md",
+        "asset_registry_db": "mongodb://localhost:27017/ar",
+    }
+
+    catalog_config_path = os.environ.get("BLUESKY_CARTPOLE_CATALOG_CONFIG")
+    if catalog_config_path is not None:
+        import yaml
+
+        with open(catalog_config_path) as catalog_config_file:
+            catalog_config = yaml.safe_load(catalog_config_file)
+        catalog_args.update(catalog_config["sources"]["bluesky_cartpole"]["args"])
+
+    for catalog_arg in ("metadatastore_db", "asset_registry_db"):
+        environment_variable = f"BLUESKY_CARTPOLE_{catalog_arg.upper()}"
+        if environment_variable in os.environ:
+            catalog_args[catalog_arg] = os.environ[environment_variable]
+
+    # Look up a driver class by its name in the registry.
+    catalog_class = intake.registry["bluesky-mongo-normalized-catalog"]
+    return catalog_class(**catalog_args)
+
+
+def __getattr__(name):
+    # bluesky_cartpole_catalog_instance is the intake.catalogs entry point
+    # named in setup.py, it is constructed when it is first accessed
+    if name == "bluesky_cartpole_catalog_instance":
+        return get_catalog()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,525 @@
+from collections import OrderedDict
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedWeights:
+    """
+    Agent variable values in shared memory with a version number.
+
+    The learner calls write() with new weights and actors call read_if_newer()
+    to collect them. A lock shared by all processes keeps readers from seeing
+    partly written weights. Instances are passed to actor processes when they
+    start, which attaches the actor to the same shared memory.
+    """
+
+    def __init__(self, weights, mp_context):
+        """
+        Parameters
+        ----------
+        weights: dict
+            variable name to numpy array, the first version of the weights
+        mp_context: multiprocessing context
+        """
+        self.layout = []
+        byte_count = 0
+        for variable, value in weights.items():
+            value = np.asarray(value)
+            self.layout.append((variable, value.shape, value.dtype.str, byte_count))
+            # keep every array 8-byte aligned
+            byte_count += -(-value.nbytes // 8) * 8
+        self._shared_memory = shared_memory.SharedMemory(
+            create=True, size=max(byte_count, 8)
+        )
+        self._lock = mp_context.Lock()
+        # the lock above protects the version
+        self._version = mp_context.Value("q", 0, lock=False)
+        self.write(weights)
+
+    def __getstate__(self):
+        return dict(
+            layout=self.layout,
+            shared_memory_name=self._shared_memory.name,
+            lock=self._lock,
+            version=self._version,
+        )
+
+    def __setstate__(self, state):
+        self.layout = state["layout"]
+        self._shared_memory = shared_memory.SharedMemory(
+            name=state["shared_memory_name"]
+        )
+        self._lock = state["lock"]
+        self._version = state["version"]
+
+    def _arrays(self):
+        return {
+            variable: np.ndarray(
+                shape, dtype=dtype, buffer=self._shared_memory.buf, offset=offset
+            )
+            for variable, shape, dtype, offset in self.layout
+        }
+
+    def write(self, weights):
+        """
+        Publish new weights.
+
+        Return
+        ------
+            the new version number
+        """
+        with self._lock:
+            for variable, shared_array in self._arrays().items():
+                shared_array[...] = weights[variable]
+            self._version.value += 1
+            return self._version.value
+
+    def read_if_newer(self, known_version):
+        """
+        Copy the weights if they are newer than known_version.
+
+        Return
+        ------
+            (weights, version) or (None, known_version) if there are no newer weights
+        """
+        with self._lock:
+            if self._version.value == known_version:
+                return None, known_version
+            weights = {
+                variable: shared_array.copy()
+                for variable, shared_array in self._arrays().items()
+            }
+            return weights, self._version.value
+
+    def close(self):
+        self._shared_memory.close()
+
+    def unlink(self):
+        self._shared_memory.unlink()
+
+
+class TrajectoryBuffer:
+    """
+    Shared memory slots for shipping trajectory batches from one actor to the learner.
+
+    An actor takes a free slot from free_slots, writes the steps of complete
+    episodes into it and tells the learner which slot to read. The learner copies
+    the steps out and puts the slot back in free_slots, so with two slots an actor
+    fills one slot while the learner reads the other.
+    """
+
+    def __init__(self, slot_count, capacity, mp_context):
+        """
+        Parameters
+        ----------
+        slot_count: int
+            number of batches that can be in flight at once
+        capacity: int
+            the largest number of steps in one batch
+        mp_context: multiprocessing context
+        """
+        self.slot_count = slot_count
+        self.capacity = capacity
+        # per step: a state of 4 float64, an int64 action,
+        # a float64 reward and an int64 terminal
+        self._shared_memory = shared_memory.SharedMemory(
+            create=True, size=slot_count * capacity * 7 * 8
+        )
+        self.free_slots = mp_context.Queue()
+        for slot_i in range(slot_count):
+            self.free_slots.put(slot_i)
+
+    def __getstate__(self):
+        return dict(
+            slot_count=self.slot_count,
+            capacity=self.capacity,
+            shared_memory_name=self._shared_memory.name,
+            free_slots=self.free_slots,
+        )
+
+    def __setstate__(self, state):
+        self.slot_count = state["slot_count"]
+        self.capacity = state["capacity"]
+        self._shared_memory = shared_memory.SharedMemory(
+            name=state["shared_memory_name"]
+        )
+        self.free_slots = state["free_slots"]
+
+    def _slot_arrays(self, slot_i):
+        slot_arrays = {}
+        offset = slot_i * self.capacity * 7 * 8
+        for array_name, shape, dtype in (
+            ("states", (self.capacity, 4), np.float64),
+            ("actions", (self.capacity,), np.int64),
+            ("rewards", (self.capacity,), np.float64),
+            ("terminals", (self.capacity,), np.int64),
+        ):
+            slot_arrays[array_name] = np.ndarray(
+                shape, dtype=dtype, buffer=self._shared_memory.buf, offset=offset
+            )
+            offset += slot_arrays[array_name].nbytes
+        return slot_arrays
+
+    def write(self, slot_i, states, actions, rewards, terminals):
+        step_count = len(actions)
+        slot_arrays = self._slot_arrays(slot_i)
+        slot_arrays["states"][:step_count] = states
+        slot_arrays["actions"][:step_count] = actions
+        slot_arrays["rewards"][:step_count] = rewards
+        slot_arrays["terminals"][:step_count] = terminals
+
+    def read(self, slot_i, step_count):
+        return {
+            array_name: slot_array[:step_count].copy()
+            for array_name, slot_array in self._slot_arrays(slot_i).items()
+        }
+
+    def close(self):
+        self._shared_memory.close()
+
+    def unlink(self):
+        self._shared_memory.unlink()
+
+
+class ActorPool:
+    """
+    Actor processes playing cartpole with copies of a learner agent's policy.
+
+    Each actor process plays envs_per_actor NumPy cartpole games at once with its
+    own copy of the agent, acting with one batched agent.act() call per timestep.
+    Steps are collected into complete episodes and when an actor has at least
+    batch_step_count steps it ships them to the learner through its
+    TrajectoryBuffer. The learner collects batches with next_batch() and calls
+    publish_weights() after each update, and actors load the newest published
+    weights before playing each batch.
+    """
+
+    def __init__(
+        self,
+        agent,
+        num_actors,
+        envs_per_actor=8,
+        batch_step_count=1000,
+        max_episode_timesteps=500,
+        seed=None,
+    ):
+        """
+        Parameters
+        ----------
+        agent: a Tensorforce Agent
+            the learner agent, actors are given copies of its specification and weights
+        num_actors: int
+            number of actor processes
+        envs_per_actor: int
+            number of cartpole games played by each actor
+        batch_step_count: int
+            actors ship at least this many steps in each batch
+        max_episode_timesteps: int
+            the cartpole time limit
+        seed: int, optional
+            actor i seeds its games with seed + i
+        """
+        from bluesky_cartpole.evaluation import (
+            get_agent_weights,
+            get_evaluation_agent_spec,
+        )
+
+        self.num_actors = num_actors
+        self.envs_per_actor = envs_per_actor
+        self.batch_step_count = batch_step_count
+        self.max_episode_timesteps = max_episode_timesteps
+        self.seed = seed
+
+        # fork is unsafe once tensorflow has started threads
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._agent_spec = get_evaluation_agent_spec(agent)
+        self.shared_weights = SharedWeights(
+            get_agent_weights(agent), mp_context=self._mp_context
+        )
+        # a batch may finish all games with a full length episode
+        # after reaching batch_step_count - 1 steps
+        capacity = batch_step_count + envs_per_actor * max_episode_timesteps
+        self.trajectory_buffers = [
+            TrajectoryBuffer(
+                slot_count=2, capacity=capacity, mp_context=self._mp_context
+            )
+            for _ in range(num_actors)
+        ]
+        self._batch_queue = self._mp_context.Queue()
+        self._stop_event = self._mp_context.Event()
+        self._actor_processes = []
+
+    def start(self):
+        """
+        Start the actor processes.
+        """
+        for actor_i in range(self.num_actors):
+            actor_process = self._mp_context.Process(
+                target=_run_actor,
+                name=f"cartpole-actor-{actor_i}",
+                kwargs=dict(
+                    actor_i=actor_i,
+                    agent_spec=self._agent_spec,
+                    envs_per_actor=self.envs_per_actor,
+                    batch_step_count=self.batch_step_count,
+                    max_episode_timesteps=self.max_episode_timesteps,
+                    seed=None if self.seed is None else self.seed + actor_i,
+                    trajectory_buffer=self.trajectory_buffers[actor_i],
+                    shared_weights=self.shared_weights,
+                    batch_queue=self._batch_queue,
+                    stop_event=self._stop_event,
+                ),
+                daemon=True,
+            )
+            actor_process.start()
+            self._actor_processes.append(actor_process)
+
+    def next_batch(self, timeout=None):
+        """
+        Collect the next trajectory batch from any actor.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            seconds to wait for a batch, by default wait until one arrives
+
+        Return
+        ------
+            None if no batch arrived in time, otherwise a dictionary with keys
+              "states", "actions", "rewards", "terminals": arrays of the batch steps
+              "episode_rewards": list of the total reward of each batch episode
+              "actor_i", "actor_step_count", "actor_elapsed_time",
+              "actor_weights_version": the state of the actor that sent the batch
+        """
+        try:
+            batch = self._batch_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        trajectory_buffer = self.trajectory_buffers[batch["actor_i"]]
+        slot_i = batch.pop("slot_i")
+        batch.update(
+            trajectory_buffer.read(slot_i=slot_i, step_count=batch.pop("step_count"))
+        )
+        # hand the slot back to the actor
+        trajectory_buffer.free_slots.put(slot_i)
+        return batch
+
+    def actor_count(self):
+        """
+        Return the number of running actor processes.
+        """
+        return sum(actor_process.is_alive() for actor_process in self._actor_processes)
+
+    def publish_weights(self, weights):
+        """
+        Make new learner weights available to the actors.
+
+        Return
+        ------
+            the new weights version number
+        """
+        return self.shared_weights.write(weights)
+
+    def close(self):
+        """
+        Stop and join the actor processes and release the shared memory.
+        """
+        self._stop_event.set()
+        for actor_process in self._actor_processes:
+            actor_process.join(timeout=10.0)
+            if actor_process.is_alive():
+                actor_process.terminate()
+        self._actor_processes.clear()
+        for trajectory_buffer in self.trajectory_buffers:
+            trajectory_buffer.close()
+            trajectory_buffer.unlink()
+        self.shared_weights.close()
+        self.shared_weights.unlink()
+
+
+class ActorPlayer:
+    """
+    Cartpole games played with a copy of a learner agent's policy.
+
+    play_batch() plays the games until at least batch_step_count steps of complete
+    episodes have been collected. Episodes still running when a batch is full are
+    continued in the next batch. Used by ActorPool actor processes and by
+    bluesky_cartpole.distributed actors.
+    """
+
+    def __init__(self, agent, envs_per_actor, max_episode_timesteps=500, seed=None):
+        """
+        Parameters
+        ----------
+        agent: a Tensorforce Agent
+            the actor's copy of the learner agent
+        envs_per_actor: int
+            number of cartpole games played at once
+        max_episode_timesteps: int
+            the cartpole time limit
+        seed: int, optional
+            seed for the initial states of the games
+        """
+        from bluesky_cartpole.cartpole import create_vector_environment
+
+        self.agent = agent
+        self.envs_per_actor = envs_per_actor
+        self.vector_env = create_vector_environment(
+            num_envs=envs_per_actor,
+            backend="numpy",
+            max_episode_timesteps=max_episode_timesteps,
+            random_state=seed,
+        )
+
+        self.weights_version = 0
+        self.step_count = 0
+        self.start_time = time.monotonic()
+
+        # the steps of each game's current episode
+        self._episode_steps = [[] for _ in range(envs_per_actor)]
+        self._states = self.vector_env.reset()
+        self._internals = [agent.initial_internals() for _ in range(envs_per_actor)]
+
+    def load_weights(self, weights, weights_version):
+        """
+        Replace the agent's weights with a newer version from the learner.
+        """
+        for variable, value in weights.items():
+            self.agent.assign_variable(variable=variable, value=value)
+        self.weights_version = weights_version
+
+    def play_batch(self, batch_step_count):
+        """
+        Play until the finished episodes have at least batch_step_count steps.
+
+        Return
+        ------
+            dictionary with keys
+              "states", "actions", "rewards", "terminals": arrays of the batch steps
+              "episode_rewards": list of the total reward of each batch episode
+              "actor_step_count", "actor_elapsed_time", "actor_weights_version":
+              the state of this actor
+        """
+        finished_episodes = []
+        finished_step_count = 0
+        while finished_step_count < batch_step_count:
+            actions = _act(
+                agent=self.agent, states=self._states, internals=self._internals
+            )
+            next_states, terminals, rewards = self.vector_env.step(actions=actions)
+            self.step_count += self.envs_per_actor
+            for env_i in range(self.envs_per_actor):
+                self._episode_steps[env_i].append(
+                    (
+                        self._states[env_i],
+                        actions[env_i],
+                        rewards[env_i],
+                        terminals[env_i],
+                    )
+                )
+            finished = terminals > 0
+            for env_i in np.flatnonzero(finished):
+                finished_episodes.append(self._episode_steps[env_i])
+                finished_step_count += len(self._episode_steps[env_i])
+                self._episode_steps[env_i] = []
+                self._internals[env_i] = self.agent.initial_internals()
+            if np.any(finished):
+                self._states = self.vector_env.reset(mask=finished)
+            else:
+                self._states = next_states
+
+        batch_states, batch_actions, batch_rewards, batch_terminals = zip(
+            *(step for episode in finished_episodes for step in episode)
+        )
+        return dict(
+            states=np.asarray(batch_states),
+            actions=np.asarray(batch_actions),
+            rewards=np.asarray(batch_rewards),
+            terminals=np.asarray(batch_terminals),
+            episode_rewards=[
+                float(sum(step[2] for step in episode)) for episode in finished_episodes
+            ],
+            actor_step_count=self.step_count,
+            actor_elapsed_time=time.monotonic() - self.start_time,
+            actor_weights_version=self.weights_version,
+        )
+
+
+def _act(agent, states, internals):
+    # batched agent.act() takes a list of internals dictionaries
+    # but returns one dictionary of batched internals
+    actions, batched_internals = agent.act(
+        states=states,
+        internals=internals,
+        parallel=list(range(len(states))),
+        independent=True,
+    )
+    for env_i in range(len(states)):
+        internals[env_i] = OrderedDict(
+            (name, value[env_i]) for name, value in batched_internals.items()
+        )
+    return actions
+
+
+def _run_actor(
+    actor_i,
+    agent_spec,
+    envs_per_actor,
+    batch_step_count,
+    max_episode_timesteps,
+    seed,
+    trajectory_buffer,
+    shared_weights,
+    batch_queue,
+    stop_event,
+):
+    from tensorforce.agents import Agent
+
+    agent = Agent.create(agent=agent_spec)
+    actor_player = ActorPlayer(
+        agent=agent,
+        envs_per_actor=envs_per_actor,
+        max_episode_timesteps=max_episode_timesteps,
+        seed=seed,
+    )
+
+    try:
+        while not stop_event.is_set():
+            weights, weights_version = shared_weights.read_if_newer(
+                actor_player.weights_version
+            )
+            if weights is not None:
+                actor_player.load_weights(weights, weights_version)
+
+            batch = actor_player.play_batch(batch_step_count=batch_step_count)
+
+            # wait for the learner to free a slot
+            slot_i = None
+            while slot_i is None and not stop_event.is_set():
+                try:
+                    slot_i = trajectory_buffer.free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if slot_i is None:
+                break
+
+            # the steps go through shared memory and the rest through the queue
+            batch.update(
+                actor_i=actor_i, slot_i=slot_i, step_count=len(batch["actions"])
+            )
+            trajectory_buffer.write(
+                slot_i=slot_i,
+                states=batch.pop("states"),
+                actions=batch.pop("actions"),
+                rewards=batch.pop("rewards"),
+                terminals=batch.pop("terminals"),
+            )
+            batch_queue.put(batch)
+    finally:
+        agent.close()
+        trajectory_buffer.close()
+        shared_weights.close()
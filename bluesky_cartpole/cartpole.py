@@ -1,4 +1,7 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import math
+import time
 
 import numpy as np
 
@@ -8,6 +11,140 @@ from tensorforce.agents import Agent
 from ophyd import Component as Cpt, Device, Signal
 from ophyd.status import Status
 
+from bluesky_cartpole.numpy_cartpole import BatchedCartPole, NumpyCartPoleEnvironment
+
+
+def create_cartpole_environment(backend="tensorforce", **kwargs):
+    """
+    Build one cartpole environment with the tensorforce Environment interface.
+
+    Parameters
+    ----------
+    backend: str
+        "tensorforce" for tensorforce's wrapper around the gym CartPole-v1 environment,
+        "numpy" for the NumPy implementation of the same game
+    kwargs:
+        passed to Environment.create or NumpyCartPoleEnvironment
+
+    Return
+    ------
+        a cartpole environment
+    """
+    if backend == "tensorforce":
+        return Environment.create(environment="gym", level="CartPole-v1", **kwargs)
+    elif backend == "numpy":
+        return NumpyCartPoleEnvironment(**kwargs)
+    else:
+        raise ValueError(f"backend '{backend}' is not recognized")
+
+
+def create_vector_environment(num_envs, backend="tensorforce", **kwargs):
+    """
+    Build num_envs cartpole environments to be stepped together.
+
+    Parameters
+    ----------
+    num_envs: int
+        number of cartpole environments
+    backend: str
+        "tensorforce" for a list of tensorforce gym environments,
+        "numpy" for a single BatchedCartPole
+    kwargs:
+        passed to Environment.create or BatchedCartPole
+
+    Return
+    ------
+        an object with the reset(mask) and step(actions, mask) methods of BatchedCartPole
+    """
+    if backend == "tensorforce":
+        return TensorforceVectorEnvironment(num_envs=num_envs, **kwargs)
+    elif backend == "numpy":
+        return BatchedCartPole(num_envs=num_envs, **kwargs)
+    else:
+        raise ValueError(f"backend '{backend}' is not recognized")
+
+
+def _trigger_step(device, step):
+    """
+    Call step() now or, if device.asynchronous is True, on the device's worker thread.
+
+    Return
+    ------
+        a Status finished when step() has returned
+    """
+    step_status = Status()
+    if device.asynchronous:
+        if device._step_executor is None:
+            device._step_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"{device.name}-step"
+            )
+
+        def step_and_finish():
+            try:
+                step()
+            except Exception as error:
+                step_status.set_exception(error)
+            else:
+                step_status.set_finished()
+
+        device._step_executor.submit(step_and_finish)
+    else:
+        step()
+        step_status.set_finished()
+    return step_status
+
+
+def _stop_step_executor(device):
+    # wait for the last asynchronous step and release the worker thread
+    if device._step_executor is not None:
+        device._step_executor.shutdown(wait=True)
+        device._step_executor = None
+
+
+class TensorforceVectorEnvironment:
+    """
+    A list of tensorforce cartpole Environments with the BatchedCartPole interface.
+    """
+
+    def __init__(self, num_envs, **kwargs):
+        self.num_envs = num_envs
+        self.cartpole_envs = [
+            create_cartpole_environment(backend="tensorforce", **kwargs)
+            for _ in range(num_envs)
+        ]
+        self.cartpole_states = np.full((num_envs, 4), math.nan)
+
+    def states(self):
+        return self.cartpole_envs[0].states()
+
+    def actions(self):
+        return self.cartpole_envs[0].actions()
+
+    def max_episode_timesteps(self):
+        return self.cartpole_envs[0].max_episode_timesteps()
+
+    def reset(self, mask=None):
+        for env_i, cartpole_env in enumerate(self.cartpole_envs):
+            if mask is None or mask[env_i]:
+                self.cartpole_states[env_i] = cartpole_env.reset()
+        return self.cartpole_states.copy()
+
+    def step(self, actions, mask=None):
+        terminals = np.zeros(self.num_envs, dtype=int)
+        rewards = np.zeros(self.num_envs)
+        for env_i, cartpole_env in enumerate(self.cartpole_envs):
+            if mask is None or mask[env_i]:
+                (
+                    self.cartpole_states[env_i],
+                    terminals[env_i],
+                    rewards[env_i],
+                ) = cartpole_env.execute(actions=actions[env_i])
+        return self.cartpole_states.copy(), terminals, rewards
+
+    def close(self):
+        for cartpole_env in self.cartpole_envs:
+            cartpole_env.close()
+
 
 class CartPole(Device):
     """
@@ -15,6 +152,12 @@ class CartPole(Device):
 
     Instances of this class have a tensorforce cartpole Environment intended
     to be used for training an agent on the cartpole game within a Bluesky run.
+    With backend="numpy" the tensorforce gym Environment is replaced by the
+    faster NumpyCartPoleEnvironment.
+
+    With asynchronous=True trigger() executes the action on a worker thread and
+    returns a Status that finishes when the step is done, so the RunEngine can
+    trigger several devices in one trigger_and_read() and wait for all of them.
     """
 
     # agent actions will be sent in to the
@@ -29,14 +172,45 @@ class CartPole(Device):
     state_after_reset = Cpt(
         Signal, value=np.asarray([math.nan, math.nan, math.nan, math.nan])
     )
+    # the index of this environment among the environments served by one
+    # agent, a CartpoleRecommender assigns each event to this environment
+    env_index = Cpt(Signal, value=0)
+
+    def __init__(
+        self,
+        name="cartpole",
+        prefix="CARTPOLE",
+        backend="tensorforce",
+        asynchronous=False,
+        env_index=0,
+        **kwargs,
+    ):
+        super().__init__(name=name, prefix=prefix)
+        self.env_index.put(env_index)
 
-    average_evaluation_reward = Cpt(Signal, value=0.0)
+        self.backend = backend
+        self.asynchronous = asynchronous
+        self.cartpole_env_kwargs = kwargs
+        self.cartpole_env = create_cartpole_environment(backend=backend, **kwargs)
+        # steps the environment when asynchronous is True
+        self._step_executor = None
 
-    def __init__(self, name="cartpole", prefix="CARTPOLE", **kwargs):
-        super().__init__(name=name, prefix=prefix)
+    def create_evaluation_environment(self):
+        """
+        Build a new cartpole environment like self.cartpole_env for evaluating
+        agents without disturbing the training episodes.
+        """
+        return create_cartpole_environment(
+            backend=self.backend, **self.cartpole_env_kwargs
+        )
 
-        self.cartpole_env = Environment.create(
-            environment="gym", level="CartPole-v1", **kwargs
+    def create_evaluation_vector_environment(self, num_envs):
+        """
+        Build num_envs new cartpole environments like self.cartpole_env
+        to be stepped together for evaluating agents.
+        """
+        return create_vector_environment(
+            num_envs=num_envs, backend=self.backend, **self.cartpole_env_kwargs
         )
 
     def stage(self):
@@ -60,12 +234,15 @@ class CartPole(Device):
         Returns
         -------
         action_status: Status
-            a status object in the `finished` state
+            a status object in the `finished` state, or with asynchronous=True
+            a status object finished by the worker thread after the step
         """
+        # read the action now, the plan may set the next action while the step runs
+        _action = self.action.get()
+        return _trigger_step(self, lambda: self._step(_action))
 
-        _next_state, _terminal, _reward = self.cartpole_env.execute(
-            actions=self.action.get()
-        )
+    def _step(self, _action):
+        _next_state, _terminal, _reward = self.cartpole_env.execute(actions=_action)
 
         self.next_state.put(_next_state)
         self.terminal.put(_terminal)
@@ -83,18 +260,484 @@ class CartPole(Device):
                 np.asarray([math.nan, math.nan, math.nan, math.nan])
             )
 
-        action_status = Status()
-        action_status.set_finished()
-        return action_status
+    def unstage(self):
+        """
+        Stop the worker thread of an asynchronous device.
+        """
+        _stop_step_executor(self)
+        return [self]
+
+
+class FastSignal(Signal):
+    """
+    A soft Signal with less overhead for values written by its own device.
+
+    Without subscribers put() only stores the value and its timestamp, skipping
+    value checks, logging and metadata copies. set() puts the value immediately
+    and returns the same finished status every time instead of putting the
+    value on a new thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # returned by every set()
+        self._finished_status = Status()
+        self._finished_status.set_finished()
+
+    def put(self, value, *, timestamp=None, force=False, metadata=None, **kwargs):
+        if metadata or len(self._callbacks[self.SUB_VALUE]) > 0:
+            # subscribers and metadata need the general Signal.put
+            super().put(
+                value, timestamp=timestamp, force=force, metadata=metadata, **kwargs
+            )
+        else:
+            self._readback = value
+            self._metadata["timestamp"] = (
+                time.time() if timestamp is None else timestamp
+            )
+
+    def set(self, value, *, timeout=None, settle_time=None):
+        self.put(value)
+        if settle_time is not None:
+            time.sleep(settle_time)
+        return self._finished_status
+
+
+class FastCartPole(CartPole):
+    """
+    A CartPole with less overhead in each trigger() and read().
+
+    FastCartPole records the same data as CartPole but
+      - its signals are FastSignals
+      - steps that do not end an episode share one read-only NaN state_after_reset
+      - the signals written by one step share one timestamp
+      - a synchronous trigger() returns the same finished Status every time
+        rather than creating a Status, with its callback thread, for every step
+      - read() builds the reading directly from the signals and describe()
+        is computed once, both are refreshed by stage()
+    """
+
+    action = Cpt(FastSignal, value=0)
+    next_state = Cpt(
+        FastSignal, value=np.asarray([math.nan, math.nan, math.nan, math.nan])
+    )
+    reward = Cpt(FastSignal, value=0.0)
+    terminal = Cpt(FastSignal, value=0)
+    state_after_reset = Cpt(
+        FastSignal, value=np.asarray([math.nan, math.nan, math.nan, math.nan])
+    )
+
+    # state_after_reset for steps that do not end an episode
+    _no_state_after_reset = np.full(4, math.nan)
+    _no_state_after_reset.setflags(write=False)
+
+    def __init__(self, name="cartpole", prefix="CARTPOLE", **kwargs):
+        super().__init__(name=name, prefix=prefix, **kwargs)
+        self._finished_status = Status()
+        self._finished_status.set_finished()
+        self._read_signals = None
+        self._description = None
+
+    def stage(self):
+        """
+        This method is called before starting a new training episode.
+        """
+        # read_attrs may have changed since the last run
+        self._read_signals = None
+        self._description = None
+        return super().stage()
+
+    def trigger(self):
+        """
+        Perform one training step as described for CartPole.trigger().
+
+        Returns
+        -------
+        action_status: Status
+            a shared status object in the `finished` state, or with asynchronous=True
+            a status object finished by the worker thread after the step
+        """
+        if self.asynchronous:
+            return super().trigger()
+        self._step(self.action.get())
+        return self._finished_status
+
+    def _step(self, _action):
+        _next_state, _terminal, _reward = self.cartpole_env.execute(actions=_action)
+
+        timestamp = time.time()
+        self.next_state.put(_next_state, timestamp=timestamp)
+        self.terminal.put(_terminal, timestamp=timestamp)
+        self.reward.put(_reward, timestamp=timestamp)
+        if _terminal > 0:
+            self.state_after_reset.put(self.cartpole_env.reset(), timestamp=timestamp)
+        else:
+            self.state_after_reset.put(self._no_state_after_reset, timestamp=timestamp)
+
+    def read(self):
+        if self._read_signals is None:
+            self._read_signals = [
+                getattr(self, read_attr) for read_attr in self.read_attrs
+            ]
+        return OrderedDict(
+            (
+                signal.name,
+                {"value": signal.get(), "timestamp": signal.timestamp},
+            )
+            for signal in self._read_signals
+        )
+
+    def describe(self):
+        if self._description is None:
+            self._description = super().describe()
+        # callers may modify the description
+        return OrderedDict(
+            (key, dict(data_key)) for key, data_key in self._description.items()
+        )
+
+
+class VectorCartPole(Device):
+    """
+    An ophyd Device stepping several cartpole environments with each trigger.
+
+    One event from this device carries one transition from each of the num_envs
+    cartpole environments, which spreads the RunEngine, ophyd and document overhead
+    of a training step over num_envs transitions. With backend="numpy" all
+    environments are stepped together by one BatchedCartPole.
+
+    With asynchronous=True trigger() steps the environments on a worker thread
+    and returns a Status that finishes when the step is done, so a plan can
+    choose actions for other environments while these environments step.
+    """
+
+    # agent actions for all environments will be sent in
+    # to the cartpole environments through this signal
+    # as an array with shape (num_envs, )
+    action = Cpt(Signal, value=0)
+
+    # the results of the latest agent actions are made available by these signals
+    #   next_state and state_after_reset have shape (num_envs, 4)
+    #   reward and terminal have shape (num_envs, )
+    # the values given here are placeholders, the correct shapes are set in __init__
+    next_state = Cpt(Signal, value=0.0)
+    reward = Cpt(Signal, value=0.0)
+    terminal = Cpt(Signal, value=0)
+    state_after_reset = Cpt(Signal, value=0.0)
+
+    def __init__(
+        self,
+        num_envs,
+        name="vector_cartpole",
+        prefix="VECTOR_CARTPOLE",
+        backend="tensorforce",
+        asynchronous=False,
+        **kwargs,
+    ):
+        super().__init__(name=name, prefix=prefix)
+
+        self.num_envs = num_envs
+        self.backend = backend
+        self.asynchronous = asynchronous
+        self.vector_env_kwargs = kwargs
+        self.vector_env = create_vector_environment(
+            num_envs=num_envs, backend=backend, **kwargs
+        )
+        # the vector environment supplies the state and action
+        # specifications of a single environment to agents
+        self.cartpole_env = self.vector_env
+
+        self.action.put(np.zeros(num_envs, dtype=int))
+        self.next_state.put(np.full((num_envs, 4), math.nan))
+        self.reward.put(np.zeros(num_envs))
+        self.terminal.put(np.zeros(num_envs, dtype=int))
+        self.state_after_reset.put(np.full((num_envs, 4), math.nan))
+
+        # seconds taken by the latest step of the environments
+        # and the time.monotonic() time at which it finished
+        self.step_time = 0.0
+        self.step_end_time = 0.0
+        # steps the environments when asynchronous is True
+        self._step_executor = None
+
+    def create_evaluation_vector_environment(self, num_envs):
+        """
+        Build num_envs new cartpole environments like self.vector_env
+        to be stepped together for evaluating agents.
+        """
+        return create_vector_environment(
+            num_envs=num_envs, backend=self.backend, **self.vector_env_kwargs
+        )
+
+    def stage(self):
+        """
+        This method is called before starting new training episodes in all environments.
+        """
+        self.state_after_reset.put(self.vector_env.reset())
+        return [self]
+
+    def trigger(self):
+        """
+        Perform one training step in each environment:
+          - read the next agent actions from the self.action signal
+          - execute one action in each cartpole environment
+          - record the new states of the environments
+          - record the agent's rewards
+          - record which cartpole episodes have terminated
+          - reset each cartpole environment whose episode has terminated
+
+        Returns
+        -------
+        action_status: Status
+            a status object in the `finished` state, or with asynchronous=True
+            a status object finished by the worker thread after the step
+        """
+        _actions = np.asarray(self.action.get())
+        if _actions.shape != (self.num_envs,):
+            raise ValueError(
+                f"expected {self.num_envs} actions but the action signal has shape {_actions.shape}"
+            )
+
+        return _trigger_step(self, lambda: self._step(_actions))
+
+    def _step(self, _actions):
+        step_start_time = time.monotonic()
+        _next_states, _terminals, _rewards = self.vector_env.step(actions=_actions)
+
+        # environments that have not been reset have no state_after_reset information
+        _states_after_reset = np.full((self.num_envs, 4), math.nan)
+        # as for CartPole, terminal==1 means the pole fell over and
+        # terminal==2 means the maximum number of timesteps have been taken
+        _terminated = _terminals > 0
+        if np.any(_terminated):
+            _states_after_reset[_terminated] = self.vector_env.reset(mask=_terminated)[
+                _terminated
+            ]
+
+        self.next_state.put(_next_states)
+        self.terminal.put(_terminals)
+        self.reward.put(_rewards)
+        self.state_after_reset.put(_states_after_reset)
+        self.step_end_time = time.monotonic()
+        self.step_time = self.step_end_time - step_start_time
 
     def unstage(self):
         """
-        There is no work to be done after training is over.
+        Stop the worker thread of an asynchronous device.
         """
+        _stop_step_executor(self)
         return [self]
 
 
-def get_cartpole_agent(agent_name, cartpole_device):
+class CartPoleEvaluation(Device):
+    """
+    An ophyd Device holding the results of one agent evaluation.
+
+    The training plan sets these signals when an evaluation finishes
+    and reads them into the "evaluation" event stream.
+    """
+
+    # the training episode at which the evaluated agent weights were copied
+    episode = Cpt(Signal, value=0)
+    # statistics of the evaluation episode rewards
+    reward_mean = Cpt(Signal, value=0.0)
+    reward_std = Cpt(Signal, value=0.0)
+    episode_count = Cpt(Signal, value=0)
+    # number of snapshots skipped so far because the evaluator was busy
+    skipped_count = Cpt(Signal, value=0)
+
+    def __init__(self, name="cartpole_evaluation", prefix="CARTPOLE_EVALUATION"):
+        super().__init__(name=name, prefix=prefix)
+
+
+class LearnerUpdate(Device):
+    """
+    An ophyd Device holding the results of one learner update in actor-learner training.
+
+    The actor-learner plan sets these signals after each update
+    and reads them into the "learner" event stream.
+    """
+
+    # the update index, counting from 1
+    update = Cpt(Signal, value=0)
+    # training episodes and steps used by the learner so far
+    episode_count = Cpt(Signal, value=0)
+    step_count = Cpt(Signal, value=0)
+    # the trajectory batch used by this update
+    batch_step_count = Cpt(Signal, value=0)
+    batch_episode_count = Cpt(Signal, value=0)
+    batch_reward_mean = Cpt(Signal, value=0.0)
+    # the version of the weights published after this update
+    weights_version = Cpt(Signal, value=0)
+    # the number of actors playing for the learner
+    actor_count = Cpt(Signal, value=0)
+    # seconds spent in agent.experience() and agent.update()
+    update_time = Cpt(Signal, value=0.0)
+
+    def __init__(self, name="learner", prefix="LEARNER"):
+        super().__init__(name=name, prefix=prefix)
+
+
+class PipelineTiming(Device):
+    """
+    An ophyd Device holding the timing of vectorized training with environment groups.
+
+    The vectorized training plan sets these signals at the end of
+    training and reads them into the "timing" event stream.
+    """
+
+    # the number of environment groups taking turns
+    env_groups = Cpt(Signal, value=0)
+    # the number of group steps
+    step_count = Cpt(Signal, value=0)
+    # seconds spent choosing actions, stepping environments and
+    # stepping environments while the plan did other work such as inference
+    inference_time = Cpt(Signal, value=0.0)
+    env_step_time = Cpt(Signal, value=0.0)
+    hidden_step_time = Cpt(Signal, value=0.0)
+    # seconds the plan waited in trigger and wait messages,
+    # including the RunEngine's own overhead
+    blocked_time = Cpt(Signal, value=0.0)
+    # the fraction of env_step_time hidden behind the plan's other work
+    overlap = Cpt(Signal, value=0.0)
+    # seconds from the first to the last group step
+    elapsed_time = Cpt(Signal, value=0.0)
+
+    def __init__(self, name="timing", prefix="TIMING"):
+        super().__init__(name=name, prefix=prefix)
+
+
+class ActorThroughput(Device):
+    """
+    An ophyd Device holding the state of one actor when it shipped a trajectory batch.
+
+    The actor-learner plan sets these signals for each batch
+    and reads them into the "actor" event stream.
+    """
+
+    # the actor index, counting from 0
+    index = Cpt(Signal, value=0)
+    # steps played by the actor since it started
+    step_count = Cpt(Signal, value=0)
+    steps_per_second = Cpt(Signal, value=0.0)
+    # the weights version the actor played with and
+    # how many versions it was behind the learner
+    weights_version = Cpt(Signal, value=0)
+    weights_lag = Cpt(Signal, value=0)
+
+    def __init__(self, name="actor", prefix="ACTOR"):
+        super().__init__(name=name, prefix=prefix)
+
+
+class TrainingProgress(Device):
+    """
+    An ophyd Device holding how far training got.
+
+    The training plans set these signals at the end of
+    training and read them into the "training" event stream.
+    """
+
+    # training episodes finished, fewer than requested if training stopped early
+    episode_count = Cpt(Signal, value=0)
+
+    def __init__(self, name="training", prefix="TRAINING"):
+        super().__init__(name=name, prefix=prefix)
+
+
+class CartPoleEpisode(Device):
+    """
+    An ophyd Device accumulating the steps of one cartpole episode.
+
+    The training plan calls start() with the initial state of each episode and
+    append() after each step. Triggering this device publishes the accumulated
+    steps as arrays so one event carries a whole episode. The step arrays have a
+    different length in each event, so describe() gives their first dimension
+    as None, the event model's marker for a variable length.
+    """
+
+    # the episode index, counting from 1
+    index = Cpt(Signal, value=0)
+    # the state after the environment was reset, shape (4, )
+    initial_state = Cpt(Signal, value=0.0)
+    # the steps of the episode, shapes (length, ) and (length, 4)
+    actions = Cpt(Signal, value=0)
+    next_states = Cpt(Signal, value=0.0)
+    rewards = Cpt(Signal, value=0.0)
+    terminals = Cpt(Signal, value=0)
+    # the number of steps and the sum of rewards
+    length = Cpt(Signal, value=0)
+    total_reward = Cpt(Signal, value=0.0)
+
+    def __init__(self, name="cartpole_episode", prefix="CARTPOLE_EPISODE"):
+        super().__init__(name=name, prefix=prefix)
+        self._episode_i = 0
+        self._initial_state = np.full(4, math.nan)
+        self._actions = []
+        self._next_states = []
+        self._rewards = []
+        self._terminals = []
+
+    def start(self, initial_state):
+        """
+        Begin accumulating a new episode.
+        """
+        self._episode_i += 1
+        self._initial_state = np.asarray(initial_state)
+        self._actions.clear()
+        self._next_states.clear()
+        self._rewards.clear()
+        self._terminals.clear()
+
+    def append(self, action, next_state, reward, terminal):
+        """
+        Add one step to the current episode.
+        """
+        self._actions.append(action)
+        self._next_states.append(next_state)
+        self._rewards.append(reward)
+        self._terminals.append(terminal)
+
+    def trigger(self):
+        """
+        Publish the accumulated steps of the current episode.
+
+        Returns
+        -------
+        episode_status: Status
+            a status object in the `finished` state
+        """
+        self.index.put(self._episode_i)
+        self.initial_state.put(self._initial_state)
+        self.actions.put(np.asarray(self._actions, dtype=int))
+        self.next_states.put(np.asarray(self._next_states).reshape(-1, 4))
+        self.rewards.put(np.asarray(self._rewards))
+        self.terminals.put(np.asarray(self._terminals, dtype=int))
+        self.length.put(len(self._rewards))
+        self.total_reward.put(float(np.sum(self._rewards)))
+
+        episode_status = Status()
+        episode_status.set_finished()
+        return episode_status
+
+    def describe(self):
+        description = super().describe()
+        # the descriptor is built from the first episode but must fit every episode
+        for signal, shape in (
+            (self.actions, [None]),
+            (self.next_states, [None, 4]),
+            (self.rewards, [None]),
+            (self.terminals, [None]),
+        ):
+            description[signal.name].update(dtype="array", shape=shape)
+        return description
+
+
+def get_cartpole_agent(
+    agent_name,
+    cartpole_device,
+    seed=None,
+    agent_parameters=None,
+    parallel_interactions=1,
+):
     """
     Build a new agent for the specified cartpole device.
 
@@ -106,11 +749,28 @@ def get_cartpole_agent(agent_name, cartpole_device):
     agent_name: str
         an identifier this function recognizes: "a2c" or "ppo"
     cartpole_device:
+    seed: int, optional
+        tensorforce seeds Python, NumPy and TensorFlow with this value
+    agent_parameters: dict, optional
+        values replacing the default agent parameters, for example
+        dict(batch_size=20, horizon=5)
+    parallel_interactions: int, optional
+        number of environments the agent will act on with batched
+        act() and observe() calls, for example the num_envs of a VectorCartPole,
+        more than 1 requires agent_name "ppo"
 
     Return
     ------
         a tensorforce Agent
     """
+    if agent_name == "a2c" and parallel_interactions > 1:
+        # tensorforce's A2C updates every few timesteps and an agent with
+        # a timesteps update unit can not act on several environments
+        raise ValueError(
+            f"agent_name 'a2c' can not be used with parallel_interactions {parallel_interactions}, use 'ppo'"
+        )
+
+    agent_parameter_overrides = agent_parameters
     if agent_name == "a2c":
         agent_parameters = dict(
             agent=agent_name,
@@ -125,6 +785,10 @@ def get_cartpole_agent(agent_name, cartpole_device):
                 frequency=10,  # store values every 10 timesteps
             ),
         )
+        if agent_parameter_overrides is not None:
+            agent_parameters.update(agent_parameter_overrides)
+        if seed is not None:
+            agent_parameters["seed"] = seed
         agent = Agent.create(
             # agent="a2c",
             environment=cartpole_device.cartpole_env,
@@ -137,6 +801,12 @@ def get_cartpole_agent(agent_name, cartpole_device):
             batch_size=10,
             variable_noise=0.1,
         )
+        if agent_parameter_overrides is not None:
+            agent_parameters.update(agent_parameter_overrides)
+        if seed is not None:
+            agent_parameters["seed"] = seed
+        if parallel_interactions > 1:
+            agent_parameters["parallel_interactions"] = parallel_interactions
         agent = Agent.create(
             agent="ppo",
             environment=cartpole_device.cartpole_env,
@@ -151,39 +821,189 @@ def get_cartpole_agent(agent_name, cartpole_device):
 class CartpoleRecommender:
     """
     A bluesky-adaptive recommender.
+
+    The recommender may serve several cartpole environments with an agent created
+    with parallel_interactions=num_envs. Tensorforce only allows this for agents
+    whose update unit is not timesteps, so use a PPO agent rather than A2C when
+    num_envs > 1. Each event told to the recommender is
+    either one step of a single CartPole or one step of every environment of a
+    VectorCartPole. The dependent values of an event are its next state, reward,
+    terminal and state after reset, followed for a single CartPole by the
+    device's env_index, which is required if num_envs > 1. All events given to
+    one tell_many() call are observed in order and the next actions of their
+    environments are chosen with one batched act() call.
+
+    If one tell_many() call has several events from the same environment the
+    agent acts between them, because tensorforce requires act() and observe()
+    to alternate, and the events after the first go to another batched call.
     """
 
-    def __init__(self, cartpole_agent):
+    def __init__(self, cartpole_agent, num_envs=1):
         """
         Parameters
         ----------
         cartpole_agent: Tensorforce Agent
+            created with parallel_interactions=num_envs if num_envs > 1,
+            for example get_cartpole_agent(agent_name="ppo", ...)
+        num_envs: int
+            number of cartpole environments served by this recommender
         """
         self.cartpole_agent = cartpole_agent
-        self.action = None
+        self.num_envs = num_envs
+        # the next action of each environment
+        self.actions = [None] * num_envs
         self.episode_count = 0
-        self.total_reward = 0.0
+        self.total_rewards = np.zeros(num_envs)
+
+    def _check_single_env(self, attribute_name):
+        if self.num_envs != 1:
+            raise AttributeError(
+                f"{attribute_name} is only available for one environment, "
+                f"use {attribute_name}s for {self.num_envs} environments"
+            )
+
+    @property
+    def action(self):
+        """
+        The next action of the only environment.
+        """
+        self._check_single_env("action")
+        return self.actions[0]
+
+    @action.setter
+    def action(self, action):
+        self._check_single_env("action")
+        self.actions[0] = action
+
+    @property
+    def total_reward(self):
+        """
+        The reward of the current episode of the only environment.
+        """
+        self._check_single_env("total_reward")
+        return self.total_rewards[0]
+
+    @total_reward.setter
+    def total_reward(self, total_reward):
+        self._check_single_env("total_reward")
+        self.total_rewards[0] = total_reward
+
+    def start(self, initial_states):
+        """
+        Choose the first actions from the states of freshly reset environments.
+
+        Parameters
+        ----------
+        initial_states: array with shape (num_envs, 4), or (4, ) for one environment
+        """
+        initial_states = np.reshape(initial_states, (self.num_envs, 4))
+        self._act(env_indices=list(range(self.num_envs)), states=initial_states)
 
     def tell(self, independent_values, dependent_values):
-        state = dependent_values[0]
-        reward = dependent_values[1]
-        terminal = dependent_values[2]
-        state_after_reset = dependent_values[3]
-        self.cartpole_agent.observe(reward=reward, terminal=terminal)
-        if terminal > 0:
-            self.total_reward = 0.0
-            self.episode_count += 1
-            state = state_after_reset
-
-        self.action = self.cartpole_agent.act(states=state)
+        self.tell_many(
+            independent_values_list=[independent_values],
+            dependent_values_list=[dependent_values],
+        )
 
     def tell_many(self, independent_values_list, dependent_values_list):
-        if len(independent_values_list) > 1:
-            raise ValueError
-        self.tell(
-            independent_values=independent_values_list[0],
-            dependent_values=dependent_values_list[0],
+        # split the events into transitions of single environments
+        transitions = []
+        for dependent_values in dependent_values_list:
+            state, reward, terminal, state_after_reset = dependent_values[:4]
+            if np.ndim(state) == 2:
+                # an event from a VectorCartPole
+                if len(state) != self.num_envs:
+                    raise ValueError(
+                        f"expected {self.num_envs} environments but the event has {len(state)}"
+                    )
+                transitions.extend(
+                    zip(
+                        range(self.num_envs),
+                        state,
+                        reward,
+                        terminal,
+                        state_after_reset,
+                    )
+                )
+            else:
+                transitions.append(
+                    (
+                        self._get_env_index(dependent_values),
+                        state,
+                        reward,
+                        terminal,
+                        state_after_reset,
+                    )
+                )
+
+        # each round has at most one transition for each environment
+        transition_round = {}
+        for transition in transitions:
+            if transition[0] in transition_round:
+                self._observe_and_act(list(transition_round.values()))
+                transition_round = {}
+            transition_round[transition[0]] = transition
+        if len(transition_round) > 0:
+            self._observe_and_act(list(transition_round.values()))
+
+    def _get_env_index(self, dependent_values):
+        # the environment of a single CartPole event is named by the event
+        # so a missing or reordered event can not shift later transitions
+        if len(dependent_values) > 4:
+            env_i = int(dependent_values[4])
+        elif self.num_envs == 1:
+            env_i = 0
+        else:
+            raise ValueError(
+                f"events of single environments need an env_index with {self.num_envs} environments"
+            )
+        if not 0 <= env_i < self.num_envs:
+            raise ValueError(
+                f"env_index {env_i} is not one of the {self.num_envs} environments"
+            )
+        return env_i
+
+    def _observe_and_act(self, transitions):
+        env_indices, states, rewards, terminals, states_after_reset = zip(*transitions)
+        env_indices = list(env_indices)
+        rewards = np.asarray(rewards, dtype=float)
+        terminals = np.asarray(terminals, dtype=int)
+        if self.num_envs == 1:
+            self.cartpole_agent.observe(reward=rewards[0], terminal=terminals[0])
+        else:
+            self.cartpole_agent.observe(
+                reward=rewards, terminal=terminals, parallel=env_indices
+            )
+
+        self.total_rewards[env_indices] += rewards
+        terminated = terminals > 0
+        self.episode_count += int(np.count_nonzero(terminated))
+        self.total_rewards[np.asarray(env_indices)[terminated]] = 0.0
+
+        # environments whose episodes ended start from their reset states
+        states = np.where(
+            terminated[:, np.newaxis],
+            np.reshape(states_after_reset, (-1, 4)),
+            np.reshape(states, (-1, 4)),
         )
+        self._act(env_indices=env_indices, states=states)
+
+    def _act(self, env_indices, states):
+        if self.num_envs == 1:
+            self.actions[0] = self.cartpole_agent.act(states=states[0])
+        else:
+            actions = self.cartpole_agent.act(states=states, parallel=env_indices)
+            for env_i, action in zip(env_indices, actions):
+                self.actions[env_i] = action
 
     def ask(self, n, tell_pending=True):
-        return [self.action]
+        """
+        Return the next actions of the first n environments.
+
+        For a VectorCartPole ask(num_envs) gives the whole action array.
+        """
+        if n > self.num_envs:
+            raise ValueError(
+                f"can not recommend {n} actions for {self.num_envs} environments"
+            )
+        return self.actions[:n]
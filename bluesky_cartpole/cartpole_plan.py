@@ -1,20 +1,278 @@
 from collections import deque
+import time
+
+import numpy as np
 
 import bluesky.preprocessors as bpp
 import bluesky.plan_stubs as bps
+from bluesky.utils import RunEngineControlException
+
+from bluesky_cartpole.actor_learner import ActorPool
+from bluesky_cartpole.cartpole import (
+    ActorThroughput,
+    CartPoleEpisode,
+    CartPoleEvaluation,
+    FastCartPole,
+    LearnerUpdate,
+    PipelineTiming,
+    TrainingProgress,
+    VectorCartPole,
+    get_cartpole_agent,
+)
+from bluesky_cartpole.distributed import LearnerServer
+from bluesky_cartpole.evaluation import (
+    BackgroundEvaluator,
+    ConvergenceStopper,
+    get_agent_weights,
+)
+
+
+def check_training_budgets(max_step_count, max_duration):
+    """
+    Raise ValueError if a training step or time budget can not be met.
+    """
+    if max_step_count is not None and max_step_count < 1:
+        raise ValueError(f"max_step_count must be at least 1, not {max_step_count}")
+    if max_duration is not None and max_duration <= 0:
+        raise ValueError(f"max_duration must be positive, not {max_duration}")
+
+
+def get_budget_stop_reason(step_count, elapsed_time, max_step_count, max_duration):
+    """
+    Return the reason training should stop, or None if its budgets are not used up.
+
+    Parameters
+    ----------
+    step_count: int
+        number of training steps taken so far
+    elapsed_time: float
+        seconds since training started
+    max_step_count: int or None
+        training step budget
+    max_duration: float or None
+        wall-clock budget in seconds
+
+    Return
+    ------
+        None or a string for the stop document
+    """
+    if max_step_count is not None and step_count >= max_step_count:
+        return f"step budget of {max_step_count} steps used up"
+    elif max_duration is not None and elapsed_time >= max_duration:
+        return f"time budget of {max_duration} seconds used up"
+    else:
+        return None
 
-from bluesky_cartpole.cartpole import CartPole, get_cartpole_agent
+
+class _TrainingRun:
+    """
+    The background evaluations and stop reason of a run of train_agent() or train_agent_vectorized().
+
+    Snapshots of the agent are evaluated on a worker thread and each evaluation
+    is recorded in the "evaluation" event stream. The first reason to stop
+    training early, from evaluation_callback or a training budget, is recorded
+    in the run's stop document.
+    """
+
+    def __init__(
+        self,
+        agent,
+        env_device,
+        evaluation_device,
+        evaluation_episode_count,
+        evaluation_tolerance,
+        evaluation_target_reward,
+        evaluation_callback,
+    ):
+        if evaluation_tolerance is None and evaluation_target_reward is None:
+            # all evaluation episodes are played simultaneously
+            evaluation_num_envs = evaluation_episode_count
+        else:
+            # adaptive evaluation episodes are played in rounds
+            evaluation_num_envs = min(10, evaluation_episode_count)
+        self.evaluator = BackgroundEvaluator(
+            agent=agent,
+            vector_env=env_device.create_evaluation_vector_environment(
+                num_envs=evaluation_num_envs
+            ),
+            episode_count=evaluation_episode_count,
+            tolerance=evaluation_tolerance,
+            target_reward=evaluation_target_reward,
+        )
+        self.evaluation_device = evaluation_device
+        self.evaluation_callback = evaluation_callback
+        self.progress_device = TrainingProgress()
+        # set when training ends before episode_count episodes
+        self.stop_reason = None
+
+    def stop(self, reason):
+        """
+        Keep the first reason to stop training, None is ignored.
+        """
+        if self.stop_reason is None:
+            self.stop_reason = reason
+
+    def record_evaluation(self, evaluation):
+        """
+        Record an (episode_i, episode_rewards) evaluation and give it to evaluation_callback.
+        """
+        evaluation_episode_i, episode_rewards = evaluation
+        yield from bps.mv(
+            self.evaluation_device.episode,
+            evaluation_episode_i,
+            self.evaluation_device.reward_mean,
+            np.mean(episode_rewards),
+            self.evaluation_device.reward_std,
+            np.std(episode_rewards),
+            self.evaluation_device.episode_count,
+            len(episode_rewards),
+            self.evaluation_device.skipped_count,
+            self.evaluator.skipped_count,
+        )
+        yield from bps.trigger_and_read([self.evaluation_device], name="evaluation")
+
+        # the callback is not called again once training is stopping
+        if self.evaluation_callback is not None and self.stop_reason is None:
+            self.stop(self.evaluation_callback(evaluation_episode_i, episode_rewards))
+
+    def record_completed_evaluation(self):
+        """
+        Record at most one finished evaluation.
+        """
+        completed_evaluation = self.evaluator.next_completed()
+        if completed_evaluation is not None:
+            yield from self.record_evaluation(completed_evaluation)
+
+    def record_pending_evaluations(self):
+        """
+        Record the evaluations that were still running when training ended.
+        """
+        while self.evaluator.pending_count() > 0:
+            completed_evaluation = self.evaluator.next_completed()
+            if completed_evaluation is None:
+                # let the RunEngine do other work while the evaluation finishes
+                yield from bps.sleep(0.1)
+            else:
+                yield from self.record_evaluation(completed_evaluation)
+
+    def record_progress(self, episode_count):
+        """
+        Record the number of finished training episodes in the "training" event stream.
+        """
+        yield from bps.mv(self.progress_device.episode_count, episode_count)
+        yield from bps.trigger_and_read([self.progress_device], name="training")
+
+    def run(self, training_plan, md):
+        """
+        Like bpp.run_wrapper but the stop document records why training stopped early.
+        """
+
+        def close_training_run():
+            yield from bps.close_run(reason=self.stop_reason)
+
+        def fail_training_run(exception):
+            if isinstance(exception, RunEngineControlException):
+                yield from bps.close_run(exit_status=exception.exit_status)
+            else:
+                yield from bps.close_run(exit_status="fail", reason=str(exception))
+
+        yield from bps.open_run(md=md)
+        return (
+            yield from bpp.contingency_wrapper(
+                training_plan,
+                except_plan=fail_training_run,
+                else_plan=close_training_run,
+            )
+        )
+
+    def close(self):
+        """
+        Release the evaluation worker thread and environments.
+        """
+        self.evaluator.close()
+        self.evaluator.vector_env.close()
 
 
 # logging.getLogger("bluesky").setLevel("DEBUG")
 # In [8]: logging.basicConfig()
-def train_agent(env_device, agent, episode_count, *, md=None, next_point_callback=None):
+def train_agent(
+    env_device,
+    agent,
+    episode_count,
+    *,
+    md=None,
+    next_point_callback=None,
+    granularity="step",
+    record_every=1,
+    evaluation_frequency=10,
+    evaluation_episode_count=100,
+    evaluation_tolerance=None,
+    evaluation_target_reward=None,
+    evaluation_callback=None,
+    direct_feedback=False,
+    recent_uid_count=None,
+    max_step_count=None,
+    max_duration=None,
+):
     """
     A bluesky "plan" that trains an agent to play cartpole.
 
+    With granularity="step" each training step is recorded as one event in the
+    "primary" event stream. With granularity="episode" the steps of each episode are
+    accumulated by a CartPoleEpisode device and each episode is recorded as one event
+    in the "episode" event stream with arrays of actions, next states, rewards and
+    terminals plus the episode length and total reward. In episode mode the agent is
+    given the result of each step directly by the plan rather than by a callback.
+
+    By default the agent is given the result of each recorded step by a callback
+    subscribed to the RunEngine's documents. With direct_feedback=True the plan
+    gives the agent the reading of each recorded step instead, which avoids
+    dispatching every document to the callback. The same documents are emitted.
+
+    With granularity="step" and record_every=N the agent is trained on every step but
+    only every Nth step and every terminal step are recorded as events, so episode
+    boundaries are always recorded. The agent is given the results of unrecorded
+    steps directly by the plan.
+
+    Every evaluation_frequency episodes a copy of the agent is evaluated on a worker
+    thread while training continues. Each evaluation is recorded in the "evaluation"
+    event stream with the training episode index and the mean, standard deviation
+    and number of the evaluation episode rewards. If evaluations fall behind
+    training only the newest waiting copy is evaluated and the number of
+    skipped copies is recorded.
+
+    By default each evaluation plays evaluation_episode_count episodes. If
+    evaluation_tolerance or evaluation_target_reward is given, evaluation episodes
+    are played in rounds of 10 and evaluation stops early as described for
+    bluesky_cartpole.evaluation.evaluate_agent_adaptive.
+
+    If evaluation_callback is given it is called with each recorded evaluation
+    and may end training early by returning a reason, which is recorded in the
+    run's stop document. For example a bluesky_cartpole.evaluation.ConvergenceStopper
+    ends training once the agent has solved cartpole. The number of training
+    episodes actually finished is recorded in the "training" event stream at the
+    end of training.
+
+    The plan returns the readings of the recorded steps. For long runs
+    recent_uid_count limits them to the most recent steps so the plan's memory
+    does not grow with the number of steps.
+
+    The plan places a checkpoint before every training step, as do
+    train_agent_vectorized() and train_agent_actor_learner(). The RunEngine keeps
+    every message since the last checkpoint to replay after a pause, so without
+    them its memory would grow with the number of steps. As a consequence a
+    paused run resumes from the start of the current step rather than from the
+    start of the run, and the environment and agent are not rewound.
+
+    An episode ends when the pole falls over (terminal 1) or when the time
+    limit of the cartpole environment is reached (terminal 2). Training stops
+    after episode_count episodes, or earlier when max_step_count training steps
+    have been taken or max_duration seconds have passed. The stop document
+    records which budget ended training.
+
     Parameters
     ----------
-    env_device: bluesky_cartpole.cartpole.CartPole
+    env_device: bluesky_cartpole.cartpole.CartPole or FastCartPole
         the cartpole training environment
     agent: a Tensorforce Agent
         the agent that will be trained to play cartpole
@@ -24,6 +282,33 @@ def train_agent(env_device, agent, episode_count, *, md=None, next_point_callbac
         bluesky metadata dictionary
     next_point_callback: function(name, doc), optional
         a function taking a bluesky name, document pair
+    granularity: str, optional
+        "step" for one event per training step, "episode" for one event per episode
+    record_every: int, optional
+        with granularity="step" record only every Nth step and all terminal steps
+    evaluation_frequency: int, optional
+        number of training episodes between evaluations
+    evaluation_episode_count: int, optional
+        number of episodes for each evaluation, the largest
+        number of episodes for adaptive evaluation
+    evaluation_tolerance: float, optional
+        stop evaluating when the 95% confidence interval half width of the
+        average evaluation reward is no more than this value
+    evaluation_target_reward: float, optional
+        stop evaluating when this average evaluation reward is clearly
+        reached or clearly unreachable, for example 500.0
+    evaluation_callback: function(episode_i, episode_rewards), optional
+        called with the training episode index and the evaluation episode rewards
+        of each recorded evaluation, training stops if it returns a string
+    direct_feedback: bool, optional
+        give the agent the results of recorded steps from the plan's readings
+        rather than from a document callback
+    recent_uid_count: int, optional
+        keep only this many of the most recent recorded steps, by default all
+    max_step_count: int, optional
+        stop training after this many training steps
+    max_duration: float, optional
+        stop training after this many seconds
 
     Return
     ------
@@ -31,122 +316,785 @@ def train_agent(env_device, agent, episode_count, *, md=None, next_point_callbac
     """
     if md is None:
         md = {}
+    if direct_feedback and next_point_callback is not None:
+        raise ValueError("next_point_callback can not be used with direct_feedback")
+
+    if granularity not in ("step", "episode"):
+        raise ValueError(f"granularity '{granularity}' is not recognized")
+    if record_every < 1:
+        raise ValueError(f"record_every must be at least 1, not {record_every}")
+    if record_every > 1 and granularity != "step":
+        raise ValueError("record_every can only be used with granularity 'step'")
+    check_training_budgets(max_step_count=max_step_count, max_duration=max_duration)
 
     queue = deque()
+    primary_descriptor_uids = set()
     episode_i = 1
     step_i = 0
     total_reward = 0.0
+    # count steps over all episodes for record_every
+    training_step_i = 0
 
-    # this function will be subscribed to the RunEngine
-    # it will be called with every document:
-    #   run_start, descriptor, event, event, ..., event, stop
-    # only event documents have information relevant to the agent
-    def get_next_point_callback(name, doc):
+    # give the agent the results of its last action and queue its next action
+    def observe_and_act(next_state, reward, terminal, state_after_reset):
         nonlocal episode_i
         nonlocal step_i
         nonlocal total_reward
 
-        if name == "event" and episode_i <= episode_count:
-            states = doc["data"]["cartpole_next_state"]
-            terminal = doc["data"]["cartpole_terminal"]
-            reward = doc["data"]["cartpole_reward"]
-            state_after_reset = doc["data"]["cartpole_state_after_reset"]
-
-            total_reward += reward
-            agent.observe(reward=reward, terminal=terminal)
-            if terminal == 1:
-                total_reward = 0.0
-                episode_i += 1
-                step_i = 0
-                states = state_after_reset
-            else:
-                step_i += 1
+        states = next_state
+        total_reward += reward
+        agent.observe(reward=reward, terminal=terminal)
+        # the pole fell over or the time limit was reached
+        if terminal > 0:
+            total_reward = 0.0
+            episode_i += 1
+            step_i = 0
+            states = state_after_reset
+        else:
+            step_i += 1
 
+        # no action is queued after the last episode so training ends
+        if episode_i <= episode_count:
             action = agent.act(states=states)
             queue.append(action)
+
+    # extract the results of the last action from a reading of env_device
+    def get_step_results(reading):
+        return dict(
+            next_state=reading[env_device.next_state.name]["value"],
+            reward=reading[env_device.reward.name]["value"],
+            terminal=reading[env_device.terminal.name]["value"],
+            state_after_reset=reading[env_device.state_after_reset.name]["value"],
+        )
+
+    # this function will be subscribed to the RunEngine
+    # it will be called with every document:
+    #   run_start, descriptor, event, event, ..., event, stop
+    # only primary stream event documents have information relevant to the agent
+    def get_next_point_callback(name, doc):
+        if name == "descriptor" and doc["name"] == "primary":
+            primary_descriptor_uids.add(doc["uid"])
+        elif (
+            name == "event"
+            and doc["descriptor"] in primary_descriptor_uids
+            and episode_i <= episode_count
+        ):
+            observe_and_act(
+                next_state=doc["data"][env_device.next_state.name],
+                reward=doc["data"][env_device.reward.name],
+                terminal=doc["data"][env_device.terminal.name],
+                state_after_reset=doc["data"][env_device.state_after_reset.name],
+            )
         else:
             # the agent is not interested in this document
             pass
 
-    if next_point_callback is None:
+    if next_point_callback is None and not direct_feedback:
         next_point_callback = get_next_point_callback
 
-    @bpp.subs_decorator(next_point_callback)
-    @bpp.run_decorator(md=md)
+    training_run = _TrainingRun(
+        agent=agent,
+        env_device=env_device,
+        evaluation_device=CartPoleEvaluation(name=f"{env_device.name}_evaluation"),
+        evaluation_episode_count=evaluation_episode_count,
+        evaluation_tolerance=evaluation_tolerance,
+        evaluation_target_reward=evaluation_target_reward,
+        evaluation_callback=evaluation_callback,
+    )
+    episode_device = CartPoleEpisode(name=f"{env_device.name}_episode")
+
+    def rl_training_run():
+        return (yield from training_run.run(rl_training_plan(), md=md))
+
+    if next_point_callback is not None:
+        rl_training_run = bpp.subs_decorator(next_point_callback)(rl_training_run)
+
     @bpp.stage_decorator(devices=[env_device])
     def rl_training_plan():
-        nonlocal episode_i
-        nonlocal step_i
+        nonlocal training_step_i
 
-        uids = []
+        # a bounded deque keeps memory constant in long runs
+        uids = [] if recent_uid_count is None else deque(maxlen=recent_uid_count)
 
         # staging the cartpole device resets its state
         state_after_reset = env_device.state_after_reset.get()
+        episode_device.start(initial_state=state_after_reset)
         action = agent.act(states=state_after_reset)
         queue.append(action)
 
-        while len(queue) > 0:
+        start_time = time.monotonic()
+        while len(queue) > 0 and training_run.stop_reason is None:
             action = queue.pop()
 
-            # take a break for evaluation
-            if episode_i % 10 == 0 and step_i == 0:
+            # the RunEngine caches every message since the last checkpoint to
+            # rewind after a pause, a checkpoint each step keeps the cache small
+            yield from bps.checkpoint()
+
+            # start an evaluation in the background
+            if episode_i % evaluation_frequency == 0 and step_i == 0:
                 print(f"time for evaluation: episode_i: {episode_i}")
-                sum_rewards = 0.0
-                evaluation_episode_count = 100
-                for _ in range(evaluation_episode_count):
-                    states = env_device.cartpole_env.reset()
-                    internals = agent.initial_internals()
-                    terminal = False
-                    while not terminal:
-                        actions, internals = agent.act(
-                            states=states,
-                            internals=internals,
-                            independent=True,
-                            deterministic=True,
-                        )
-                        states, terminal, reward = env_device.cartpole_env.execute(
-                            actions=actions
-                        )
-                        sum_rewards += reward
-                env_device.cartpole_env.reset()
-                average_evaluation_reward = sum_rewards / evaluation_episode_count
-                # this will go in the next event document
-                yield from bps.mv(
-                    env_device.average_evaluation_reward, average_evaluation_reward
-                )
+                training_run.evaluator.submit(episode_i=episode_i)
+
+            # record at most one finished evaluation before each training step
+            yield from training_run.record_completed_evaluation()
 
             # set the action Signal to the next action
             yield from bps.mv(env_device.action, action)
-            # execute the action
-            uid = yield from bps.trigger_and_read([env_device])
-            uids.append(uid)
+            training_step_i += 1
+            if granularity == "step" and record_every == 1:
+                # execute the action and record it in an event, the agent is
+                # given the result here or by get_next_point_callback
+                uid = yield from bps.trigger_and_read([env_device])
+                uids.append(uid)
+                if direct_feedback and episode_i <= episode_count:
+                    observe_and_act(**get_step_results(uid))
+            elif granularity == "step":
+                # execute the action then decide whether to record it
+                yield from bps.trigger(env_device, wait=True)
+                reading = yield from bps.read(env_device)
+                step_results = get_step_results(reading)
+                if training_step_i % record_every == 0 or step_results["terminal"] > 0:
+                    # record the step in an event, the agent is
+                    # given the result here or by get_next_point_callback
+                    yield from bps.create(name="primary")
+                    uid = yield from bps.read(env_device)
+                    yield from bps.save()
+                    uids.append(uid)
+                    if direct_feedback and episode_i <= episode_count:
+                        observe_and_act(**step_results)
+                elif episode_i <= episode_count:
+                    observe_and_act(**step_results)
+            else:
+                # execute the action without recording it in an event
+                yield from bps.trigger(env_device, wait=True)
+                reading = yield from bps.read(env_device)
+                step_results = get_step_results(reading)
+
+                episode_device.append(
+                    action=action,
+                    next_state=step_results["next_state"],
+                    reward=step_results["reward"],
+                    terminal=step_results["terminal"],
+                )
+                if step_results["terminal"] > 0:
+                    # record the whole episode in one event
+                    uid = yield from bps.trigger_and_read(
+                        [episode_device], name="episode"
+                    )
+                    uids.append(uid)
+                    episode_device.start(
+                        initial_state=step_results["state_after_reset"]
+                    )
+
+                if episode_i <= episode_count:
+                    observe_and_act(**step_results)
+
+            training_run.stop(
+                get_budget_stop_reason(
+                    step_count=training_step_i,
+                    elapsed_time=time.monotonic() - start_time,
+                    max_step_count=max_step_count,
+                    max_duration=max_duration,
+                )
+            )
+
+        yield from training_run.record_pending_evaluations()
+        yield from training_run.record_progress(episode_count=episode_i - 1)
+
+        return list(uids)
+
+    try:
+        return (yield from rl_training_run())
+    finally:
+        training_run.close()
+
 
-            # clear the average evaluation reward for the next event
-            # if episode_i % 10 == 0 and step_i == 1:
-            yield from bps.mv(env_device.average_evaluation_reward, 0.0)
+def train_agent_vectorized(
+    env_device,
+    agent,
+    episode_count,
+    *,
+    md=None,
+    evaluation_frequency=10,
+    evaluation_episode_count=100,
+    evaluation_tolerance=None,
+    evaluation_target_reward=None,
+    evaluation_callback=None,
+    recent_uid_count=None,
+    max_step_count=None,
+    max_duration=None,
+):
+    """
+    A bluesky "plan" that trains an agent on several cartpole environments at once.
+
+    The agent must have been created with parallel_interactions equal to the
+    number of environments of env_device. Each training step the agent chooses
+    the actions for all environments with one batched act() call and is given
+    their results with one batched observe() call, so one forward pass of the
+    policy serves every environment. Each step is recorded as one event in the
+    "primary" event stream carrying one transition from each environment.
+
+    env_device may also be a list of VectorCartPole devices, the environment
+    groups, created with asynchronous=True. The groups take turns: while one
+    group steps on its worker thread the agent chooses the next actions of the
+    following group, so environment stepping is hidden behind inference. The
+    steps of each group are recorded in an event stream named after its device.
+
+    At the end of training the time spent choosing actions, stepping the
+    environments and waiting for them is recorded in the "timing" event stream
+    with the fraction of the environment step time hidden behind inference.
+
+    Evaluations are run and recorded as described for train_agent(), counting
+    episodes finished in any environment. The step and time budgets are as
+    described for train_agent(), where each step steps one environment group.
+
+    Parameters
+    ----------
+    env_device: VectorCartPole or list of VectorCartPole
+        the cartpole training environments
+    agent: a Tensorforce Agent
+        the agent that will be trained to play cartpole, created with
+        parallel_interactions equal to the total number of environments,
+        for example by get_cartpole_agent() with agent_name "ppo"
+    episode_count: int
+        number of training episodes summed over all environments, training stops
+        after the first step that brings the episode count to at least this number
+    md: dict, optional
+        bluesky metadata dictionary
+    evaluation_frequency: int, optional
+        number of training episodes between evaluations
+    evaluation_episode_count: int, optional
+        number of episodes for each evaluation, the largest
+        number of episodes for adaptive evaluation
+    evaluation_tolerance: float, optional
+        see train_agent()
+    evaluation_target_reward: float, optional
+        see train_agent()
+    evaluation_callback: function(episode_i, episode_rewards), optional
+        see train_agent()
+    recent_uid_count: int, optional
+        see train_agent()
+    max_step_count: int, optional
+        see train_agent()
+    max_duration: float, optional
+        see train_agent()
+
+    Return
+    ------
+    no return value
+    """
+    if md is None:
+        md = {}
+    check_training_budgets(max_step_count=max_step_count, max_duration=max_duration)
+
+    if isinstance(env_device, (list, tuple)):
+        env_devices = list(env_device)
+        stream_names = [group_device.name for group_device in env_devices]
+    else:
+        env_devices = [env_device]
+        stream_names = ["primary"]
+    group_count = len(env_devices)
 
-        return uids
+    # tensorforce keeps one episode buffer for each parallel index,
+    # the environments of each group have consecutive indices
+    group_parallel = []
+    parallel_i = 0
+    for group_device in env_devices:
+        group_parallel.append(
+            list(range(parallel_i, parallel_i + group_device.num_envs))
+        )
+        parallel_i += group_device.num_envs
 
-    return (yield from rl_training_plan())
+    finished_episode_count = 0
+
+    training_run = _TrainingRun(
+        agent=agent,
+        env_device=env_devices[0],
+        evaluation_device=CartPoleEvaluation(),
+        evaluation_episode_count=evaluation_episode_count,
+        evaluation_tolerance=evaluation_tolerance,
+        evaluation_target_reward=evaluation_target_reward,
+        evaluation_callback=evaluation_callback,
+    )
+    timing_device = PipelineTiming()
+
+    @bpp.stage_decorator(devices=env_devices)
+    def vectorized_training_plan():
+        nonlocal finished_episode_count
+
+        uids = [] if recent_uid_count is None else deque(maxlen=recent_uid_count)
+        inference_time = 0.0
+        env_step_time = 0.0
+        hidden_step_time = 0.0
+        blocked_time = 0.0
+
+        def act(group_i):
+            nonlocal inference_time
+
+            inference_start_time = time.monotonic()
+            group_actions[group_i] = agent.act(
+                states=group_states[group_i], parallel=group_parallel[group_i]
+            )
+            inference_time += time.monotonic() - inference_start_time
+
+        # staging the cartpole devices resets all environments
+        group_states = [
+            group_device.state_after_reset.get() for group_device in env_devices
+        ]
+        group_actions = [None] * group_count
+        act(0)
+
+        step_i = 0
+        start_time = time.monotonic()
+        while (
+            finished_episode_count < episode_count and training_run.stop_reason is None
+        ):
+            # keep the RunEngine's rewind cache small, see train_agent()
+            yield from bps.checkpoint()
+
+            yield from training_run.record_completed_evaluation()
+
+            group_i = step_i % group_count
+            next_group_i = (step_i + 1) % group_count
+            group_device = env_devices[group_i]
+            step_group = f"{group_device.name}_step"
+
+            yield from bps.mv(group_device.action, group_actions[group_i])
+            blocked_start_time = time.monotonic()
+            yield from bps.trigger(group_device, group=step_group, wait=False)
+            blocked_time += time.monotonic() - blocked_start_time
+            if next_group_i != group_i:
+                # choose the next group's actions while this group steps
+                act(next_group_i)
+            act_end_time = time.monotonic()
+            yield from bps.wait(group=step_group)
+            blocked_time += time.monotonic() - act_end_time
+
+            # the part of an asynchronous step that ran while the plan was not
+            # waiting for it, a synchronous step runs inside the trigger message
+            env_step_time += group_device.step_time
+            if group_device.asynchronous:
+                step_end_time = group_device.step_end_time
+                step_start_time = step_end_time - group_device.step_time
+                hidden_step_time += max(
+                    0.0,
+                    min(step_end_time, act_end_time)
+                    - max(step_start_time, blocked_start_time),
+                )
+
+            yield from bps.create(name=stream_names[group_i])
+            reading = yield from bps.read(group_device)
+            yield from bps.save()
+            uids.append(reading)
+
+            terminals = reading[group_device.terminal.name]["value"]
+            agent.observe(
+                reward=reading[group_device.reward.name]["value"],
+                terminal=terminals,
+                parallel=group_parallel[group_i],
+            )
+
+            # environments whose episodes ended start from their reset states
+            terminated = terminals > 0
+            group_states[group_i] = np.where(
+                terminated[:, np.newaxis],
+                reading[group_device.state_after_reset.name]["value"],
+                reading[group_device.next_state.name]["value"],
+            )
+            if next_group_i == group_i:
+                act(group_i)
+            step_i += 1
+
+            # start an evaluation when the episode count passes a multiple of evaluation_frequency
+            previous_episode_count = finished_episode_count
+            finished_episode_count += int(np.count_nonzero(terminated))
+            if (
+                finished_episode_count // evaluation_frequency
+                > previous_episode_count // evaluation_frequency
+            ):
+                print(f"time for evaluation: episode_i: {finished_episode_count}")
+                training_run.evaluator.submit(episode_i=finished_episode_count)
+
+            training_run.stop(
+                get_budget_stop_reason(
+                    step_count=step_i,
+                    elapsed_time=time.monotonic() - start_time,
+                    max_step_count=max_step_count,
+                    max_duration=max_duration,
+                )
+            )
+        elapsed_time = time.monotonic() - start_time
 
+        overlap = 0.0
+        if env_step_time > 0.0:
+            overlap = hidden_step_time / env_step_time
+        yield from bps.mv(
+            timing_device.env_groups,
+            group_count,
+            timing_device.step_count,
+            step_i,
+            timing_device.inference_time,
+            inference_time,
+            timing_device.env_step_time,
+            env_step_time,
+            timing_device.hidden_step_time,
+            hidden_step_time,
+            timing_device.blocked_time,
+            blocked_time,
+            timing_device.overlap,
+            overlap,
+            timing_device.elapsed_time,
+            elapsed_time,
+        )
+        yield from bps.trigger_and_read([timing_device], name="timing")
+
+        yield from training_run.record_pending_evaluations()
+        yield from training_run.record_progress(episode_count=finished_episode_count)
+
+        return list(uids)
+
+    try:
+        return (yield from training_run.run(vectorized_training_plan(), md=md))
+    finally:
+        training_run.close()
+
+
+def train_agent_actor_learner(
+    agent,
+    episode_count,
+    *,
+    md=None,
+    num_actors=2,
+    envs_per_actor=8,
+    batch_step_count=1000,
+    max_episode_timesteps=500,
+    seed=None,
+    actor_pool=None,
+):
+    """
+    A bluesky "plan" that trains an agent on experience gathered by actor processes.
+
+    Actor processes play cartpole with copies of the agent's policy and ship
+    batches of complete episodes through shared memory as described for
+    bluesky_cartpole.actor_learner.ActorPool. The plan is the learner: it gives
+    each batch to the agent with agent.experience(), calls agent.update() and
+    publishes the new weights to the actors. Actors keep playing while the learner
+    updates, so they may play with weights a few versions old.
+
+    Each update is recorded as one event in the "learner" event stream and the
+    throughput of the actor that sent the batch as one event in the "actor" event
+    stream. Individual training steps are not recorded. The number of training
+    episodes used by the learner is recorded in the "training" event stream at
+    the end of training.
+
+    Instead of local actor processes a bluesky_cartpole.distributed.LearnerServer
+    may be given as actor_pool to train with actors on other machines. Actors may
+    then join and leave during the run and the number of connected actors is
+    recorded with each update.
+
+    The agent's policy must not have internal state, such as an RNN,
+    because agent.experience() is not given internals.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+        the agent that will be trained to play cartpole
+    episode_count: int
+        number of training episodes, training stops after the first
+        update that brings the episode count to at least this number
+    md: dict, optional
+        bluesky metadata dictionary
+    num_actors: int, optional
+        number of actor processes
+    envs_per_actor: int, optional
+        number of cartpole games played at once by each actor
+    batch_step_count: int, optional
+        actors ship batches of at least this many steps
+    max_episode_timesteps: int, optional
+        the cartpole time limit
+    seed: int, optional
+        actor i seeds its games with seed + i
+    actor_pool: ActorPool or LearnerServer, optional
+        the source of trajectory batches, by default an ActorPool is built
+        from num_actors, envs_per_actor, batch_step_count,
+        max_episode_timesteps and seed
+
+    Return
+    ------
+    no return value
+    """
+    learner_device = LearnerUpdate()
+    actor_device = ActorThroughput()
+    progress_device = TrainingProgress()
+    if actor_pool is None:
+        actor_pool = ActorPool(
+            agent=agent,
+            num_actors=num_actors,
+            envs_per_actor=envs_per_actor,
+            batch_step_count=batch_step_count,
+            max_episode_timesteps=max_episode_timesteps,
+            seed=seed,
+        )
+
+    @bpp.run_decorator(md=md)
+    def actor_learner_plan():
+        actor_pool.start()
+
+        update_i = 0
+        learner_episode_count = 0
+        learner_step_count = 0
+        # the initial weights are version 1
+        weights_version = 1
+        while learner_episode_count < episode_count:
+            # keep the RunEngine's rewind cache small, see train_agent()
+            yield from bps.checkpoint()
+
+            batch = actor_pool.next_batch(timeout=0.1)
+            if batch is None:
+                # let the RunEngine handle pauses and aborts while the actors play
+                yield from bps.null()
+                continue
+
+            update_start_time = time.monotonic()
+            agent.experience(
+                states=batch["states"],
+                actions=batch["actions"],
+                terminal=batch["terminals"],
+                reward=batch["rewards"],
+            )
+            agent.update()
+            # the actor played with a version at most this old
+            weights_lag = weights_version - batch["actor_weights_version"]
+            weights_version = actor_pool.publish_weights(get_agent_weights(agent))
+            update_time = time.monotonic() - update_start_time
+
+            update_i += 1
+            learner_episode_count += len(batch["episode_rewards"])
+            learner_step_count += len(batch["actions"])
+
+            yield from bps.mv(
+                learner_device.update,
+                update_i,
+                learner_device.episode_count,
+                learner_episode_count,
+                learner_device.step_count,
+                learner_step_count,
+                learner_device.batch_step_count,
+                len(batch["actions"]),
+                learner_device.batch_episode_count,
+                len(batch["episode_rewards"]),
+                learner_device.batch_reward_mean,
+                np.mean(batch["episode_rewards"]),
+                learner_device.weights_version,
+                weights_version,
+                learner_device.update_time,
+                update_time,
+                learner_device.actor_count,
+                actor_pool.actor_count(),
+            )
+            yield from bps.trigger_and_read([learner_device], name="learner")
+
+            yield from bps.mv(
+                actor_device.index,
+                batch["actor_i"],
+                actor_device.step_count,
+                batch["actor_step_count"],
+                actor_device.steps_per_second,
+                batch["actor_step_count"] / batch["actor_elapsed_time"],
+                actor_device.weights_version,
+                batch["actor_weights_version"],
+                actor_device.weights_lag,
+                weights_lag,
+            )
+            yield from bps.trigger_and_read([actor_device], name="actor")
+
+        yield from bps.mv(progress_device.episode_count, learner_episode_count)
+        yield from bps.trigger_and_read([progress_device], name="training")
+
+    try:
+        return (yield from actor_learner_plan())
+    finally:
+        actor_pool.close()
+
+
+def train_cartpole_agent(
+    agent_name,
+    episode_count,
+    *,
+    granularity="step",
+    record_every=1,
+    evaluation_frequency=10,
+    evaluation_episode_count=100,
+    evaluation_tolerance=None,
+    evaluation_target_reward=None,
+    seed=None,
+    agent_parameters=None,
+    evaluation_callback=None,
+    md=None,
+    num_actors=0,
+    envs_per_actor=8,
+    batch_step_count=1000,
+    actor_server_address=None,
+    actor_server_authkey=None,
+    parallel_interactions=1,
+    env_groups=1,
+    direct_feedback=False,
+    recent_uid_count=None,
+    max_step_count=None,
+    max_duration=None,
+    convergence_reward=None,
+    convergence_patience=1,
+    plateau_patience=None,
+):
+    if env_groups > 1 and parallel_interactions % env_groups != 0:
+        raise ValueError(
+            f"parallel_interactions {parallel_interactions} can not be split into {env_groups} env_groups"
+        )
+    if parallel_interactions > 1 and (
+        num_actors > 0 or actor_server_address is not None
+    ):
+        raise ValueError(
+            "parallel_interactions can not be combined with actor-learner training"
+        )
+    if num_actors > 0 or actor_server_address is not None:
+        # the learner neither evaluates the agent nor counts training steps
+        unsupported_options = [
+            option_name
+            for option_name, option_value in (
+                ("convergence_reward", convergence_reward),
+                ("plateau_patience", plateau_patience),
+                ("max_step_count", max_step_count),
+                ("max_duration", max_duration),
+            )
+            if option_value is not None
+        ]
+        if len(unsupported_options) > 0:
+            raise ValueError(
+                f"{', '.join(unsupported_options)} can not be combined with actor-learner training"
+            )
 
-def train_cartpole_agent(agent_name, episode_count):
     print("don't forget to start tensorboard: tensorboard --log-dir data")
 
-    cartpole_device = CartPole()
+    if env_groups > 1:
+        # the groups take turns stepping on worker threads
+        env_group_devices = [
+            VectorCartPole(
+                num_envs=parallel_interactions // env_groups,
+                name=f"vector_cartpole_{group_i}",
+                prefix=f"VECTOR_CARTPOLE_{group_i}",
+                asynchronous=True,
+            )
+            for group_i in range(env_groups)
+        ]
+        cartpole_device = env_group_devices[0]
+    elif parallel_interactions > 1:
+        # one batched agent.act() call serves all environments
+        cartpole_device = VectorCartPole(num_envs=parallel_interactions)
+    else:
+        # records the same data as CartPole with less overhead per step
+        cartpole_device = FastCartPole()
     cartpole_agent, agent_parameters = get_cartpole_agent(
-        agent_name=agent_name, cartpole_device=cartpole_device
+        agent_name=agent_name,
+        cartpole_device=cartpole_device,
+        seed=seed,
+        agent_parameters=agent_parameters,
+        parallel_interactions=parallel_interactions,
     )
 
-    md = {
+    training_md = {
         "agent_name": agent_name,
         "episode_count": episode_count,
         "agent_parameters": agent_parameters,
+        "granularity": granularity,
+        "record_every": record_every,
+        "evaluation_frequency": evaluation_frequency,
+        "evaluation_episode_count": evaluation_episode_count,
+        "evaluation_tolerance": evaluation_tolerance,
+        "evaluation_target_reward": evaluation_target_reward,
+        "seed": seed,
+        "parallel_interactions": parallel_interactions,
+        "env_groups": env_groups,
+        "max_step_count": max_step_count,
+        "max_duration": max_duration,
+        "convergence_reward": convergence_reward,
+        "convergence_patience": convergence_patience,
+        "plateau_patience": plateau_patience,
     }
+    if md is not None:
+        training_md.update(md)
+
+    if convergence_reward is not None or plateau_patience is not None:
+        # stop training once evaluations show the agent has converged
+        evaluation_callback = ConvergenceStopper(
+            target_reward=convergence_reward,
+            patience=convergence_patience,
+            plateau_patience=plateau_patience,
+            evaluation_callback=evaluation_callback,
+        )
+
+    if num_actors > 0 or actor_server_address is not None:
+        # actor-learner training does not use the granularity,
+        # record_every or evaluation options
+        training_md.update(
+            num_actors=num_actors,
+            envs_per_actor=envs_per_actor,
+            batch_step_count=batch_step_count,
+        )
+        actor_pool = None
+        if actor_server_address is not None:
+            # remote actors connect to this address
+            actor_pool = LearnerServer(
+                agent=cartpole_agent,
+                authkey=actor_server_authkey,
+                address=actor_server_address,
+                max_episode_timesteps=cartpole_device.cartpole_env.max_episode_timesteps(),
+            )
+            training_md.update(actor_server_address=list(actor_server_address))
+        yield from train_agent_actor_learner(
+            agent=cartpole_agent,
+            episode_count=episode_count,
+            md=training_md,
+            num_actors=num_actors,
+            envs_per_actor=envs_per_actor,
+            batch_step_count=batch_step_count,
+            max_episode_timesteps=cartpole_device.cartpole_env.max_episode_timesteps(),
+            seed=seed,
+            actor_pool=actor_pool,
+        )
+        return
+
+    if parallel_interactions > 1:
+        # vectorized training does not use the granularity or record_every options
+        yield from train_agent_vectorized(
+            env_device=env_group_devices if env_groups > 1 else cartpole_device,
+            agent=cartpole_agent,
+            episode_count=episode_count,
+            md=training_md,
+            evaluation_frequency=evaluation_frequency,
+            evaluation_episode_count=evaluation_episode_count,
+            evaluation_tolerance=evaluation_tolerance,
+            evaluation_target_reward=evaluation_target_reward,
+            evaluation_callback=evaluation_callback,
+            recent_uid_count=recent_uid_count,
+            max_step_count=max_step_count,
+            max_duration=max_duration,
+        )
+        return
 
     yield from train_agent(
         env_device=cartpole_device,
         agent=cartpole_agent,
         episode_count=episode_count,
-        md=md,
+        md=training_md,
+        granularity=granularity,
+        record_every=record_every,
+        evaluation_frequency=evaluation_frequency,
+        evaluation_episode_count=evaluation_episode_count,
+        evaluation_tolerance=evaluation_tolerance,
+        evaluation_target_reward=evaluation_target_reward,
+        evaluation_callback=evaluation_callback,
+        direct_feedback=direct_feedback,
+        recent_uid_count=recent_uid_count,
+        max_step_count=max_step_count,
+        max_duration=max_duration,
     )
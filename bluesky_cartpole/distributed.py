@@ -0,0 +1,311 @@
+import itertools
+import logging
+import queue
+import socket
+import threading
+from multiprocessing.connection import (
+    AuthenticationError,
+    Client,
+    Listener,
+    answer_challenge,
+    deliver_challenge,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LearnerServer:
+    """
+    A TCP server giving actors on other machines the learner's policy and collecting their trajectories.
+
+    LearnerServer has the start(), next_batch(), publish_weights(), actor_count()
+    and close() methods of bluesky_cartpole.actor_learner.ActorPool so it can be
+    passed to train_agent_actor_learner() in its place.
+
+    Messages are pickled Python objects sent over
+    multiprocessing.connection connections, which check a shared authkey when
+    an actor connects. Only run actors and learners on networks you trust:
+    anyone with the authkey can send objects to be unpickled. The authkey
+    handshake runs on each actor's own thread, so a client that connects and
+    never answers does not hold up other actors.
+
+    The protocol for each actor connection is
+      - the server sends ("start", dict(actor_i, agent_spec, max_episode_timesteps,
+        weights, weights_version))
+      - the actor repeatedly sends ("batch", batch) where batch is a dictionary
+        from ActorPlayer.play_batch() and the server replies
+          ("weights", (weights, weights_version)) if there are newer weights
+          ("weights", None) if the actor has the newest weights
+          ("stop", None) when training is over
+    Actors may connect and disconnect at any time. A batch is only used
+    if it arrives complete.
+    """
+
+    def __init__(
+        self,
+        agent,
+        authkey,
+        address=("127.0.0.1", 0),
+        max_episode_timesteps=500,
+        handshake_timeout=5.0,
+    ):
+        """
+        Parameters
+        ----------
+        agent: a Tensorforce Agent
+            the learner agent, actors are given copies of its specification and weights
+        authkey: bytes
+            the shared secret actors must present to connect
+        address: (str, int)
+            the host and port to listen on, port 0 picks a free port,
+            the server listens from the start but accepts actors after start()
+        max_episode_timesteps: int
+            the cartpole time limit for the actors' games
+        handshake_timeout: float
+            seconds a connecting actor has to complete the authkey handshake
+        """
+        from bluesky_cartpole.evaluation import (
+            get_agent_weights,
+            get_evaluation_agent_spec,
+        )
+
+        self.authkey = authkey
+        self.max_episode_timesteps = max_episode_timesteps
+        self.handshake_timeout = handshake_timeout
+        # without an authkey accept() returns at once, the handshake is in _serve_actor()
+        self._listener = Listener(address)
+        # the actual address when port 0 was requested
+        self.address = self._listener.address
+
+        self._agent_spec = get_evaluation_agent_spec(agent)
+        self._lock = threading.Lock()
+        self._weights = get_agent_weights(agent)
+        self._weights_version = 1
+
+        self._batches = queue.Queue()
+        self._actor_indices = itertools.count()
+        self._connected_actors = set()
+        self._stopping = threading.Event()
+        self._accept_thread = None
+        self._serve_threads = []
+
+    def start(self):
+        """
+        Start accepting actors.
+        """
+        logger.info("accepting actors on %s:%d", *self.address)
+        self._accept_thread = threading.Thread(
+            target=self._accept_actors, name="cartpole-learner-accept", daemon=True
+        )
+        self._accept_thread.start()
+
+    def _accept_actors(self):
+        while not self._stopping.is_set():
+            try:
+                connection = self._listener.accept()
+            except Exception as error:
+                if self._stopping.is_set():
+                    break
+                logger.warning("an actor failed to connect: %r", error)
+                continue
+            if self._stopping.is_set():
+                connection.close()
+                break
+
+            actor_i = next(self._actor_indices)
+            serve_thread = threading.Thread(
+                target=self._serve_actor,
+                args=(actor_i, connection),
+                name=f"cartpole-learner-actor-{actor_i}",
+                daemon=True,
+            )
+            serve_thread.start()
+            self._serve_threads.append(serve_thread)
+
+    def _authenticate(self, connection):
+        # shutting down the socket wakes a handshake waiting for a silent client
+        handshake_socket = socket.fromfd(
+            connection.fileno(), socket.AF_INET, socket.SOCK_STREAM
+        )
+        handshake_timer = threading.Timer(
+            self.handshake_timeout, _shutdown_socket, args=(handshake_socket,)
+        )
+        handshake_timer.start()
+        try:
+            deliver_challenge(connection, self.authkey)
+            answer_challenge(connection, self.authkey)
+        finally:
+            handshake_timer.cancel()
+            handshake_socket.close()
+
+    def _serve_actor(self, actor_i, connection):
+        try:
+            self._authenticate(connection)
+        except (AuthenticationError, EOFError, OSError) as error:
+            # for example a client with the wrong authkey or one that never answers
+            logger.warning("actor %d failed to connect: %r", actor_i, error)
+            connection.close()
+            return
+
+        with self._lock:
+            self._connected_actors.add(actor_i)
+            start_message = dict(
+                actor_i=actor_i,
+                agent_spec=self._agent_spec,
+                max_episode_timesteps=self.max_episode_timesteps,
+                weights=self._weights,
+                weights_version=self._weights_version,
+            )
+        logger.info("actor %d connected", actor_i)
+        try:
+            connection.send(("start", start_message))
+            while True:
+                message, batch = connection.recv()
+                if message != "batch":
+                    raise ValueError(f"message '{message}' is not recognized")
+                batch["actor_i"] = actor_i
+                self._batches.put(batch)
+
+                if self._stopping.is_set():
+                    connection.send(("stop", None))
+                    break
+                with self._lock:
+                    if batch["actor_weights_version"] == self._weights_version:
+                        connection.send(("weights", None))
+                    else:
+                        connection.send(
+                            ("weights", (self._weights, self._weights_version))
+                        )
+        except (EOFError, OSError):
+            # the actor left
+            pass
+        except Exception:
+            logger.exception("closing the connection to actor %d", actor_i)
+        finally:
+            connection.close()
+            with self._lock:
+                self._connected_actors.discard(actor_i)
+            logger.info("actor %d disconnected", actor_i)
+
+    def next_batch(self, timeout=None):
+        """
+        Collect the next trajectory batch from any actor.
+
+        Return
+        ------
+            None if no batch arrived in time, otherwise a batch
+            dictionary as described for ActorPool.next_batch()
+        """
+        try:
+            return self._batches.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def actor_count(self):
+        """
+        Return the number of connected actors.
+        """
+        with self._lock:
+            return len(self._connected_actors)
+
+    def publish_weights(self, weights):
+        """
+        Make new learner weights available to the actors.
+
+        Return
+        ------
+            the new weights version number
+        """
+        with self._lock:
+            self._weights = weights
+            self._weights_version += 1
+            return self._weights_version
+
+    def close(self, timeout=10.0):
+        """
+        Tell each actor to stop when it sends its next batch and stop listening.
+        """
+        self._stopping.set()
+        if self._accept_thread is None:
+            self._listener.close()
+            return
+        # accept() does not notice the listener closing, so connect once to wake it
+        try:
+            Client(self.address).close()
+        except Exception:
+            pass
+        self._accept_thread.join(timeout=timeout)
+        for serve_thread in self._serve_threads:
+            serve_thread.join(timeout=timeout)
+        self._listener.close()
+
+
+def _shutdown_socket(handshake_socket):
+    try:
+        handshake_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        # the connection is already closed
+        pass
+
+
+def run_actor(
+    address,
+    authkey,
+    envs_per_actor=8,
+    batch_step_count=1000,
+    seed=None,
+    batch_limit=None,
+):
+    """
+    Connect to a LearnerServer and play cartpole for it until training is over.
+
+    Parameters
+    ----------
+    address: (str, int)
+        the host and port of the LearnerServer
+    authkey: bytes
+        the LearnerServer's shared secret
+    envs_per_actor: int
+        number of cartpole games played at once
+    batch_step_count: int
+        ship batches of at least this many steps
+    seed: int, optional
+        seed for the initial states of the games
+    batch_limit: int, optional
+        leave after sending this many batches
+
+    Return
+    ------
+        the number of batches sent
+    """
+    from tensorforce.agents import Agent
+
+    from bluesky_cartpole.actor_learner import ActorPlayer
+
+    batch_count = 0
+    with Client(address, authkey=authkey) as connection:
+        _, start_message = connection.recv()
+        agent = Agent.create(agent=start_message["agent_spec"])
+        try:
+            actor_player = ActorPlayer(
+                agent=agent,
+                envs_per_actor=envs_per_actor,
+                max_episode_timesteps=start_message["max_episode_timesteps"],
+                seed=seed,
+            )
+            actor_player.load_weights(
+                weights=start_message["weights"],
+                weights_version=start_message["weights_version"],
+            )
+            while batch_limit is None or batch_count < batch_limit:
+                batch = actor_player.play_batch(batch_step_count=batch_step_count)
+                connection.send(("batch", batch))
+                batch_count += 1
+                message, new_weights = connection.recv()
+                if message == "stop":
+                    break
+                elif new_weights is not None:
+                    actor_player.load_weights(*new_weights)
+        finally:
+            agent.close()
+    return batch_count
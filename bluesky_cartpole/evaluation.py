@@ -0,0 +1,480 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tensorforce.agents import Agent
+
+
+def get_agent_weights(agent):
+    """
+    Copy the values of all agent variables.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+
+    Return
+    ------
+        dictionary of variable name to numpy array
+    """
+    return {
+        variable: agent.get_variable(variable=variable)
+        for variable in agent.get_variables()
+    }
+
+
+def get_evaluation_agent_spec(agent):
+    """
+    Copy the specification of an agent without summaries, checkpoints or recordings.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+
+    Return
+    ------
+        dictionary for Agent.create(agent=...)
+    """
+    agent_spec = dict(agent.spec)
+    agent_spec.update(summarizer=None, saver=None, recorder=None)
+    return agent_spec
+
+
+def create_evaluation_agent(agent):
+    """
+    Build a new agent with the same specification as the specified agent.
+
+    The new agent does not write summaries, checkpoints or recordings so
+    it can be used for evaluation without touching the training agent's files.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+
+    Return
+    ------
+        a Tensorforce Agent
+    """
+    return Agent.create(agent=get_evaluation_agent_spec(agent))
+
+
+def evaluate_agent(agent, cartpole_env, episode_count):
+    """
+    Play deterministic evaluation episodes one after another.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+        the agent to be evaluated, it is not trained by this function
+    cartpole_env: tensorforce Environment
+        a cartpole environment that is not used for training
+    episode_count: int
+        number of evaluation episodes
+
+    Return
+    ------
+        numpy array of episode rewards with shape (episode_count, )
+    """
+    episode_rewards = np.zeros(episode_count)
+    for episode_i in range(episode_count):
+        states = cartpole_env.reset()
+        internals = agent.initial_internals()
+        terminal = False
+        while not terminal:
+            actions, internals = agent.act(
+                states=states,
+                internals=internals,
+                independent=True,
+                deterministic=True,
+            )
+            states, terminal, reward = cartpole_env.execute(actions=actions)
+            episode_rewards[episode_i] += reward
+    return episode_rewards
+
+
+def evaluate_agent_batched(agent, vector_env, episode_count):
+    """
+    Play deterministic evaluation episodes simultaneously.
+
+    Up to vector_env.num_envs episodes are played at the same time with one batched
+    agent.act() call per timestep. Episodes that have finished are masked out of
+    both the agent's batch and the environment step. If episode_count is larger
+    than vector_env.num_envs the episodes are played in several rounds.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+        the agent to be evaluated, it is not trained by this function
+    vector_env: BatchedCartPole or TensorforceVectorEnvironment
+        cartpole environments that are not used for training
+    episode_count: int
+        number of evaluation episodes
+
+    Return
+    ------
+        numpy array of episode rewards with shape (episode_count, )
+    """
+    episode_rewards = []
+    while len(episode_rewards) < episode_count:
+        round_episode_count = min(
+            vector_env.num_envs, episode_count - len(episode_rewards)
+        )
+        episode_rewards.extend(
+            _play_evaluation_round(
+                agent=agent, vector_env=vector_env, episode_count=round_episode_count
+            )
+        )
+    return np.asarray(episode_rewards)
+
+
+def evaluate_agent_adaptive(
+    agent, vector_env, max_episode_count, tolerance, target_reward=None, z_score=1.96
+):
+    """
+    Play rounds of simultaneous evaluation episodes until the mean episode reward is known well enough.
+
+    Each round plays up to vector_env.num_envs episodes as evaluate_agent_batched() does.
+    After each round the confidence interval mean +/- z_score * std / sqrt(n) of the
+    mean episode reward is calculated and evaluation stops when
+      - the half width of the confidence interval is no more than tolerance
+      - target_reward is given and lies outside the confidence interval, so the
+        target is clearly reached or clearly unreachable
+      - max_episode_count episodes have been played
+    An agent earning the same reward in every episode, for example the maximum
+    reward of 500, has a zero-width interval and is evaluated in one round.
+
+    Parameters
+    ----------
+    agent: a Tensorforce Agent
+        the agent to be evaluated, it is not trained by this function
+    vector_env: BatchedCartPole or TensorforceVectorEnvironment
+        cartpole environments that are not used for training, with at least 2 environments
+    max_episode_count: int
+        the largest number of evaluation episodes
+    tolerance: float
+        the largest acceptable half width of the confidence interval
+    target_reward: float, optional
+        a mean episode reward of interest such as the maximum possible reward
+    z_score: float
+        the confidence interval width in standard errors, 1.96 for 95% confidence
+
+    Return
+    ------
+        numpy array of episode rewards with shape (n, ) where n <= max_episode_count
+    """
+    episode_rewards = np.zeros(0)
+    while len(episode_rewards) < max_episode_count:
+        round_episode_count = min(
+            vector_env.num_envs, max_episode_count - len(episode_rewards)
+        )
+        episode_rewards = np.concatenate(
+            [
+                episode_rewards,
+                _play_evaluation_round(
+                    agent=agent,
+                    vector_env=vector_env,
+                    episode_count=round_episode_count,
+                ),
+            ]
+        )
+
+        if len(episode_rewards) < 2:
+            continue
+        mean, half_width = confidence_interval(episode_rewards, z_score=z_score)
+        if half_width <= tolerance:
+            break
+        elif target_reward is not None and (
+            mean - half_width > target_reward or mean + half_width < target_reward
+        ):
+            break
+
+    return episode_rewards
+
+
+def confidence_interval(episode_rewards, z_score=1.96):
+    """
+    Calculate the mean of episode_rewards and the half width of its normal confidence interval.
+
+    Parameters
+    ----------
+    episode_rewards: numpy array with at least 2 elements
+    z_score: float
+        the confidence interval width in standard errors
+
+    Return
+    ------
+        (mean, half_width)
+    """
+    mean = np.mean(episode_rewards)
+    standard_error = np.std(episode_rewards, ddof=1) / np.sqrt(len(episode_rewards))
+    return mean, z_score * standard_error
+
+
+def _play_evaluation_round(agent, vector_env, episode_count):
+    # only the first episode_count environments are used
+    active = np.zeros(vector_env.num_envs, dtype=bool)
+    active[:episode_count] = True
+
+    states = vector_env.reset(mask=active)
+    actions = np.zeros(vector_env.num_envs, dtype=int)
+    episode_rewards = np.zeros(vector_env.num_envs)
+    # batched agent.act() takes a list of internals dictionaries
+    # but returns one dictionary of batched internals
+    internals = [agent.initial_internals() for _ in range(vector_env.num_envs)]
+
+    while np.any(active):
+        active_indices = np.flatnonzero(active)
+        active_actions, active_internals = agent.act(
+            states=states[active_indices],
+            internals=[internals[env_i] for env_i in active_indices],
+            parallel=list(range(len(active_indices))),
+            independent=True,
+            deterministic=True,
+        )
+        actions[active_indices] = active_actions
+        for batch_i, env_i in enumerate(active_indices):
+            internals[env_i] = OrderedDict(
+                (name, value[batch_i]) for name, value in active_internals.items()
+            )
+
+        states, terminals, rewards = vector_env.step(actions=actions, mask=active)
+        episode_rewards += rewards
+        active &= terminals == 0
+
+    return episode_rewards[:episode_count]
+
+
+class BackgroundEvaluator:
+    """
+    Evaluate snapshots of a training agent on a worker thread.
+
+    Each call to submit() copies the training agent's weights and queues an
+    evaluation of that copy. Evaluations run one at a time on a worker thread with
+    a separate evaluation agent and environments, so training continues while they
+    run. The evaluation episodes are played simultaneously by evaluate_agent_batched(),
+    or by evaluate_agent_adaptive() if a tolerance or target reward is given.
+
+    At most one evaluation runs and one waits. If evaluations take longer than
+    the training between submit() calls, a waiting snapshot is replaced by the
+    newer one and skipped_count is increased, so neither the weight snapshots nor
+    the evaluations left to finish at the end of training pile up.
+    """
+
+    def __init__(
+        self, agent, vector_env, episode_count=100, tolerance=None, target_reward=None
+    ):
+        """
+        Parameters
+        ----------
+        agent: a Tensorforce Agent
+            the agent being trained
+        vector_env: BatchedCartPole or TensorforceVectorEnvironment
+            cartpole environments used only for evaluation, fixed-size evaluation
+            is fastest with vector_env.num_envs equal to episode_count
+        episode_count: int
+            number of evaluation episodes for each evaluation,
+            the largest number of episodes for adaptive evaluation
+        tolerance: float, optional
+            confidence interval half width for adaptive evaluation
+        target_reward: float, optional
+            target mean episode reward for adaptive evaluation
+        """
+        self.agent = agent
+        self.vector_env = vector_env
+        self.episode_count = episode_count
+        self.tolerance = tolerance
+        self.target_reward = target_reward
+
+        # the evaluation agent is created on the worker thread
+        self._evaluation_agent = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cartpole-evaluation"
+        )
+        # (episode_i, future) for evaluations given to the worker thread
+        self._pending = deque()
+        # (episode_i, weights) for the evaluation waiting for the worker thread
+        self._waiting = None
+        # number of snapshots replaced before they were evaluated
+        self.skipped_count = 0
+
+    def submit(self, episode_i):
+        """
+        Queue an evaluation of the training agent's current weights.
+
+        Parameters
+        ----------
+        episode_i: int
+            the training episode at which the weights were copied
+        """
+        if self._waiting is not None:
+            # the worker thread is busy, evaluate the newer snapshot instead
+            self.skipped_count += 1
+        self._waiting = (episode_i, get_agent_weights(self.agent))
+        self._start_waiting()
+
+    def _start_waiting(self):
+        # give the waiting snapshot to the worker thread when it is free,
+        # finished evaluations need not have been collected
+        if self._waiting is not None and (
+            len(self._pending) == 0 or self._pending[-1][1].done()
+        ):
+            episode_i, weights = self._waiting
+            self._waiting = None
+            future = self._executor.submit(self._evaluate, weights)
+            self._pending.append((episode_i, future))
+
+    def _evaluate(self, weights):
+        if self._evaluation_agent is None:
+            self._evaluation_agent = create_evaluation_agent(self.agent)
+        for variable, value in weights.items():
+            self._evaluation_agent.assign_variable(variable=variable, value=value)
+        if self.tolerance is None and self.target_reward is None:
+            return evaluate_agent_batched(
+                agent=self._evaluation_agent,
+                vector_env=self.vector_env,
+                episode_count=self.episode_count,
+            )
+        else:
+            return evaluate_agent_adaptive(
+                agent=self._evaluation_agent,
+                vector_env=self.vector_env,
+                max_episode_count=self.episode_count,
+                # without a tolerance only the target reward can end evaluation early
+                tolerance=0.0 if self.tolerance is None else self.tolerance,
+                target_reward=self.target_reward,
+            )
+
+    def pending_count(self):
+        """
+        Return the number of evaluations that have not been collected.
+        """
+        return len(self._pending) + int(self._waiting is not None)
+
+    def next_completed(self, wait=False):
+        """
+        Collect the oldest evaluation if it has finished.
+
+        Evaluations are collected in the order they were submitted.
+
+        Parameters
+        ----------
+        wait: bool
+            if True wait for the oldest evaluation to finish
+
+        Return
+        ------
+            (episode_i, episode_rewards) or None if there is no finished evaluation
+        """
+        self._start_waiting()
+        if len(self._pending) == 0:
+            return None
+        episode_i, future = self._pending[0]
+        if not wait and not future.done():
+            return None
+        self._pending.popleft()
+        self._start_waiting()
+        return episode_i, future.result()
+
+    def close(self):
+        """
+        Wait for running evaluations and release the worker thread and evaluation agent.
+        """
+        self._waiting = None
+        self._executor.shutdown(wait=True)
+        if self._evaluation_agent is not None:
+            self._evaluation_agent.close()
+            self._evaluation_agent = None
+
+
+class ConvergenceStopper:
+    """
+    An evaluation callback for train_agent() that stops training once the agent has converged.
+
+    Training stops when the mean evaluation reward is at least target_reward for
+    patience consecutive evaluations, for example 475.0, the reward at which
+    CartPole-v1 is considered solved. If plateau_patience is given training also
+    stops when the best mean evaluation reward has not improved by more than
+    min_improvement for plateau_patience consecutive evaluations.
+
+    Another evaluation callback, for example a SuccessiveHalvingStopper, may be
+    given as evaluation_callback. It is called with every evaluation and its
+    reason for stopping takes precedence.
+    """
+
+    def __init__(
+        self,
+        target_reward=475.0,
+        patience=1,
+        plateau_patience=None,
+        min_improvement=0.0,
+        evaluation_callback=None,
+    ):
+        """
+        Parameters
+        ----------
+        target_reward: float or None
+            the mean evaluation reward of a solved agent, None to stop only on a plateau
+        patience: int
+            number of consecutive evaluations at or above target_reward
+        plateau_patience: int, optional
+            number of consecutive evaluations without improvement
+        min_improvement: float
+            an evaluation improves on the best mean evaluation reward
+            only if it is larger by more than this value
+        evaluation_callback: function(episode_i, episode_rewards), optional
+            another evaluation callback consulted first
+        """
+        if patience < 1:
+            raise ValueError(f"patience must be at least 1, not {patience}")
+        if plateau_patience is not None and plateau_patience < 1:
+            raise ValueError(
+                f"plateau_patience must be at least 1, not {plateau_patience}"
+            )
+        self.target_reward = target_reward
+        self.patience = patience
+        self.plateau_patience = plateau_patience
+        self.min_improvement = min_improvement
+        self.evaluation_callback = evaluation_callback
+
+        self.solved_evaluation_count = 0
+        self.best_reward_mean = None
+        self.plateau_evaluation_count = 0
+
+    def __call__(self, episode_i, episode_rewards):
+        stop_reason = None
+        if self.evaluation_callback is not None:
+            stop_reason = self.evaluation_callback(episode_i, episode_rewards)
+
+        reward_mean = float(np.mean(episode_rewards))
+        if self.target_reward is not None and reward_mean >= self.target_reward:
+            self.solved_evaluation_count += 1
+        else:
+            self.solved_evaluation_count = 0
+
+        if (
+            self.best_reward_mean is None
+            or reward_mean > self.best_reward_mean + self.min_improvement
+        ):
+            self.best_reward_mean = reward_mean
+            self.plateau_evaluation_count = 0
+        else:
+            self.plateau_evaluation_count += 1
+
+        if stop_reason is not None:
+            return stop_reason
+        elif self.solved_evaluation_count >= self.patience:
+            return (
+                f"converged at episode {episode_i}: mean evaluation reward {reward_mean:.1f} "
+                f"reached {self.target_reward:.1f} in {self.patience} consecutive evaluations"
+            )
+        elif (
+            self.plateau_patience is not None
+            and self.plateau_evaluation_count >= self.plateau_patience
+        ):
+            return (
+                f"plateaued at episode {episode_i}: best mean evaluation reward "
+                f"{self.best_reward_mean:.1f} did not improve in {self.plateau_patience} evaluations"
+            )
+        else:
+            return None
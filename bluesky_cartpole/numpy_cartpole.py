@@ -0,0 +1,205 @@
+import math
+
+import numpy as np
+
+
+class BatchedCartPole:
+    """
+    Many cartpole games simulated together with NumPy array operations.
+
+    The equations of motion, termination thresholds and time limit are the same
+    as those of the gym CartPole-v1 environment, but each call to step() advances
+    every cartpole by one timestep.
+
+    The terminal values follow the tensorforce convention:
+        terminal==0 -- the episode continues
+        terminal==1 -- the pole fell over or the cart left the track
+        terminal==2 -- the maximum number of timesteps have been taken
+    """
+
+    gravity = 9.8
+    masscart = 1.0
+    masspole = 0.1
+    total_mass = masspole + masscart
+    # half the length of the pole
+    length = 0.5
+    polemass_length = masspole * length
+    force_mag = 10.0
+    # seconds between state updates
+    tau = 0.02
+
+    # an episode ends when the pole angle or cart position exceed these values
+    theta_threshold_radians = 12 * 2 * math.pi / 360
+    x_threshold = 2.4
+
+    def __init__(self, num_envs, max_episode_timesteps=500, random_state=None):
+        """
+        Parameters
+        ----------
+        num_envs: int
+            number of cartpole games
+        max_episode_timesteps: int, optional
+            episodes are terminated with terminal==2 after this many timesteps,
+            the default is the CartPole-v1 time limit
+        random_state: int or numpy.random.RandomState, optional
+            seed or random number generator for initial states, passing
+            gym.utils.seeding.np_random(seed)[0] reproduces gym's initial states
+        """
+        self.num_envs = num_envs
+        self._max_episode_timesteps = max_episode_timesteps
+        if isinstance(random_state, np.random.RandomState):
+            self.np_random = random_state
+        else:
+            self.np_random = np.random.RandomState(random_state)
+
+        self.cartpole_states = np.zeros((num_envs, 4))
+        self.timesteps = np.zeros(num_envs, dtype=int)
+
+    def states(self):
+        """
+        The tensorforce state specification of one cartpole game.
+        """
+        return dict(type="float", shape=(4,))
+
+    def actions(self):
+        """
+        The tensorforce action specification of one cartpole game.
+        """
+        return dict(type="int", shape=(), num_values=2)
+
+    def max_episode_timesteps(self):
+        return self._max_episode_timesteps
+
+    def reset(self, mask=None):
+        """
+        Start new episodes.
+
+        Parameters
+        ----------
+        mask: numpy array of bool with shape (num_envs, ), optional
+            only games with True mask values are reset, by default all games are reset
+
+        Returns
+        -------
+        cartpole_states: numpy array with shape (num_envs, 4)
+            a copy of the current state of all games
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        reset_count = np.count_nonzero(mask)
+        self.cartpole_states[mask] = self.np_random.uniform(
+            low=-0.05, high=0.05, size=(reset_count, 4)
+        )
+        self.timesteps[mask] = 0
+        return self.cartpole_states.copy()
+
+    def step(self, actions, mask=None):
+        """
+        Advance the games by one timestep.
+
+        Games that have terminated must be reset before they are stepped again.
+
+        Parameters
+        ----------
+        actions: numpy array of int with shape (num_envs, )
+            0 pushes the cart to the left, 1 pushes the cart to the right
+        mask: numpy array of bool with shape (num_envs, ), optional
+            only games with True mask values are stepped, by default all games are stepped
+
+        Returns
+        -------
+        next_states: numpy array with shape (num_envs, 4)
+            a copy of the current state of all games
+        terminals: numpy array of int with shape (num_envs, )
+            0, 1 or 2 as described in the class docstring, 0 for games that were not stepped
+        rewards: numpy array with shape (num_envs, )
+            1.0 for every game that was stepped, 0.0 for games that were not stepped
+        """
+        actions = np.asarray(actions)
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+            stepped_actions = actions
+            x, x_dot, theta, theta_dot = self.cartpole_states.T
+        else:
+            mask = np.asarray(mask, dtype=bool)
+            stepped_actions = actions[mask]
+            x, x_dot, theta, theta_dot = self.cartpole_states[mask].T
+
+        # the same calculation as gym's CartPoleEnv.step() with the euler integrator
+        force = np.where(stepped_actions == 1, self.force_mag, -self.force_mag)
+        costheta = np.cos(theta)
+        sintheta = np.sin(theta)
+        temp = (
+            force + self.polemass_length * theta_dot ** 2 * sintheta
+        ) / self.total_mass
+        thetaacc = (self.gravity * sintheta - costheta * temp) / (
+            self.length
+            * (4.0 / 3.0 - self.masspole * costheta ** 2 / self.total_mass)
+        )
+        xacc = temp - self.polemass_length * thetaacc * costheta / self.total_mass
+
+        x = x + self.tau * x_dot
+        x_dot = x_dot + self.tau * xacc
+        theta = theta + self.tau * theta_dot
+        theta_dot = theta_dot + self.tau * thetaacc
+
+        self.cartpole_states[mask] = np.stack([x, x_dot, theta, theta_dot], axis=1)
+        self.timesteps[mask] += 1
+
+        fell = (
+            (x < -self.x_threshold)
+            | (x > self.x_threshold)
+            | (theta < -self.theta_threshold_radians)
+            | (theta > self.theta_threshold_radians)
+        )
+        # as in tensorforce's gym wrapper the time limit
+        # takes precedence over the pole falling over
+        timed_out = self.timesteps[mask] >= self._max_episode_timesteps
+
+        terminals = np.zeros(self.num_envs, dtype=int)
+        terminals[mask] = np.where(timed_out, 2, np.where(fell, 1, 0))
+        rewards = np.zeros(self.num_envs)
+        rewards[mask] = 1.0
+
+        return self.cartpole_states.copy(), terminals, rewards
+
+    def close(self):
+        pass
+
+
+class NumpyCartPoleEnvironment:
+    """
+    One NumPy cartpole game with the tensorforce Environment interface.
+
+    Instances of this class can be used in place of
+    Environment.create(environment="gym", level="CartPole-v1")
+    both by the CartPole device and for creating tensorforce agents.
+    """
+
+    def __init__(self, max_episode_timesteps=500, random_state=None):
+        self.batched_cartpole = BatchedCartPole(
+            num_envs=1,
+            max_episode_timesteps=max_episode_timesteps,
+            random_state=random_state,
+        )
+
+    def states(self):
+        return self.batched_cartpole.states()
+
+    def actions(self):
+        return self.batched_cartpole.actions()
+
+    def max_episode_timesteps(self):
+        return self.batched_cartpole.max_episode_timesteps()
+
+    def reset(self):
+        return self.batched_cartpole.reset()[0]
+
+    def execute(self, actions):
+        next_states, terminals, rewards = self.batched_cartpole.step(
+            actions=np.asarray([actions])
+        )
+        return next_states[0], int(terminals[0]), float(rewards[0])
+
+    def close(self):
+        pass
@@ -0,0 +1,203 @@
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# set in each worker process by _initialize_worker()
+_document_queue = None
+
+
+def train_seeds(
+    train_kwargs,
+    seeds,
+    document_callback,
+    num_workers=None,
+    storage_batch_size=100,
+    storage_flush_interval=1.0,
+):
+    """
+    Train one agent per seed in a pool of worker processes.
+
+    See train_parallel() for how documents reach document_callback.
+
+    Parameters
+    ----------
+    train_kwargs: dict
+        keyword arguments for train_cartpole_agent() other than seed
+    seeds: list of int
+        one training run is started for each seed
+    document_callback: function(name, doc)
+        the document sink, for example databroker's Broker.insert
+    num_workers: int, optional
+        number of worker processes, by default one per seed
+    storage_batch_size: int
+        the largest number of events in one event page, 1 sends events unbatched
+    storage_flush_interval: float
+        the longest time in seconds an event is held in a worker before it is sent
+
+    Return
+    ------
+        (run_summaries, elapsed_time)
+        run_summaries is a list with one dictionary for each seed with keys
+        "seed", "run_uids", "event_count", "episode_count", "stop_reason"
+        and "elapsed_time"
+    """
+    run_summaries, elapsed_time = train_parallel(
+        train_kwargs_list=[dict(train_kwargs, seed=seed) for seed in seeds],
+        document_callback=document_callback,
+        num_workers=num_workers,
+        storage_batch_size=storage_batch_size,
+        storage_flush_interval=storage_flush_interval,
+    )
+    for seed, run_summary in zip(seeds, run_summaries):
+        run_summary["seed"] = seed
+    return run_summaries, elapsed_time
+
+
+def train_parallel(
+    train_kwargs_list,
+    document_callback,
+    num_workers=None,
+    storage_batch_size=100,
+    storage_flush_interval=1.0,
+):
+    """
+    Run train_cartpole_agent() once for each set of keyword arguments in a pool of worker processes.
+
+    Each worker process builds its own CartPole device, agent and RunEngine for
+    each training run. Documents are batched into event pages in the worker, sent
+    to this process through a multiprocessing queue and passed to document_callback
+    here, so only this process talks to storage. Documents of one run keep their
+    order but documents of different runs are interleaved.
+
+    Parameters
+    ----------
+    train_kwargs_list: list of dict
+        keyword arguments for train_cartpole_agent(), they are pickled so
+        any callback among them must be picklable
+    document_callback: function(name, doc)
+        the document sink, for example databroker's Broker.insert
+    num_workers: int, optional
+        number of worker processes, by default one per training run
+    storage_batch_size: int
+        the largest number of events in one event page, 1 sends events unbatched
+    storage_flush_interval: float
+        the longest time in seconds an event is held in a worker before it is sent
+
+    Return
+    ------
+        (run_summaries, elapsed_time)
+        run_summaries is a list with one dictionary for each training run with keys
+        "run_uids", "event_count", "episode_count", "stop_reason" and "elapsed_time",
+        where episode_count is the number of training episodes actually finished
+    """
+    if num_workers is None:
+        num_workers = len(train_kwargs_list)
+
+    # fork is unsafe once tensorflow has started threads
+    mp_context = multiprocessing.get_context("spawn")
+    document_queue = mp_context.Queue()
+
+    event_counts = [0] * len(train_kwargs_list)
+    episode_counts = [0] * len(train_kwargs_list)
+    # run index of each "training" stream descriptor
+    training_descriptor_runs = {}
+    stop_reasons = [None] * len(train_kwargs_list)
+    start_time = time.monotonic()
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=mp_context,
+        initializer=_initialize_worker,
+        initargs=(document_queue,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _train_worker,
+                run_i=run_i,
+                train_kwargs=train_kwargs,
+                storage_batch_size=storage_batch_size,
+                storage_flush_interval=storage_flush_interval,
+            )
+            for run_i, train_kwargs in enumerate(train_kwargs_list)
+        ]
+
+        # each worker sends (run_i, None, None) after its last document
+        finished_run_indices = set()
+        while len(finished_run_indices) < len(train_kwargs_list):
+            try:
+                run_i, name, doc = document_queue.get(timeout=1.0)
+            except queue.Empty:
+                if all(future.done() for future in futures):
+                    # a worker process died without sending its last message
+                    break
+                continue
+            if name is None:
+                finished_run_indices.add(run_i)
+            else:
+                if name == "stop":
+                    event_counts[run_i] += sum(doc.get("num_events", {}).values())
+                    stop_reasons[run_i] = doc.get("reason") or None
+                elif name == "descriptor" and doc["name"] == "training":
+                    training_descriptor_runs[doc["uid"]] = run_i
+                elif name == "event" and doc["descriptor"] in training_descriptor_runs:
+                    episode_counts[run_i] += doc["data"]["training_episode_count"]
+                elif (
+                    name == "event_page"
+                    and doc["descriptor"] in training_descriptor_runs
+                ):
+                    episode_counts[run_i] += sum(doc["data"]["training_episode_count"])
+                document_callback(name, doc)
+
+        run_summaries = [future.result() for future in futures]
+    elapsed_time = time.monotonic() - start_time
+
+    for run_i, run_summary in enumerate(run_summaries):
+        run_summary["event_count"] = event_counts[run_i]
+        run_summary["episode_count"] = episode_counts[run_i]
+        run_summary["stop_reason"] = stop_reasons[run_i]
+
+    return run_summaries, elapsed_time
+
+
+def _initialize_worker(document_queue):
+    global _document_queue
+    _document_queue = document_queue
+
+    # one thread per worker process, the pool provides the parallelism
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _train_worker(run_i, train_kwargs, storage_batch_size, storage_flush_interval):
+    from bluesky import RunEngine
+
+    from bluesky_cartpole.cartpole_plan import train_cartpole_agent
+    from bluesky_cartpole.storage import BatchingDocumentSink
+
+    def send_document(name, doc):
+        _document_queue.put((run_i, name, doc))
+
+    document_sink = send_document
+    if storage_batch_size > 1:
+        document_sink = BatchingDocumentSink(
+            send_document,
+            batch_size=storage_batch_size,
+            flush_interval=storage_flush_interval,
+        )
+
+    # the parent process handles ctrl-c, not the worker RunEngines
+    RE = RunEngine(context_managers=[])
+    RE.subscribe(document_sink)
+
+    start_time = time.monotonic()
+    try:
+        run_uids = RE(train_cartpole_agent(**train_kwargs))
+    finally:
+        _document_queue.put((run_i, None, None))
+
+    return {
+        "run_uids": list(run_uids),
+        "elapsed_time": time.monotonic() - start_time,
+    }
@@ -0,0 +1,39 @@
+import argparse
+
+from bluesky_cartpole.run_cartpole import get_authkey, parse_address
+
+
+def get_arg_parser():
+    """
+    Build the bluesky-cartpole-actor command line parser.
+    """
+    arg_parser = argparse.ArgumentParser(prog="bluesky-cartpole-actor")
+    # the --actor-listen address of a bluesky-cartpole learner,
+    # authenticated with $BLUESKY_CARTPOLE_AUTHKEY
+    arg_parser.add_argument("--learner", required=True, type=parse_address)
+    arg_parser.add_argument("--envs-per-actor", default=8, type=int)
+    arg_parser.add_argument("--batch-step-count", default=1000, type=int)
+    arg_parser.add_argument("--seed", default=None, type=int)
+
+    return arg_parser
+
+
+def run(argv=None):
+    arg_parser = get_arg_parser()
+    args = arg_parser.parse_args(argv)
+    authkey = get_authkey(arg_parser)
+
+    from bluesky_cartpole.distributed import run_actor
+
+    batch_count = run_actor(
+        address=args.learner,
+        authkey=authkey,
+        envs_per_actor=args.envs_per_actor,
+        batch_step_count=args.batch_step_count,
+        seed=args.seed,
+    )
+    print(f"sent {batch_count} batches to {args.learner[0]}:{args.learner[1]}")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,34 +1,285 @@
 import argparse
+import os
 
-from bluesky import RunEngine
-from bluesky.callbacks.best_effort import BestEffortCallback
-from databroker import Broker
+# the number of recent readings kept by the training plan with --long-run
+LONG_RUN_RECENT_UID_COUNT = 1000
 
-from bluesky_cartpole.cartpole_plan import train_cartpole_agent
 
+def get_arg_parser():
+    """
+    Build the bluesky-cartpole command line parser.
 
-def run():
-    arg_parser = argparse.ArgumentParser()
+    Only the standard library is imported here so that --help and
+    argument errors do not wait for tensorflow, bluesky or databroker.
+    """
+    arg_parser = argparse.ArgumentParser(prog="bluesky-cartpole")
     arg_parser.add_argument("--agent-name", required=True, type=str)
     arg_parser.add_argument("--episode-count", required=True, type=int)
+    arg_parser.add_argument(
+        "--granularity", default="step", choices=["step", "episode"], type=str
+    )
+    arg_parser.add_argument("--record-every", default=1, type=int)
+    # give the agent the plan's readings rather than the RunEngine's documents
+    arg_parser.add_argument("--direct-feedback", action="store_true")
+    # --long-run keeps memory bounded: the plan keeps only recent
+    # readings and the best effort callback draws no live plots
+    arg_parser.add_argument("--long-run", action="store_true")
+    # stop training early after this many steps or seconds
+    arg_parser.add_argument("--max-step-count", default=None, type=int)
+    arg_parser.add_argument("--max-duration", default=None, type=float)
+    arg_parser.add_argument("--evaluation-frequency", default=10, type=int)
+    # stop training when the mean evaluation reward reaches --convergence-reward
+    # in --convergence-patience consecutive evaluations, 475 solves CartPole-v1,
+    # or when it has not improved in --plateau-patience evaluations
+    arg_parser.add_argument("--convergence-reward", default=None, type=float)
+    arg_parser.add_argument("--convergence-patience", default=1, type=int)
+    arg_parser.add_argument("--plateau-patience", default=None, type=int)
+    arg_parser.add_argument("--evaluation-episode-count", default=100, type=int)
+    arg_parser.add_argument("--evaluation-tolerance", default=None, type=float)
+    arg_parser.add_argument("--evaluation-target-reward", default=None, type=float)
+    # --parallel-interactions N trains on N environments with batched agent calls,
+    # tensorforce's A2C can not do this so it requires --agent-name ppo
+    arg_parser.add_argument("--parallel-interactions", default=1, type=int)
+    # --env-groups 2 steps half of the environments while the agent acts for the other half
+    arg_parser.add_argument("--env-groups", default=1, type=int)
+    # several seeds or workers train one agent per seed in worker processes
+    arg_parser.add_argument("--num-workers", default=1, type=int)
+    arg_parser.add_argument("--seeds", default=None, nargs="+", type=int)
+    # --num-actors N trains with N actor processes and one learner
+    arg_parser.add_argument("--num-actors", default=0, type=int)
+    arg_parser.add_argument("--envs-per-actor", default=8, type=int)
+    arg_parser.add_argument("--batch-step-count", default=1000, type=int)
+    # --actor-listen HOST:PORT trains with bluesky-cartpole-actor processes
+    # that connect to this address, authenticated with $BLUESKY_CARTPOLE_AUTHKEY
+    arg_parser.add_argument("--actor-listen", default=None, type=parse_address)
+    add_storage_arguments(arg_parser)
+
+    return arg_parser
+
+
+def parse_address(address):
+    """
+    Split "host:port" into (host, port).
+    """
+    host, separator, port = address.rpartition(":")
+    if separator == "" or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"'{address}' is not a host:port address")
+    return host, int(port)
+
+
+def get_authkey(arg_parser):
+    """
+    Read the actor-learner shared secret from $BLUESKY_CARTPOLE_AUTHKEY.
+    """
+    authkey = os.environ.get("BLUESKY_CARTPOLE_AUTHKEY")
+    if not authkey:
+        arg_parser.error("set BLUESKY_CARTPOLE_AUTHKEY to a shared secret")
+    return authkey.encode()
+
+
+def add_storage_arguments(arg_parser):
+    """
+    Add the document storage options to a command line parser.
+    """
+    # --storage-batch-size 1 inserts each document separately
+    arg_parser.add_argument("--storage-batch-size", default=100, type=int)
+    arg_parser.add_argument("--storage-flush-interval", default=1.0, type=float)
+    # --storage-queue-size 0 inserts documents on the RunEngine thread
+    arg_parser.add_argument("--storage-queue-size", default=10000, type=int)
+    arg_parser.add_argument(
+        "--storage-spool-path", default="data/document_spool.jsonl", type=str
+    )
 
-    args = arg_parser.parse_args()
 
-    RE = RunEngine()
+def create_storage_writer(args):
+    """
+    Connect to databroker and build the document sink described by the storage options.
 
-    bec = BestEffortCallback()
+    Event batching is left to the caller because parallel runs batch
+    events in their worker processes.
 
-    RE.subscribe(bec)
+    Return
+    ------
+        (storage_sink, storage_writer)
+        storage_writer is an AsyncDocumentWriter to close after the last run,
+        or None if documents are inserted on the calling thread
+    """
+    from databroker import Broker
+
+    from bluesky_cartpole.storage import AsyncDocumentWriter
 
     db = Broker.named("bluesky-cartpole")
 
     # insert bluesky documents into databroker
-    RE.subscribe(db.insert)
+    storage_writer = None
+    storage_sink = db.insert
+    if args.storage_queue_size > 0:
+        # documents are inserted by a writer thread
+        storage_writer = AsyncDocumentWriter(
+            db.insert,
+            max_queue_size=args.storage_queue_size,
+            spool_path=args.storage_spool_path,
+        )
+        storage_sink = storage_writer
+    return storage_sink, storage_writer
+
+
+def run(argv=None):
+    arg_parser = get_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.record_every < 1:
+        arg_parser.error("--record-every must be at least 1")
+    if args.record_every > 1 and args.granularity != "step":
+        arg_parser.error("--record-every requires --granularity step")
+    if args.num_workers < 1:
+        arg_parser.error("--num-workers must be at least 1")
+    if args.num_actors < 0:
+        arg_parser.error("--num-actors must not be negative")
+    if args.parallel_interactions < 1:
+        arg_parser.error("--parallel-interactions must be at least 1")
+    if args.env_groups < 1:
+        arg_parser.error("--env-groups must be at least 1")
+    if args.parallel_interactions % args.env_groups != 0:
+        arg_parser.error("--parallel-interactions must be a multiple of --env-groups")
+    if args.parallel_interactions > 1 and args.agent_name == "a2c":
+        arg_parser.error("--parallel-interactions requires --agent-name ppo")
+    if args.parallel_interactions > 1 and (
+        args.num_actors > 0 or args.actor_listen is not None
+    ):
+        arg_parser.error(
+            "--parallel-interactions can not be combined with --num-actors or --actor-listen"
+        )
+    if (args.num_actors > 0 or args.actor_listen is not None) and any(
+        option_value is not None
+        for option_value in (
+            args.convergence_reward,
+            args.plateau_patience,
+            args.max_step_count,
+            args.max_duration,
+        )
+    ):
+        arg_parser.error(
+            "--convergence-reward, --plateau-patience, --max-step-count and --max-duration"
+            " can not be combined with --num-actors or --actor-listen"
+        )
 
-    RE(
-        train_cartpole_agent(
-            agent_name=args.agent_name, episode_count=args.episode_count
+    train_kwargs = dict(
+        agent_name=args.agent_name,
+        episode_count=args.episode_count,
+        granularity=args.granularity,
+        record_every=args.record_every,
+        direct_feedback=args.direct_feedback,
+        recent_uid_count=LONG_RUN_RECENT_UID_COUNT if args.long_run else None,
+        max_step_count=args.max_step_count,
+        max_duration=args.max_duration,
+        convergence_reward=args.convergence_reward,
+        convergence_patience=args.convergence_patience,
+        plateau_patience=args.plateau_patience,
+        evaluation_frequency=args.evaluation_frequency,
+        evaluation_episode_count=args.evaluation_episode_count,
+        evaluation_tolerance=args.evaluation_tolerance,
+        evaluation_target_reward=args.evaluation_target_reward,
+        num_actors=args.num_actors,
+        envs_per_actor=args.envs_per_actor,
+        batch_step_count=args.batch_step_count,
+        parallel_interactions=args.parallel_interactions,
+        env_groups=args.env_groups,
+    )
+    if args.actor_listen is not None:
+        train_kwargs.update(
+            actor_server_address=args.actor_listen,
+            actor_server_authkey=get_authkey(arg_parser),
         )
+
+    seeds = args.seeds
+    if seeds is None and args.num_workers > 1:
+        seeds = list(range(args.num_workers))
+
+    # heavy frameworks are imported only when a run actually starts
+    storage_sink, storage_writer = create_storage_writer(args)
+
+    try:
+        if seeds is not None and len(seeds) > 1:
+            run_parallel(
+                train_kwargs=train_kwargs,
+                seeds=seeds,
+                num_workers=args.num_workers,
+                storage_sink=storage_sink,
+                storage_batch_size=args.storage_batch_size,
+                storage_flush_interval=args.storage_flush_interval,
+            )
+        else:
+            from bluesky import RunEngine
+            from bluesky.callbacks.best_effort import BestEffortCallback
+
+            from bluesky_cartpole.cartpole_plan import train_cartpole_agent
+            from bluesky_cartpole.storage import BatchingDocumentSink
+
+            RE = RunEngine()
+
+            bec = BestEffortCallback()
+
+            if args.long_run:
+                # live plots keep every point
+                bec.disable_plots()
+            RE.subscribe(bec)
+
+            if args.storage_batch_size > 1:
+                # events are inserted in bulk as event pages
+                storage_sink = BatchingDocumentSink(
+                    storage_sink,
+                    batch_size=args.storage_batch_size,
+                    flush_interval=args.storage_flush_interval,
+                )
+            RE.subscribe(storage_sink)
+
+            RE(
+                train_cartpole_agent(
+                    seed=None if seeds is None else seeds[0], **train_kwargs
+                )
+            )
+    finally:
+        if storage_writer is not None:
+            storage_writer.close()
+
+
+def run_parallel(
+    train_kwargs,
+    seeds,
+    num_workers,
+    storage_sink,
+    storage_batch_size,
+    storage_flush_interval,
+):
+    """
+    Train one agent per seed in worker processes and print throughput.
+    """
+    from bluesky_cartpole.parallel_training import train_seeds
+
+    run_summaries, elapsed_time = train_seeds(
+        train_kwargs=train_kwargs,
+        seeds=seeds,
+        document_callback=storage_sink,
+        num_workers=num_workers,
+        storage_batch_size=storage_batch_size,
+        storage_flush_interval=storage_flush_interval,
+    )
+
+    for run_summary in run_summaries:
+        print(
+            f"seed {run_summary['seed']}: "
+            f"{run_summary['event_count']} events in {run_summary['elapsed_time']:.1f}s "
+            f"run uids {' '.join(run_summary['run_uids'])}"
+        )
+    # runs stopped early by a budget or convergence play fewer episodes
+    total_episode_count = sum(
+        run_summary["episode_count"] for run_summary in run_summaries
+    )
+    total_event_count = sum(run_summary["event_count"] for run_summary in run_summaries)
+    print(
+        f"{len(run_summaries)} runs on {num_workers} workers in {elapsed_time:.1f}s: "
+        f"{total_episode_count / elapsed_time:.1f} episodes/s "
+        f"{total_event_count / elapsed_time:.1f} events/s"
     )
 
 
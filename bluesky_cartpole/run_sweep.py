@@ -0,0 +1,93 @@
+import argparse
+import json
+
+from bluesky_cartpole.run_cartpole import add_storage_arguments, create_storage_writer
+
+
+def get_arg_parser():
+    """
+    Build the bluesky-cartpole-sweep command line parser.
+
+    The search space is a JSON file mapping agent parameter names to a list of
+    values or to a dict with "low", "high" and optionally "log" keys, for example
+
+        {"batch_size": [5, 10, 20], "horizon": {"low": 1, "high": 20}}
+
+    With --trial-count N, N random combinations are drawn as described for
+    bluesky_cartpole.sweep.random_search_space. Without it every combination of
+    the listed values is tried and every parameter must have a list of values.
+    """
+    arg_parser = argparse.ArgumentParser(prog="bluesky-cartpole-sweep")
+    arg_parser.add_argument("--agent-name", required=True, type=str)
+    arg_parser.add_argument(
+        "--search-space",
+        required=True,
+        type=str,
+        help="JSON file mapping agent parameter names to values",
+    )
+    # without --trial-count every combination of the listed values is tried
+    arg_parser.add_argument("--trial-count", default=None, type=int)
+    arg_parser.add_argument("--search-seed", default=None, type=int)
+    arg_parser.add_argument("--max-episode-count", required=True, type=int)
+    arg_parser.add_argument("--min-episode-count", default=10, type=int)
+    arg_parser.add_argument("--reduction-factor", default=3, type=int)
+    arg_parser.add_argument("--num-workers", default=None, type=int)
+    arg_parser.add_argument("--evaluation-episode-count", default=100, type=int)
+    add_storage_arguments(arg_parser)
+
+    return arg_parser
+
+
+def run(argv=None):
+    arg_parser = get_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.reduction_factor < 2:
+        arg_parser.error("--reduction-factor must be at least 2")
+
+    with open(args.search_space) as search_space_file:
+        search_space = json.load(search_space_file)
+
+    from bluesky_cartpole.sweep import grid_search_space, random_search_space, run_sweep
+
+    if args.trial_count is None:
+        if not all(isinstance(values, list) for values in search_space.values()):
+            arg_parser.error("a grid search needs a list of values for every parameter")
+        trial_parameters = grid_search_space(search_space)
+    else:
+        trial_parameters = random_search_space(
+            search_space, trial_count=args.trial_count, random_state=args.search_seed
+        )
+
+    storage_sink, storage_writer = create_storage_writer(args)
+    try:
+        trial_summaries, elapsed_time = run_sweep(
+            agent_name=args.agent_name,
+            trial_parameters=trial_parameters,
+            document_callback=storage_sink,
+            max_episode_count=args.max_episode_count,
+            min_episode_count=args.min_episode_count,
+            reduction_factor=args.reduction_factor,
+            num_workers=args.num_workers,
+            evaluation_episode_count=args.evaluation_episode_count,
+            storage_batch_size=args.storage_batch_size,
+            storage_flush_interval=args.storage_flush_interval,
+        )
+    finally:
+        if storage_writer is not None:
+            storage_writer.close()
+
+    print(f"{len(trial_summaries)} trials in {elapsed_time:.1f}s, best first:")
+    for trial_summary in trial_summaries:
+        print(
+            f"trial {trial_summary['trial_i']}: "
+            f"mean evaluation reward {trial_summary['last_reward_mean']} "
+            f"at episode {trial_summary['last_evaluation_episode']} "
+            f"parameters {trial_summary['parameters']} "
+            f"run uid {trial_summary['run_uids'][0]}"
+        )
+        if trial_summary["stop_reason"] is not None:
+            print(f"    {trial_summary['stop_reason']}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,303 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import event_model
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingDocumentSink:
+    """
+    A RunEngine subscriber grouping event documents into event pages for storage.
+
+    Events are held until batch_size events have arrived or the oldest held event
+    is flush_interval seconds old, then they are passed on as event_page documents,
+    which storage such as databroker's Mongo serializer writes with one bulk insert.
+    Every other document first flushes the held events and is then passed on
+    unchanged, so documents keep their order and a stop document always flushes
+    the last events of a run.
+
+    The flush interval is checked when documents arrive, there is no timer thread.
+    """
+
+    def __init__(self, callback, batch_size=100, flush_interval=1.0):
+        """
+        Parameters
+        ----------
+        callback: function(name, doc)
+            the document sink, for example databroker's Broker.insert
+        batch_size: int
+            the largest number of events in one flush
+        flush_interval: float
+            the longest time in seconds an event is held before a flush
+        """
+        self.callback = callback
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._events = []
+        self._first_event_time = None
+
+    def __call__(self, name, doc):
+        if name == "event":
+            if len(self._events) == 0:
+                self._first_event_time = time.monotonic()
+            self._events.append(doc)
+            if (
+                len(self._events) >= self.batch_size
+                or time.monotonic() - self._first_event_time >= self.flush_interval
+            ):
+                self.flush()
+        else:
+            self.flush()
+            self.callback(name, doc)
+
+    def flush(self):
+        """
+        Pass on the held events as one event page per run of events with the same descriptor.
+        """
+        for _, events in itertools.groupby(
+            self._events, key=lambda event: event["descriptor"]
+        ):
+            self.callback("event_page", event_model.pack_event_page(*events))
+        self._events.clear()
+        self._first_event_time = None
+
+
+class AsyncDocumentWriter:
+    """
+    A RunEngine subscriber passing documents to a storage callback on a writer thread.
+
+    Documents are handed to the writer thread through a bounded queue, so the
+    RunEngine waits only when the queue is full. If the storage callback raises an
+    exception the document and all following documents are appended to a spool
+    file, one JSON document per line. Every retry_interval seconds the writer thread
+    tries to replay the spool into storage, and once the whole spool has been stored
+    it is deleted and documents go to storage directly again. A spool left by an
+    earlier process is replayed before any new documents are stored.
+
+    A spooled document that fails while the document after it is stored can not be
+    blamed on unavailable storage. It is retried max_document_retries times and then
+    moved to the dead letter file, so one bad document does not keep the writer
+    spooling. A document that can be neither stored nor written to a file is
+    logged as an error and counted in lost_document_count. The writer thread logs
+    unexpected errors and keeps running; if it has stopped anyway, calling the
+    writer or close() raises a RuntimeError.
+
+    Call close() after the last run to wait for all documents to be written.
+    """
+
+    def __init__(
+        self,
+        callback,
+        max_queue_size=10000,
+        spool_path="data/document_spool.jsonl",
+        retry_interval=5.0,
+        max_document_retries=3,
+        dead_letter_path=None,
+    ):
+        """
+        Parameters
+        ----------
+        callback: function(name, doc)
+            the document sink, for example databroker's Broker.insert
+        max_queue_size: int
+            the largest number of documents waiting for the writer thread
+        spool_path: str
+            the file for documents that could not be stored
+        retry_interval: float
+            seconds between attempts to replay the spool
+        max_document_retries: int
+            attempts to store a document storage rejects before it is dead-lettered
+        dead_letter_path: str, optional
+            the file for documents that storage rejects, by default the spool path
+            with a "_failed" suffix
+        """
+        self.callback = callback
+        self.spool_path = spool_path
+        self.retry_interval = retry_interval
+        self.max_document_retries = max_document_retries
+        if dead_letter_path is None:
+            spool_root, spool_extension = os.path.splitext(spool_path)
+            dead_letter_path = spool_root + "_failed" + spool_extension
+        self.dead_letter_path = dead_letter_path
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # while spooling all documents go to the spool file to keep them in order
+        self._spooling = os.path.exists(spool_path)
+        self._next_retry_time = time.monotonic()
+        self._closed = False
+        # documents that could be neither stored nor written to a file
+        self.lost_document_count = 0
+
+        self._writer_thread = threading.Thread(
+            target=self._write_documents, name="cartpole-document-writer", daemon=True
+        )
+        self._writer_thread.start()
+
+    def __call__(self, name, doc):
+        # this blocks while the queue is full
+        self._put((name, doc))
+
+    def close(self):
+        """
+        Wait for the writer thread to store or spool all queued documents.
+        """
+        if self._closed:
+            return
+        self._put(None)
+        self._writer_thread.join()
+        self._closed = True
+        if self.lost_document_count > 0:
+            logger.error("%d documents were lost", self.lost_document_count)
+
+    def _put(self, item):
+        # a stopped writer thread would never make room in the queue
+        while True:
+            if not self._writer_thread.is_alive():
+                raise RuntimeError(
+                    "the document writer thread has stopped, documents can not be stored"
+                )
+            try:
+                self._queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def _write_documents(self):
+        while True:
+            try:
+                # wake up to retry the spool even if no documents arrive
+                item = self._queue.get(
+                    timeout=self.retry_interval if self._spooling else None
+                )
+            except queue.Empty:
+                item = ()
+
+            try:
+                if item is None:
+                    # one last attempt, whatever is left stays on disk for the next process
+                    self._replay_spool(force=True)
+                    break
+                self._replay_spool()
+                if item:
+                    self._write_document(*item)
+            except Exception:
+                logger.exception("unexpected error in the document writer thread")
+                self._next_retry_time = time.monotonic() + self.retry_interval
+                if item is None:
+                    break
+
+    def _write_document(self, name, doc):
+        if self._spooling:
+            self._spool(name, doc)
+            return
+        try:
+            self.callback(name, doc)
+        except Exception:
+            logger.exception(
+                "failed to store a %s document, spooling to %s",
+                name,
+                self.spool_path,
+            )
+            self._spooling = True
+            self._next_retry_time = time.monotonic() + self.retry_interval
+            self._spool(name, doc)
+
+    def _spool(self, name, doc, spool_path=None):
+        if spool_path is None:
+            spool_path = self.spool_path
+        try:
+            spool_directory = os.path.dirname(spool_path)
+            if spool_directory:
+                os.makedirs(spool_directory, exist_ok=True)
+            with open(spool_path, "a") as spool_file:
+                spool_file.write(
+                    json.dumps({"name": name, "doc": doc}, cls=event_model.NumpyEncoder)
+                )
+                spool_file.write("\n")
+        except (OSError, TypeError, ValueError):
+            self.lost_document_count += 1
+            logger.exception(
+                "failed to write a %s document to %s, the document is lost",
+                name,
+                spool_path,
+            )
+
+    def _replay_spool(self, force=False):
+        if not self._spooling or (
+            not force and time.monotonic() < self._next_retry_time
+        ):
+            return
+        if not os.path.exists(self.spool_path):
+            # the document that started spooling could not be written to the spool
+            self._spooling = False
+            return
+
+        with open(self.spool_path) as spool_file:
+            spooled_lines = spool_file.readlines()
+        # a failed document is blamed on storage until the next document is stored
+        failed_line_i = None
+        for line_i, line in enumerate(spooled_lines):
+            try:
+                spooled = json.loads(line)
+            except json.JSONDecodeError:
+                # an interrupted process may leave a partial last line
+                logger.warning("skipping a damaged line in %s", self.spool_path)
+                continue
+            try:
+                self.callback(spooled["name"], spooled["doc"])
+            except Exception:
+                if failed_line_i is None:
+                    failed_line_i = line_i
+                    continue
+                logger.warning(
+                    "storage is still unavailable, %d documents remain in %s",
+                    len(spooled_lines) - failed_line_i,
+                    self.spool_path,
+                )
+                self._keep_spooled_lines(spooled_lines[failed_line_i:])
+                return
+            if failed_line_i is not None:
+                # storage is available, so the failed document itself is rejected
+                self._retry_document(json.loads(spooled_lines[failed_line_i]))
+                failed_line_i = None
+
+        if failed_line_i is not None:
+            # no later document shows whether storage is available yet
+            self._keep_spooled_lines(spooled_lines[failed_line_i:])
+            return
+
+        os.remove(self.spool_path)
+        self._spooling = False
+        logger.info("replayed all spooled documents from %s", self.spool_path)
+
+    def _keep_spooled_lines(self, spooled_lines):
+        # keep only the documents that have not been stored
+        replacement_spool_path = self.spool_path + ".tmp"
+        with open(replacement_spool_path, "w") as spool_file:
+            spool_file.writelines(spooled_lines)
+        os.replace(replacement_spool_path, self.spool_path)
+        self._next_retry_time = time.monotonic() + self.retry_interval
+
+    def _retry_document(self, spooled):
+        store_error = None
+        for _ in range(self.max_document_retries):
+            try:
+                self.callback(spooled["name"], spooled["doc"])
+                return
+            except Exception as error:
+                store_error = error
+        logger.error(
+            "storage rejected a %s document %d times, moving it to %s",
+            spooled["name"],
+            self.max_document_retries + 1,
+            self.dead_letter_path,
+            exc_info=store_error,
+        )
+        self._spool(spooled["name"], spooled["doc"], spool_path=self.dead_letter_path)
@@ -0,0 +1,317 @@
+import itertools
+import multiprocessing
+import uuid
+
+import numpy as np
+
+from bluesky_cartpole.parallel_training import train_parallel
+
+
+def grid_search_space(parameter_grid):
+    """
+    List every combination of the parameter values in a grid.
+
+    Parameters
+    ----------
+    parameter_grid: dict
+        agent parameter name to a list of values, for example
+        dict(batch_size=[5, 10, 20], horizon=[5, 10])
+
+    Return
+    ------
+        list of agent parameter dictionaries
+    """
+    parameter_names = list(parameter_grid)
+    return [
+        dict(zip(parameter_names, parameter_values))
+        for parameter_values in itertools.product(
+            *(parameter_grid[parameter_name] for parameter_name in parameter_names)
+        )
+    ]
+
+
+def random_search_space(parameter_distributions, trial_count, random_state=None):
+    """
+    Draw random parameter combinations.
+
+    Each parameter is drawn from
+      - a list of values: one value is chosen with equal probability
+      - a dict with keys "low" and "high": a value is drawn uniformly from the
+        closed interval, as an int if both limits are ints, and uniformly in
+        log space if the dict also has "log": True
+
+    Parameters
+    ----------
+    parameter_distributions: dict
+        agent parameter name to a list or dict as described above, for example
+        dict(batch_size=dict(low=5, high=20), l2_regularization=dict(low=1e-3, high=0.1, log=True))
+    trial_count: int
+        number of parameter combinations
+    random_state: int or numpy.random.RandomState, optional
+
+    Return
+    ------
+        list of agent parameter dictionaries
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    def draw(distribution):
+        if isinstance(distribution, dict):
+            low = distribution["low"]
+            high = distribution["high"]
+            if distribution.get("log", False):
+                value = np.exp(random_state.uniform(np.log(low), np.log(high)))
+            else:
+                value = random_state.uniform(low, high)
+            if isinstance(low, int) and isinstance(high, int):
+                return min(high, int(round(value)))
+            return float(value)
+        else:
+            return distribution[random_state.randint(len(distribution))]
+
+    return [
+        {
+            parameter_name: draw(distribution)
+            for parameter_name, distribution in parameter_distributions.items()
+        }
+        for _ in range(trial_count)
+    ]
+
+
+def get_rung_episodes(min_episode_count, max_episode_count, reduction_factor):
+    """
+    The training episodes at which successive halving compares trials.
+
+    Return
+    ------
+        list of int: min_episode_count * reduction_factor ** k for every k
+        giving fewer than max_episode_count episodes
+    """
+    rung_episodes = []
+    rung_episode = min_episode_count
+    while rung_episode < max_episode_count:
+        rung_episodes.append(rung_episode)
+        rung_episode *= reduction_factor
+    return rung_episodes
+
+
+class SuccessiveHalvingStopper:
+    """
+    An evaluation callback for train_agent() that stops trials in the bottom of each rung.
+
+    This is the asynchronous form of successive halving: the evaluations of all
+    trials at each rung episode are collected in a dictionary shared between worker
+    processes, and a trial reaching a rung continues only if its mean evaluation
+    reward is at least the (1 - 1/reduction_factor) quantile of the rewards recorded
+    at that rung so far. Trials never wait for each other so a worker pool smaller
+    than the number of trials is always kept busy, and about 1/reduction_factor of
+    the trials continue past each rung.
+    """
+
+    def __init__(self, trial_i, rung_episodes, reduction_factor, rung_rewards, lock):
+        """
+        Parameters
+        ----------
+        trial_i: int
+            index of the trial using this callback
+        rung_episodes: list of int
+            the training episodes at which trials are compared
+        reduction_factor: int
+            about 1/reduction_factor of the trials continue past each rung
+        rung_rewards: dict
+            rung episode to list of mean evaluation rewards,
+            a multiprocessing.Manager dict shared by all trials
+        lock: a multiprocessing.Manager Lock protecting rung_rewards
+        """
+        self.trial_i = trial_i
+        self.rung_episodes = rung_episodes
+        self.reduction_factor = reduction_factor
+        self.rung_rewards = rung_rewards
+        self.lock = lock
+
+    def __call__(self, episode_i, episode_rewards):
+        if episode_i not in self.rung_episodes:
+            return None
+
+        reward_mean = float(np.mean(episode_rewards))
+        with self.lock:
+            # the Manager dict only sees assignments, not changes to its lists
+            rewards = self.rung_rewards.get(episode_i, []) + [reward_mean]
+            self.rung_rewards[episode_i] = rewards
+
+        cutoff = np.percentile(rewards, 100 * (1 - 1 / self.reduction_factor))
+        if reward_mean < cutoff:
+            return (
+                f"successive halving stopped trial {self.trial_i} at episode {episode_i}: "
+                f"mean evaluation reward {reward_mean:.1f} is below the cutoff {cutoff:.1f}"
+            )
+        else:
+            return None
+
+
+def run_sweep(
+    agent_name,
+    trial_parameters,
+    document_callback,
+    *,
+    max_episode_count,
+    min_episode_count=10,
+    reduction_factor=3,
+    num_workers=None,
+    evaluation_episode_count=100,
+    storage_batch_size=100,
+    storage_flush_interval=1.0,
+):
+    """
+    Train one agent per parameter combination in parallel, stopping poor trials early.
+
+    Every trial is a run of train_cartpole_agent() with its agent parameters
+    replacing the defaults of get_cartpole_agent(). Trials are evaluated every
+    min_episode_count episodes and compared by SuccessiveHalvingStopper at
+    min_episode_count, min_episode_count * reduction_factor, ... episodes. Each
+    trial's start document has a "sweep" entry with the sweep uid, the trial index
+    and its parameters, and the stop document of a stopped trial gives the reason.
+
+    Parameters
+    ----------
+    agent_name: str
+        "a2c" or "ppo"
+    trial_parameters: list of dict
+        agent parameters for each trial, for example from grid_search_space()
+        or random_search_space()
+    document_callback: function(name, doc)
+        the document sink, for example databroker's Broker.insert
+    max_episode_count: int
+        number of training episodes for trials that are never stopped
+    min_episode_count: int
+        training episodes before the first comparison of trials
+    reduction_factor: int
+        about 1/reduction_factor of the trials continue past each comparison
+    num_workers: int, optional
+        number of worker processes, by default one per trial
+    evaluation_episode_count: int
+        number of episodes for each evaluation
+    storage_batch_size: int
+        the largest number of events in one event page
+    storage_flush_interval: float
+        the longest time in seconds an event is held in a worker before it is sent
+
+    Return
+    ------
+        (trial_summaries, elapsed_time)
+        trial_summaries is a list with one dictionary for each trial, ordered from
+        highest to lowest last mean evaluation reward, with keys "trial_i",
+        "parameters", "run_uids", "last_evaluation_episode", "last_reward_mean",
+        "stop_reason" and "elapsed_time"
+    """
+    sweep_uid = str(uuid.uuid4())
+    rung_episodes = get_rung_episodes(
+        min_episode_count=min_episode_count,
+        max_episode_count=max_episode_count,
+        reduction_factor=reduction_factor,
+    )
+
+    # the manager process holds the evaluation results shared by all trials
+    with multiprocessing.get_context("spawn").Manager() as manager:
+        rung_rewards = manager.dict()
+        lock = manager.Lock()
+
+        train_kwargs_list = [
+            dict(
+                agent_name=agent_name,
+                episode_count=max_episode_count,
+                agent_parameters=parameters,
+                evaluation_frequency=min_episode_count,
+                evaluation_episode_count=evaluation_episode_count,
+                evaluation_callback=SuccessiveHalvingStopper(
+                    trial_i=trial_i,
+                    rung_episodes=rung_episodes,
+                    reduction_factor=reduction_factor,
+                    rung_rewards=rung_rewards,
+                    lock=lock,
+                ),
+                md={
+                    "sweep": {
+                        "uid": sweep_uid,
+                        "trial_i": trial_i,
+                        "trial_count": len(trial_parameters),
+                        "parameters": parameters,
+                        "min_episode_count": min_episode_count,
+                        "max_episode_count": max_episode_count,
+                        "reduction_factor": reduction_factor,
+                    }
+                },
+            )
+            for trial_i, parameters in enumerate(trial_parameters)
+        ]
+
+        evaluation_tracker = _EvaluationTracker(document_callback)
+        run_summaries, elapsed_time = train_parallel(
+            train_kwargs_list=train_kwargs_list,
+            document_callback=evaluation_tracker,
+            num_workers=num_workers,
+            storage_batch_size=storage_batch_size,
+            storage_flush_interval=storage_flush_interval,
+        )
+
+    trial_summaries = []
+    for trial_i, (parameters, run_summary) in enumerate(
+        zip(trial_parameters, run_summaries)
+    ):
+        last_evaluation_episode, last_reward_mean = (
+            evaluation_tracker.last_evaluations.get(
+                run_summary["run_uids"][0], (None, None)
+            )
+        )
+        trial_summaries.append(
+            {
+                "trial_i": trial_i,
+                "parameters": parameters,
+                "run_uids": run_summary["run_uids"],
+                "last_evaluation_episode": last_evaluation_episode,
+                "last_reward_mean": last_reward_mean,
+                "stop_reason": run_summary["stop_reason"],
+                "elapsed_time": run_summary["elapsed_time"],
+            }
+        )
+    trial_summaries.sort(
+        key=lambda trial_summary: (
+            -np.inf
+            if trial_summary["last_reward_mean"] is None
+            else trial_summary["last_reward_mean"]
+        ),
+        reverse=True,
+    )
+
+    return trial_summaries, elapsed_time
+
+
+class _EvaluationTracker:
+    # pass documents on while remembering the last evaluation of each run,
+    # train_cartpole_agent() names its evaluation device cartpole_evaluation
+    def __init__(self, document_callback):
+        self.document_callback = document_callback
+        self.evaluation_descriptor_run_uids = {}
+        self.last_evaluations = {}
+
+    def __call__(self, name, doc):
+        if name == "descriptor" and doc["name"] == "evaluation":
+            self.evaluation_descriptor_run_uids[doc["uid"]] = doc["run_start"]
+        elif name == "event_page":
+            self._track(doc, event_i=-1)
+        elif name == "event":
+            self._track(doc, event_i=None)
+
+        self.document_callback(name, doc)
+
+    def _track(self, doc, event_i):
+        run_uid = self.evaluation_descriptor_run_uids.get(doc["descriptor"])
+        if run_uid is not None:
+            episode = doc["data"]["cartpole_evaluation_episode"]
+            reward_mean = doc["data"]["cartpole_evaluation_reward_mean"]
+            if event_i is not None:
+                # the last event of an event page
+                episode = episode[event_i]
+                reward_mean = reward_mean[event_i]
+            self.last_evaluations[run_uid] = (episode, reward_mean)
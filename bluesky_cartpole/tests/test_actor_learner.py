@@ -0,0 +1,128 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from bluesky.tests.utils import DocCollector as DocumentCollector
+
+from bluesky_cartpole.actor_learner import SharedWeights, TrajectoryBuffer
+from bluesky_cartpole.cartpole import CartPole, get_cartpole_agent
+from bluesky_cartpole.cartpole_plan import (
+    train_agent_actor_learner,
+    train_cartpole_agent,
+)
+
+
+def ship_batch(trajectory_buffer, shared_weights, result_queue):
+    weights, weights_version = shared_weights.read_if_newer(known_version=0)
+    slot_i = trajectory_buffer.free_slots.get()
+    trajectory_buffer.write(
+        slot_i=slot_i,
+        states=np.full((3, 4), weights["w"].sum()),
+        actions=np.asarray([0, 1, 0]),
+        rewards=np.ones(3),
+        terminals=np.asarray([0, 0, 1]),
+    )
+    result_queue.put((slot_i, weights_version))
+    trajectory_buffer.close()
+    shared_weights.close()
+
+
+def test_shared_memory_between_processes():
+    mp_context = multiprocessing.get_context("spawn")
+    shared_weights = SharedWeights(
+        dict(w=np.ones((2, 2), dtype=np.float32), step=np.int64(0)),
+        mp_context=mp_context,
+    )
+    trajectory_buffer = TrajectoryBuffer(
+        slot_count=2, capacity=10, mp_context=mp_context
+    )
+    try:
+        assert shared_weights.write(dict(w=np.full((2, 2), 2.0), step=5)) == 2
+
+        result_queue = mp_context.Queue()
+        actor_process = mp_context.Process(
+            target=ship_batch, args=(trajectory_buffer, shared_weights, result_queue)
+        )
+        actor_process.start()
+        slot_i, weights_version = result_queue.get(timeout=60)
+        actor_process.join()
+
+        assert weights_version == 2
+        batch = trajectory_buffer.read(slot_i=slot_i, step_count=3)
+        assert np.all(batch["states"] == 8.0)
+        assert batch["actions"].tolist() == [0, 1, 0]
+        assert batch["terminals"].tolist() == [0, 0, 1]
+
+        # the weights are only copied when there is a newer version
+        assert shared_weights.read_if_newer(known_version=2) == (None, 2)
+    finally:
+        trajectory_buffer.close()
+        trajectory_buffer.unlink()
+        shared_weights.close()
+        shared_weights.unlink()
+
+
+def test_train_agent_actor_learner(RE):
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent_actor_learner(
+            agent=cartpole_agent,
+            episode_count=20,
+            num_actors=2,
+            envs_per_actor=4,
+            batch_step_count=100,
+            seed=1,
+        )
+    )
+
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    assert set(descriptors) == {"learner", "actor", "training"}
+
+    learner_events = dc.event[descriptors["learner"]["uid"]]
+    assert [event["data"]["learner_update"] for event in learner_events] == list(
+        range(1, len(learner_events) + 1)
+    )
+    assert learner_events[-1]["data"]["learner_episode_count"] >= 20
+    (training_event,) = dc.event[descriptors["training"]["uid"]]
+    assert (
+        training_event["data"]["training_episode_count"]
+        == learner_events[-1]["data"]["learner_episode_count"]
+    )
+    for event in learner_events:
+        assert event["data"]["learner_batch_step_count"] >= 100
+
+    actor_events = dc.event[descriptors["actor"]["uid"]]
+    assert len(actor_events) == len(learner_events)
+    for event in actor_events:
+        assert event["data"]["actor_index"] in (0, 1)
+        assert event["data"]["actor_steps_per_second"] > 0.0
+
+
+@pytest.mark.parametrize(
+    "stopping_option",
+    [
+        dict(convergence_reward=475.0),
+        dict(plateau_patience=3),
+        dict(max_step_count=1000),
+        dict(max_duration=60.0),
+    ],
+)
+def test_train_cartpole_agent_actor_learner_options(stopping_option):
+    # the learner would ignore these options, so they are rejected
+    with pytest.raises(ValueError):
+        next(
+            train_cartpole_agent(
+                agent_name="a2c", episode_count=10, num_actors=2, **stopping_option
+            )
+        )
@@ -1,5 +1,10 @@
 import pprint
 
+import numpy as np
+import pytest
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
 from bluesky.tests.utils import DocCollector as DocumentCollector
 
 from bluesky_adaptive.per_event import (
@@ -7,7 +12,13 @@ from bluesky_adaptive.per_event import (
     adaptive_plan,
 )
 
-from bluesky_cartpole.cartpole import CartPole, CartpoleRecommender, get_cartpole_agent
+from bluesky_cartpole.cartpole import (
+    CartPole,
+    CartpoleRecommender,
+    FastCartPole,
+    VectorCartPole,
+    get_cartpole_agent,
+)
 
 
 def test_cartpole_device():
@@ -25,6 +36,116 @@ def test_cartpole_device():
     pprint.pprint(cartpole_state)
 
 
+def test_fast_cartpole_device():
+    cartpole = CartPole(backend="numpy", max_episode_timesteps=10, random_state=0)
+    fast_cartpole = FastCartPole(
+        backend="numpy", max_episode_timesteps=10, random_state=0
+    )
+
+    assert fast_cartpole.describe() == cartpole.describe()
+
+    cartpole.stage()
+    fast_cartpole.stage()
+    # the fast device records the same steps as CartPole
+    for step_i in range(25):
+        cartpole.action.put(step_i % 2)
+        cartpole.trigger()
+        fast_cartpole.action.set(step_i % 2)
+        status = fast_cartpole.trigger()
+        assert status.done and status.success
+
+        reading = cartpole.read()
+        fast_reading = fast_cartpole.read()
+        assert list(fast_reading) == list(reading)
+        for key in reading:
+            np.testing.assert_array_equal(
+                fast_reading[key]["value"], reading[key]["value"]
+            )
+
+    cartpole.unstage()
+    fast_cartpole.unstage()
+
+
+def test_cartpole_devices_asynchronous(RE):
+    cartpole_devices = [
+        CartPole(
+            name=f"cartpole_{env_i}",
+            backend="numpy",
+            max_episode_timesteps=10,
+            asynchronous=True,
+        )
+        for env_i in range(2)
+    ]
+
+    @bpp.stage_decorator(cartpole_devices)
+    @bpp.run_decorator()
+    def step_plan():
+        # alternating actions keep the poles up for 10 steps
+        for step_i in range(10):
+            for cartpole_device in cartpole_devices:
+                yield from bps.mv(cartpole_device.action, step_i % 2)
+            # both devices step at once and trigger_and_read waits for both
+            yield from bps.trigger_and_read(cartpole_devices)
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(step_plan())
+
+    (events,) = dc.event.values()
+    assert len(events) == 10
+    for cartpole_device in cartpole_devices:
+        assert events[-1]["data"][f"{cartpole_device.name}_terminal"] > 0
+        # unstaging stops the worker thread
+        assert cartpole_device._step_executor is None
+
+
+def test_vector_cartpole_device():
+    vector_cartpole = VectorCartPole(num_envs=3, max_episode_timesteps=10)
+
+    description = vector_cartpole.describe()
+    pprint.pprint(description)
+
+    vector_cartpole.stage()
+    assert vector_cartpole.state_after_reset.get().shape == (3, 4)
+
+    # alternating actions keep the poles up so every
+    # episode is terminated by the time limit after 10 steps
+    for step_i in range(10):
+        vector_cartpole.action.put(np.full(3, step_i % 2))
+        vector_cartpole.trigger()
+
+        assert vector_cartpole.next_state.get().shape == (3, 4)
+        assert vector_cartpole.reward.get().shape == (3,)
+        assert vector_cartpole.terminal.get().shape == (3,)
+
+    terminal = vector_cartpole.terminal.get()
+    state_after_reset = vector_cartpole.state_after_reset.get()
+    assert np.all(terminal > 0)
+    assert np.all(np.isfinite(state_after_reset))
+
+    vector_cartpole_state = vector_cartpole.read()
+    pprint.pprint(vector_cartpole_state)
+
+    vector_cartpole.unstage()
+
+
+def test_vector_cartpole_device_asynchronous():
+    vector_cartpole = VectorCartPole(
+        num_envs=3, backend="numpy", max_episode_timesteps=10, asynchronous=True
+    )
+
+    vector_cartpole.stage()
+    for step_i in range(10):
+        vector_cartpole.action.put(np.full(3, step_i % 2))
+        status = vector_cartpole.trigger()
+        status.wait(timeout=10)
+        assert status.success
+        assert vector_cartpole.step_time > 0.0
+
+    assert np.all(vector_cartpole.terminal.get() > 0)
+    vector_cartpole.unstage()
+
+
 def test_per_event_adaptive_plan(RE):
 
     cartpole_device = CartPole(max_episode_timesteps=10)
@@ -60,6 +181,132 @@ def test_per_event_adaptive_plan(RE):
     # pprint.pprint(f"cartpole_agent.get_variables(): {cartpole_agent.get_variables()}")
 
 
+def test_cartpole_recommender_single_env_names():
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+    cartpole_recommender = CartpoleRecommender(cartpole_agent=cartpole_agent)
+
+    cartpole_device.stage()
+    cartpole_recommender.start(cartpole_device.state_after_reset.get())
+    (action,) = cartpole_recommender.ask(1)
+    cartpole_device.action.put(action)
+    cartpole_device.trigger()
+    # the original four dependent values, without env_index
+    cartpole_recommender.tell(
+        [action],
+        [
+            cartpole_device.next_state.get(),
+            cartpole_device.reward.get(),
+            cartpole_device.terminal.get(),
+            cartpole_device.state_after_reset.get(),
+        ],
+    )
+    cartpole_device.unstage()
+
+    # the single-environment attribute names are kept
+    assert cartpole_recommender.action == cartpole_recommender.actions[0]
+    assert cartpole_recommender.total_reward == cartpole_recommender.total_rewards[0]
+
+
+def test_cartpole_recommender_vector_events():
+    vector_cartpole = VectorCartPole(
+        num_envs=3, backend="numpy", max_episode_timesteps=10
+    )
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="ppo", cartpole_device=vector_cartpole, parallel_interactions=3
+    )
+    cartpole_recommender = CartpoleRecommender(
+        cartpole_agent=cartpole_agent, num_envs=3
+    )
+
+    vector_cartpole.stage()
+    cartpole_recommender.start(vector_cartpole.state_after_reset.get())
+    for _ in range(10):
+        actions = cartpole_recommender.ask(3)
+        assert len(actions) == 3
+        vector_cartpole.action.put(np.asarray(actions))
+        vector_cartpole.trigger()
+        cartpole_recommender.tell_many(
+            [[actions]],
+            [
+                [
+                    vector_cartpole.next_state.get(),
+                    vector_cartpole.reward.get(),
+                    vector_cartpole.terminal.get(),
+                    vector_cartpole.state_after_reset.get(),
+                ]
+            ],
+        )
+    vector_cartpole.unstage()
+
+    # every episode ends within 10 steps
+    assert cartpole_recommender.episode_count >= 3
+
+
+def test_cartpole_recommender_event_page():
+    cartpole_devices = [
+        CartPole(
+            name=f"cartpole_{env_i}",
+            backend="numpy",
+            max_episode_timesteps=10,
+            env_index=env_i,
+        )
+        for env_i in range(3)
+    ]
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="ppo", cartpole_device=cartpole_devices[0], parallel_interactions=3
+    )
+    cartpole_recommender = CartpoleRecommender(
+        cartpole_agent=cartpole_agent, num_envs=3
+    )
+
+    for cartpole_device in cartpole_devices:
+        cartpole_device.stage()
+    cartpole_recommender.start(
+        [
+            cartpole_device.state_after_reset.get()
+            for cartpole_device in cartpole_devices
+        ]
+    )
+    for step_i in range(10):
+        # one event from each cartpole device, told together like an event page,
+        # the events name their environments so their order does not matter
+        actions = cartpole_recommender.ask(3)
+        independent_values_list = []
+        dependent_values_list = []
+        device_order = cartpole_devices if step_i % 2 == 0 else cartpole_devices[::-1]
+        for cartpole_device in device_order:
+            action = actions[cartpole_device.env_index.get()]
+            cartpole_device.action.put(action)
+            cartpole_device.trigger()
+            independent_values_list.append([action])
+            dependent_values_list.append(
+                [
+                    cartpole_device.next_state.get(),
+                    cartpole_device.reward.get(),
+                    cartpole_device.terminal.get(),
+                    cartpole_device.state_after_reset.get(),
+                    cartpole_device.env_index.get(),
+                ]
+            )
+        cartpole_recommender.tell_many(independent_values_list, dependent_values_list)
+
+    assert cartpole_recommender.episode_count >= 3
+    assert len(cartpole_recommender.ask(1)) == 1
+
+    # an event without an env_index can not be assigned to an environment
+    with pytest.raises(ValueError):
+        cartpole_recommender.tell(
+            [0],
+            dependent_values_list[0][:4],
+        )
+    # the single-environment attributes are not available for several environments
+    with pytest.raises(AttributeError):
+        cartpole_recommender.action
+
+
 def __test_cartpole_recommender(RE, hw):
 
     recommender = CartpoleRecommender()
@@ -0,0 +1,584 @@
+import gc
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from bluesky.tests.utils import DocCollector as DocumentCollector
+from tensorforce.agents import Agent
+
+from bluesky_cartpole.cartpole import CartPole, VectorCartPole, get_cartpole_agent
+from bluesky_cartpole.cartpole_plan import train_agent, train_agent_vectorized
+from bluesky_cartpole.evaluation import ConvergenceStopper
+
+
+def test_train_agent(RE):
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(train_agent(env_device=cartpole_device, agent=cartpole_agent, episode_count=20))
+
+    assert len(dc.start) == 1
+    assert len(dc.stop) == 1
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    assert set(descriptors) == {"primary", "evaluation", "training"}
+    assert "cartpole_evaluation_reward_mean" not in descriptors["primary"]["data_keys"]
+    (training_event,) = dc.event[descriptors["training"]["uid"]]
+    assert training_event["data"]["training_episode_count"] == 20
+
+    # the evaluations at episodes 10 and 20 are recorded in the evaluation stream
+    evaluation_events = dc.event[descriptors["evaluation"]["uid"]]
+    evaluation_episodes = [
+        event["data"]["cartpole_evaluation_episode"] for event in evaluation_events
+    ]
+    assert evaluation_episodes == [10, 20]
+    for event in evaluation_events:
+        assert event["data"]["cartpole_evaluation_episode_count"] == 100
+        assert event["data"]["cartpole_evaluation_reward_mean"] > 0.0
+
+
+def test_train_agent_episode_granularity(RE):
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=cartpole_agent,
+            episode_count=5,
+            granularity="episode",
+        )
+    )
+
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    assert "primary" not in descriptors
+    # the step arrays of the episode stream have a variable length
+    episode_data_keys = descriptors["episode"]["data_keys"]
+    assert episode_data_keys["cartpole_episode_actions"]["shape"] == [None]
+    assert episode_data_keys["cartpole_episode_next_states"]["shape"] == [None, 4]
+
+    episode_events = dc.event[descriptors["episode"]["uid"]]
+    assert len(episode_events) >= 5
+    for episode_i, event in enumerate(episode_events, start=1):
+        data = event["data"]
+        assert data["cartpole_episode_index"] == episode_i
+        length = data["cartpole_episode_length"]
+        assert 0 < length <= 10
+        assert len(data["cartpole_episode_actions"]) == length
+        assert len(data["cartpole_episode_next_states"]) == length
+        assert data["cartpole_episode_total_reward"] == sum(
+            data["cartpole_episode_rewards"]
+        )
+        # only the last step of an episode is terminal
+        assert data["cartpole_episode_terminals"][-1] > 0
+        assert all(
+            terminal == 0 for terminal in data["cartpole_episode_terminals"][:-1]
+        )
+
+
+def test_train_agent_record_every(RE):
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    # count every step taken in the cartpole environment
+    step_count = 0
+    execute = cartpole_device.cartpole_env.execute
+
+    def counting_execute(actions):
+        nonlocal step_count
+        step_count += 1
+        return execute(actions=actions)
+
+    cartpole_device.cartpole_env.execute = counting_execute
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=cartpole_agent,
+            episode_count=5,
+            record_every=3,
+        )
+    )
+
+    (primary_descriptor,) = [
+        descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+        if descriptor["name"] == "primary"
+    ]
+    primary_events = dc.event[primary_descriptor["uid"]]
+    terminal_events = [
+        event for event in primary_events if event["data"]["cartpole_terminal"] > 0
+    ]
+    # every terminal step is recorded but only every 3rd other step
+    assert len(terminal_events) >= 5
+    assert len(primary_events) <= step_count // 3 + len(terminal_events)
+    assert len(primary_events) < step_count
+
+
+def test_train_agent_evaluation_callback(RE):
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    evaluated_episodes = []
+
+    def stop_after_first_evaluation(episode_i, episode_rewards):
+        evaluated_episodes.append(episode_i)
+        return "stopped after the first evaluation"
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=cartpole_agent,
+            episode_count=100,
+            evaluation_frequency=5,
+            evaluation_episode_count=10,
+            evaluation_callback=stop_after_first_evaluation,
+        )
+    )
+
+    # evaluations still running when training stopped are recorded
+    # but the callback is not called again
+    assert evaluated_episodes == [5]
+    (stop_doc,) = dc.stop.values()
+    assert stop_doc["exit_status"] == "success"
+    assert stop_doc["reason"] == "stopped after the first evaluation"
+
+
+def test_train_agent_vectorized(RE):
+    cartpole_device = VectorCartPole(
+        num_envs=4, backend="numpy", max_episode_timesteps=10
+    )
+    # tensorforce's A2C can not act on several environments
+    with pytest.raises(ValueError):
+        get_cartpole_agent(
+            agent_name="a2c", cartpole_device=cartpole_device, parallel_interactions=4
+        )
+    cartpole_agent, agent_parameters = get_cartpole_agent(
+        agent_name="ppo", cartpole_device=cartpole_device, parallel_interactions=4
+    )
+    assert agent_parameters["parallel_interactions"] == 4
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent_vectorized(
+            env_device=cartpole_device,
+            agent=cartpole_agent,
+            episode_count=20,
+            evaluation_episode_count=10,
+        )
+    )
+
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    assert set(descriptors) == {"primary", "evaluation", "timing", "training"}
+
+    # each event carries one transition from each environment
+    primary_events = dc.event[descriptors["primary"]["uid"]]
+    for event in primary_events:
+        assert len(event["data"]["vector_cartpole_action"]) == 4
+        assert len(event["data"]["vector_cartpole_reward"]) == 4
+    finished_episode_count = sum(
+        sum(terminal > 0 for terminal in event["data"]["vector_cartpole_terminal"])
+        for event in primary_events
+    )
+    assert finished_episode_count >= 20
+    # at most 10 steps per episode and 4 episodes at a time
+    assert len(primary_events) <= 10 * (20 // 4 + 1)
+
+    evaluation_events = dc.event[descriptors["evaluation"]["uid"]]
+    assert len(evaluation_events) >= 1
+
+
+def test_train_agent_vectorized_env_groups(RE):
+    env_group_devices = [
+        VectorCartPole(
+            num_envs=2,
+            name=f"vector_cartpole_{group_i}",
+            backend="numpy",
+            max_episode_timesteps=10,
+            asynchronous=True,
+        )
+        for group_i in range(2)
+    ]
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="ppo",
+        cartpole_device=env_group_devices[0],
+        parallel_interactions=4,
+    )
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent_vectorized(
+            env_device=env_group_devices,
+            agent=cartpole_agent,
+            episode_count=20,
+            evaluation_episode_count=10,
+        )
+    )
+
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    assert set(descriptors) == {
+        "vector_cartpole_0",
+        "vector_cartpole_1",
+        "evaluation",
+        "timing",
+        "training",
+    }
+
+    # the groups take turns
+    group_0_events = dc.event[descriptors["vector_cartpole_0"]["uid"]]
+    group_1_events = dc.event[descriptors["vector_cartpole_1"]["uid"]]
+    assert 0 <= len(group_0_events) - len(group_1_events) <= 1
+    for event in group_0_events:
+        assert len(event["data"]["vector_cartpole_0_action"]) == 2
+
+    (timing_event,) = dc.event[descriptors["timing"]["uid"]]
+    timing = timing_event["data"]
+    assert timing["timing_env_groups"] == 2
+    assert timing["timing_step_count"] == len(group_0_events) + len(group_1_events)
+    assert 0.0 <= timing["timing_hidden_step_time"] <= timing["timing_env_step_time"]
+    assert 0.0 <= timing["timing_overlap"] <= 1.0
+
+
+def test_train_agent_direct_feedback(RE):
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    # count the steps the agent is given
+    observe_count = 0
+    observe = cartpole_agent.observe
+
+    def counting_observe(**kwargs):
+        nonlocal observe_count
+        observe_count += 1
+        return observe(**kwargs)
+
+    cartpole_agent.observe = counting_observe
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=cartpole_agent,
+            episode_count=5,
+            direct_feedback=True,
+        )
+    )
+
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    # 5 episodes are too few for an evaluation
+    assert set(descriptors) == {"primary", "training"}
+    primary_events = dc.event[descriptors["primary"]["uid"]]
+    # the step after the last episode is recorded but not given to the agent
+    assert len(primary_events) - 1 <= observe_count <= len(primary_events)
+
+
+class StandInCartPoleEnvironment:
+    """
+    A cartpole environment stand-in whose episodes end after a fixed number of steps.
+    """
+
+    def __init__(self, episode_length=2, terminal=1):
+        self.episode_length = episode_length
+        self.terminal = terminal
+        self.step_i = 0
+
+    def reset(self):
+        return np.zeros(4)
+
+    def execute(self, actions):
+        self.step_i += 1
+        if self.step_i % self.episode_length == 0:
+            return np.zeros(4), self.terminal, 1.0
+        else:
+            return np.zeros(4), 0, 1.0
+
+
+def create_random_agent():
+    """
+    A random agent keeps the agent's own cost and memory out of plan tests.
+    """
+    return Agent.create(
+        agent="random",
+        states=dict(type="float", shape=(4,)),
+        actions=dict(type="int", num_values=2),
+        max_episode_timesteps=10,
+    )
+
+
+class StandInAgent:
+    """
+    An agent stand-in that always pushes the cart left, for plans that are never evaluated.
+    """
+
+    def act(self, states):
+        return 0
+
+    def observe(self, reward, terminal):
+        pass
+
+
+def train_stand_in_agent(RE, cartpole_device, episode_count):
+    """
+    Train a StandInAgent with recent_uid_count=100 and return the plan's readings.
+    """
+    uids = []
+
+    def train_plan():
+        # RE() returns the run uids, not the plan's return value
+        uids.extend(
+            (
+                yield from train_agent(
+                    env_device=cartpole_device,
+                    agent=StandInAgent(),
+                    episode_count=episode_count,
+                    # no evaluations
+                    evaluation_frequency=episode_count + 1,
+                    recent_uid_count=100,
+                )
+            )
+        )
+
+    RE(train_plan())
+    return uids
+
+
+def test_train_agent_recent_uid_count_memory(RE):
+    # every step is an episode
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_device.cartpole_env = StandInCartPoleEnvironment(episode_length=1)
+
+    def get_peak_training_memory(episode_count):
+        # restarting tracemalloc resets the peak, only memory
+        # allocated while training is counted
+        gc.collect()
+        tracemalloc.start()
+        try:
+            uids = train_stand_in_agent(RE, cartpole_device, episode_count)
+            _, peak_size = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert len(uids) == 100
+        return peak_size
+
+    # warm up so caches filled by the first run are not counted
+    get_peak_training_memory(episode_count=100)
+    short_run_peak_size = get_peak_training_memory(episode_count=500)
+    long_run_peak_size = get_peak_training_memory(episode_count=2000)
+
+    # keeping the readings or RunEngine messages of
+    # the 1500 additional steps would take about 3 MB
+    assert long_run_peak_size - short_run_peak_size < 1e6
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/statm"), reason="reads the RSS from /proc"
+)
+def test_train_agent_recent_uid_count_rss(RE):
+    # tracemalloc does not see memory allocated outside Python's allocator
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_device.cartpole_env = StandInCartPoleEnvironment(episode_length=1)
+
+    def get_rss():
+        with open("/proc/self/statm") as statm_file:
+            resident_page_count = int(statm_file.read().split()[1])
+        return resident_page_count * os.sysconf("SC_PAGE_SIZE")
+
+    peak_rss = 0
+
+    def sample_rss(name, doc):
+        nonlocal peak_rss
+        if name == "event" and doc["seq_num"] % 100 == 0:
+            peak_rss = max(peak_rss, get_rss())
+
+    RE.subscribe(sample_rss)
+
+    def get_peak_training_rss(episode_count):
+        nonlocal peak_rss
+        gc.collect()
+        peak_rss = 0
+        uids = train_stand_in_agent(RE, cartpole_device, episode_count)
+        assert len(uids) == 100
+        return peak_rss
+
+    # warm up so caches filled by the first run are not counted
+    get_peak_training_rss(episode_count=500)
+    short_run_peak_rss = get_peak_training_rss(episode_count=2000)
+    long_run_peak_rss = get_peak_training_rss(episode_count=10000)
+
+    # keeping the readings or RunEngine messages of
+    # the 8000 additional steps would take about 16 MB
+    assert long_run_peak_rss - short_run_peak_rss < 5e6
+
+
+def test_train_agent_time_limit_ends_episodes(RE):
+    # every episode reaches the time limit
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_device.cartpole_env = StandInCartPoleEnvironment(
+        episode_length=3, terminal=2
+    )
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=create_random_agent(),
+            episode_count=5,
+            evaluation_frequency=6,
+            evaluation_episode_count=2,
+            direct_feedback=True,
+        )
+    )
+
+    (primary_descriptor,) = [
+        descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+        if descriptor["name"] == "primary"
+    ]
+    primary_events = dc.event[primary_descriptor["uid"]]
+    assert len(primary_events) == 5 * 3
+    assert [event["data"]["cartpole_terminal"] for event in primary_events] == [
+        0,
+        0,
+        2,
+    ] * 5
+    (stop_doc,) = dc.stop.values()
+    assert not stop_doc["reason"]
+
+
+def test_train_agent_step_budget(RE):
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_device.cartpole_env = StandInCartPoleEnvironment()
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=create_random_agent(),
+            episode_count=1000,
+            evaluation_frequency=1001,
+            evaluation_episode_count=2,
+            max_step_count=7,
+        )
+    )
+
+    primary_descriptor, training_descriptor = [
+        descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+        if descriptor["name"] in ("primary", "training")
+    ]
+    assert len(dc.event[primary_descriptor["uid"]]) == 7
+    # 7 steps finish 3 episodes of 2 steps
+    (training_event,) = dc.event[training_descriptor["uid"]]
+    assert training_event["data"]["training_episode_count"] == 3
+    (stop_doc,) = dc.stop.values()
+    assert stop_doc["exit_status"] == "success"
+    assert stop_doc["reason"] == "step budget of 7 steps used up"
+
+    with pytest.raises(ValueError):
+        RE(
+            train_agent(
+                env_device=cartpole_device,
+                agent=create_random_agent(),
+                episode_count=10,
+                max_step_count=0,
+            )
+        )
+
+
+def test_train_agent_time_budget(RE):
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_device.cartpole_env = StandInCartPoleEnvironment()
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=create_random_agent(),
+            episode_count=1000000,
+            evaluation_frequency=1000001,
+            evaluation_episode_count=2,
+            max_duration=0.5,
+        )
+    )
+
+    (stop_doc,) = dc.stop.values()
+    assert stop_doc["exit_status"] == "success"
+    assert stop_doc["reason"] == "time budget of 0.5 seconds used up"
+
+
+def test_train_agent_convergence_stopper(RE):
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_device.cartpole_env = StandInCartPoleEnvironment()
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE(
+        train_agent(
+            env_device=cartpole_device,
+            agent=create_random_agent(),
+            episode_count=1000,
+            evaluation_frequency=5,
+            evaluation_episode_count=2,
+            # every evaluation of the random agent reaches this reward
+            evaluation_callback=ConvergenceStopper(target_reward=1.0, patience=2),
+        )
+    )
+
+    (evaluation_descriptor,) = [
+        descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+        if descriptor["name"] == "evaluation"
+    ]
+    assert len(dc.event[evaluation_descriptor["uid"]]) >= 2
+    (stop_doc,) = dc.stop.values()
+    assert stop_doc["exit_status"] == "success"
+    assert stop_doc["reason"].startswith("converged at episode ")
@@ -0,0 +1,111 @@
+import multiprocessing
+import socket
+import time
+from multiprocessing.connection import Client
+
+from bluesky.tests.utils import DocCollector as DocumentCollector
+
+from bluesky_cartpole.cartpole import CartPole, get_cartpole_agent
+from bluesky_cartpole.cartpole_plan import train_agent_actor_learner
+from bluesky_cartpole.distributed import LearnerServer, run_actor
+
+
+def test_distributed_actors_join_and_leave(RE):
+    cartpole_device = CartPole(backend="numpy")
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+    learner_server = LearnerServer(
+        agent=cartpole_agent, authkey=b"test-authkey", address=("127.0.0.1", 0)
+    )
+
+    mp_context = multiprocessing.get_context("spawn")
+    actor_kwargs = dict(
+        address=learner_server.address,
+        authkey=b"test-authkey",
+        envs_per_actor=4,
+        batch_step_count=100,
+    )
+    # the first actor leaves after two batches
+    leaving_actor = mp_context.Process(
+        target=run_actor, kwargs=dict(actor_kwargs, seed=1, batch_limit=2)
+    )
+    # the second actor joins after the first update
+    joining_actor = mp_context.Process(
+        target=run_actor, kwargs=dict(actor_kwargs, seed=2)
+    )
+
+    def start_joining_actor(name, doc):
+        if name == "event" and joining_actor.pid is None:
+            joining_actor.start()
+
+    dc = DocumentCollector()
+    RE.subscribe(dc.insert)
+    RE.subscribe(start_joining_actor)
+    leaving_actor.start()
+    try:
+        RE(
+            train_agent_actor_learner(
+                agent=cartpole_agent, episode_count=60, actor_pool=learner_server
+            )
+        )
+    finally:
+        leaving_actor.join(timeout=60)
+        if joining_actor.pid is not None:
+            joining_actor.join(timeout=60)
+
+    assert leaving_actor.exitcode == 0
+    assert joining_actor.exitcode == 0
+
+    descriptors = {
+        descriptor["name"]: descriptor
+        for descriptors in dc.descriptor.values()
+        for descriptor in descriptors
+    }
+    actor_events = dc.event[descriptors["actor"]["uid"]]
+    actor_indices = [event["data"]["actor_index"] for event in actor_events]
+    assert actor_indices.count(0) == 2
+    assert 1 in actor_indices
+
+    learner_events = dc.event[descriptors["learner"]["uid"]]
+    assert learner_events[-1]["data"]["learner_episode_count"] >= 60
+    assert max(event["data"]["learner_actor_count"] for event in learner_events) >= 1
+
+
+class StandInAgent:
+    """
+    Just enough of a Tensorforce Agent to start a LearnerServer.
+    """
+
+    spec = dict(agent="random")
+
+    def get_variables(self):
+        return ["weight"]
+
+    def get_variable(self, variable):
+        return 0.0
+
+
+def test_learner_server_silent_client():
+    learner_server = LearnerServer(
+        agent=StandInAgent(),
+        authkey=b"test-authkey",
+        address=("127.0.0.1", 0),
+        handshake_timeout=1.0,
+    )
+    learner_server.start()
+    # a client that connects and never answers the authkey challenge
+    silent_client = socket.create_connection(learner_server.address)
+    try:
+        with Client(learner_server.address, authkey=b"test-authkey") as connection:
+            assert connection.poll(timeout=10.0)
+            message, start_message = connection.recv()
+        assert message == "start"
+        assert start_message["actor_i"] == 1
+
+        # the learner gives up on the silent client and can be closed promptly
+        close_start_time = time.monotonic()
+        learner_server.close(timeout=10.0)
+        assert time.monotonic() - close_start_time < 5.0
+    finally:
+        silent_client.close()
@@ -0,0 +1,146 @@
+import numpy as np
+
+from bluesky_cartpole.cartpole import CartPole, get_cartpole_agent
+from bluesky_cartpole.evaluation import (
+    BackgroundEvaluator,
+    ConvergenceStopper,
+    confidence_interval,
+    evaluate_agent,
+    evaluate_agent_adaptive,
+    evaluate_agent_batched,
+)
+
+
+def test_evaluate_agent():
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    episode_rewards = evaluate_agent(
+        agent=cartpole_agent,
+        cartpole_env=cartpole_device.create_evaluation_environment(),
+        episode_count=3,
+    )
+    assert episode_rewards.shape == (3,)
+    assert np.all(episode_rewards > 0.0)
+    assert np.all(episode_rewards <= 10.0)
+
+
+def test_evaluate_agent_batched():
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    # 7 episodes are played in rounds of 3, 3 and 1 episodes
+    episode_rewards = evaluate_agent_batched(
+        agent=cartpole_agent,
+        vector_env=cartpole_device.create_evaluation_vector_environment(num_envs=3),
+        episode_count=7,
+    )
+    assert episode_rewards.shape == (7,)
+    assert np.all(episode_rewards > 0.0)
+    assert np.all(episode_rewards <= 10.0)
+
+
+def test_confidence_interval():
+    mean, half_width = confidence_interval(np.full(10, 500.0))
+    assert mean == 500.0
+    assert half_width == 0.0
+
+    mean, half_width = confidence_interval(np.asarray([1.0, 3.0]), z_score=1.0)
+    assert mean == 2.0
+    assert np.isclose(half_width, 1.0)
+
+
+def test_evaluate_agent_adaptive():
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+    vector_env = cartpole_device.create_evaluation_vector_environment(num_envs=5)
+
+    # a generous tolerance is met after the first round
+    episode_rewards = evaluate_agent_adaptive(
+        agent=cartpole_agent,
+        vector_env=vector_env,
+        max_episode_count=100,
+        tolerance=10.0,
+    )
+    assert episode_rewards.shape == (5,)
+
+    # a zero tolerance is met only by identical episode rewards
+    # so the episode budget is the only guaranteed limit
+    episode_rewards = evaluate_agent_adaptive(
+        agent=cartpole_agent,
+        vector_env=vector_env,
+        max_episode_count=15,
+        tolerance=0.0,
+    )
+    assert 5 <= len(episode_rewards) <= 15
+
+    # no episode can earn more than 10 so a target of 100 is clearly unreachable
+    episode_rewards = evaluate_agent_adaptive(
+        agent=cartpole_agent,
+        vector_env=vector_env,
+        max_episode_count=100,
+        tolerance=0.0,
+        target_reward=100.0,
+    )
+    assert len(episode_rewards) == 5
+
+
+def test_background_evaluator():
+    cartpole_device = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole_agent, _ = get_cartpole_agent(
+        agent_name="a2c", cartpole_device=cartpole_device
+    )
+
+    evaluator = BackgroundEvaluator(
+        agent=cartpole_agent,
+        vector_env=cartpole_device.create_evaluation_vector_environment(num_envs=3),
+        episode_count=3,
+    )
+    assert evaluator.next_completed() is None
+
+    evaluator.submit(episode_i=10)
+    evaluator.submit(episode_i=20)
+    assert evaluator.pending_count() == 2
+    # the waiting snapshot from episode 20 is replaced by the newer one
+    evaluator.submit(episode_i=30)
+    assert evaluator.pending_count() == 2
+    assert evaluator.skipped_count == 1
+
+    episode_i, episode_rewards = evaluator.next_completed(wait=True)
+    assert episode_i == 10
+    assert episode_rewards.shape == (3,)
+    episode_i, episode_rewards = evaluator.next_completed(wait=True)
+    assert episode_i == 30
+    assert evaluator.pending_count() == 0
+
+    evaluator.close()
+
+
+def test_convergence_stopper():
+    stopper = ConvergenceStopper(target_reward=475.0, patience=2)
+    assert stopper(10, [500.0, 460.0]) is None
+    # the target must be reached in consecutive evaluations
+    assert stopper(20, [400.0, 400.0]) is None
+    assert stopper(30, [500.0, 500.0]) is None
+    assert "converged at episode 40" in stopper(40, [480.0, 490.0])
+
+    stopper = ConvergenceStopper(
+        target_reward=None, plateau_patience=2, min_improvement=5.0
+    )
+    assert stopper(10, [100.0]) is None
+    assert stopper(20, [104.0]) is None
+    assert stopper(30, [120.0]) is None
+    assert stopper(40, [110.0]) is None
+    assert "plateaued at episode 50" in stopper(50, [124.0])
+
+    # another callback's reason takes precedence
+    stopper = ConvergenceStopper(
+        evaluation_callback=lambda episode_i, episode_rewards: "stopped by sweep"
+    )
+    assert stopper(10, [500.0]) == "stopped by sweep"
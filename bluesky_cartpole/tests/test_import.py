@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+
+def test_import_is_lazy():
+    # importing the package must not construct the catalog or import heavy frameworks
+    imported_modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, bluesky_cartpole; print(' '.join(sorted(sys.modules)))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+
+    for heavy_module in ("intake", "databroker", "tensorforce", "tensorflow"):
+        assert heavy_module not in imported_modules
+
+
+def test_cli_help_is_lazy():
+    # bluesky-cartpole --help must not import heavy frameworks
+    imported_modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from bluesky_cartpole.run_cartpole import run\n"
+            "try:\n"
+            "    run(['--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(' '.join(sorted(sys.modules)), file=sys.stderr)",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr.split()
+
+    for heavy_module in (
+        "bluesky",
+        "databroker",
+        "gym",
+        "tensorforce",
+        "tensorflow",
+        "event_model",
+    ):
+        assert heavy_module not in imported_modules
@@ -0,0 +1,126 @@
+import gym
+from gym.utils import seeding
+import numpy as np
+import pytest
+
+from bluesky_cartpole.cartpole import CartPole, VectorCartPole
+from bluesky_cartpole.numpy_cartpole import BatchedCartPole, NumpyCartPoleEnvironment
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_parity_with_gym(seed):
+    gym_env = gym.make("CartPole-v1")
+    gym_env.seed(seed)
+    gym_state = gym_env.reset()
+
+    # gym seeds its random number generator with seeding.np_random
+    np_random, _ = seeding.np_random(seed)
+    batched_cartpole = BatchedCartPole(num_envs=1, random_state=np_random)
+    batched_state = batched_cartpole.reset()[0]
+    np.testing.assert_allclose(batched_state, gym_state, rtol=0.0, atol=1e-12)
+
+    action_rng = np.random.RandomState(seed)
+    gym_done = False
+    while not gym_done:
+        action = action_rng.randint(2)
+
+        gym_state, gym_reward, gym_done, _ = gym_env.step(action)
+        batched_states, batched_terminals, batched_rewards = batched_cartpole.step(
+            actions=np.asarray([action])
+        )
+
+        np.testing.assert_allclose(batched_states[0], gym_state, rtol=1e-9, atol=1e-12)
+        assert batched_rewards[0] == gym_reward
+        assert (batched_terminals[0] > 0) == gym_done
+
+    gym_env.close()
+
+
+def test_time_limit():
+    batched_cartpole = BatchedCartPole(num_envs=5, max_episode_timesteps=10)
+    batched_cartpole.reset()
+
+    # alternating actions keep the poles up
+    for step_i in range(10):
+        _, terminals, rewards = batched_cartpole.step(actions=np.full(5, step_i % 2))
+        assert np.all(rewards == 1.0)
+
+    assert np.all(terminals == 2)
+
+
+def test_mask():
+    batched_cartpole = BatchedCartPole(num_envs=4, random_state=0)
+    states = batched_cartpole.reset()
+
+    mask = np.asarray([True, False, True, False])
+    next_states, terminals, rewards = batched_cartpole.step(
+        actions=np.ones(4, dtype=int), mask=mask
+    )
+
+    np.testing.assert_array_equal(next_states[~mask], states[~mask])
+    assert np.all(next_states[mask] != states[mask])
+    np.testing.assert_array_equal(rewards, [1.0, 0.0, 1.0, 0.0])
+    np.testing.assert_array_equal(batched_cartpole.timesteps, [1, 0, 1, 0])
+
+    reset_states = batched_cartpole.reset(mask=mask)
+    np.testing.assert_array_equal(reset_states[~mask], next_states[~mask])
+    np.testing.assert_array_equal(batched_cartpole.timesteps, [0, 0, 0, 0])
+
+
+def test_many_envs():
+    batched_cartpole = BatchedCartPole(num_envs=10000, random_state=0)
+    states = batched_cartpole.reset()
+    assert states.shape == (10000, 4)
+
+    actions = np.random.RandomState(0).randint(2, size=10000)
+    next_states, terminals, rewards = batched_cartpole.step(actions=actions)
+    assert next_states.shape == (10000, 4)
+    assert terminals.shape == (10000,)
+    assert rewards.shape == (10000,)
+
+
+def test_numpy_environment():
+    cartpole_env = NumpyCartPoleEnvironment(max_episode_timesteps=10, random_state=0)
+    assert cartpole_env.states() == dict(type="float", shape=(4,))
+    assert cartpole_env.actions() == dict(type="int", shape=(), num_values=2)
+    assert cartpole_env.max_episode_timesteps() == 10
+
+    state = cartpole_env.reset()
+    assert state.shape == (4,)
+
+    next_state, terminal, reward = cartpole_env.execute(actions=1)
+    assert next_state.shape == (4,)
+    assert terminal == 0
+    assert reward == 1.0
+
+
+def test_cartpole_device_numpy_backend():
+    cartpole = CartPole(backend="numpy", max_episode_timesteps=10)
+    cartpole.stage()
+
+    # alternating actions keep the pole up until the time limit
+    for step_i in range(10):
+        cartpole.action.put(step_i % 2)
+        cartpole.trigger()
+
+    assert cartpole.terminal.get() == 2
+    assert np.all(np.isfinite(cartpole.state_after_reset.get()))
+    cartpole.unstage()
+
+
+def test_vector_cartpole_device_numpy_backend():
+    vector_cartpole = VectorCartPole(num_envs=1000, backend="numpy")
+    vector_cartpole.stage()
+
+    vector_cartpole.action.put(np.ones(1000, dtype=int))
+    vector_cartpole.trigger()
+
+    assert vector_cartpole.next_state.get().shape == (1000, 4)
+    assert np.all(vector_cartpole.terminal.get() == 0)
+    assert np.all(np.isnan(vector_cartpole.state_after_reset.get()))
+    vector_cartpole.unstage()
+
+
+def test_cartpole_device_unknown_backend():
+    with pytest.raises(ValueError):
+        CartPole(backend="pytorch")
@@ -0,0 +1,26 @@
+from bluesky.tests.utils import DocCollector as DocumentCollector
+
+from bluesky_cartpole.parallel_training import train_seeds
+
+
+def test_train_seeds():
+    dc = DocumentCollector()
+    run_summaries, elapsed_time = train_seeds(
+        train_kwargs=dict(agent_name="a2c", episode_count=3),
+        seeds=[1, 2],
+        document_callback=dc.insert,
+        num_workers=2,
+    )
+
+    assert elapsed_time > 0.0
+    assert [run_summary["seed"] for run_summary in run_summaries] == [1, 2]
+
+    # each seed is recorded as a complete run
+    assert sorted(start_doc["seed"] for start_doc in dc.start) == [1, 2]
+    assert len(dc.stop) == 2
+    for run_summary in run_summaries:
+        assert len(run_summary["run_uids"]) == 1
+        stop_doc = dc.stop[run_summary["run_uids"][0]]
+        assert stop_doc["exit_status"] == "success"
+        assert run_summary["event_count"] == sum(stop_doc["num_events"].values())
+        assert run_summary["episode_count"] == 3
@@ -0,0 +1,220 @@
+import json
+import os
+import time
+
+import event_model
+import pytest
+
+from bluesky_cartpole.storage import AsyncDocumentWriter, BatchingDocumentSink
+
+
+def compose_documents(event_count):
+    run_bundle = event_model.compose_run()
+    documents = [("start", run_bundle.start_doc)]
+    descriptor_bundle = run_bundle.compose_descriptor(
+        name="primary",
+        data_keys={"reward": {"source": "", "dtype": "number", "shape": []}},
+    )
+    documents.append(("descriptor", descriptor_bundle.descriptor_doc))
+    for event_i in range(event_count):
+        documents.append(
+            (
+                "event",
+                descriptor_bundle.compose_event(
+                    data={"reward": float(event_i)},
+                    timestamps={"reward": 0.0},
+                ),
+            )
+        )
+    documents.append(("stop", run_bundle.compose_stop()))
+    return documents
+
+
+def test_batching_document_sink():
+    sunk_documents = []
+    sink = BatchingDocumentSink(
+        lambda name, doc: sunk_documents.append((name, doc)),
+        batch_size=4,
+        flush_interval=1000.0,
+    )
+    for name, doc in compose_documents(event_count=10):
+        sink(name, doc)
+
+    names = [name for name, _ in sunk_documents]
+    # the stop document forces the last 2 events to be flushed
+    assert names == [
+        "start",
+        "descriptor",
+        "event_page",
+        "event_page",
+        "event_page",
+        "stop",
+    ]
+    rewards = [
+        reward
+        for name, doc in sunk_documents
+        if name == "event_page"
+        for reward in doc["data"]["reward"]
+    ]
+    assert rewards == [float(event_i) for event_i in range(10)]
+
+
+def test_batching_document_sink_flush_interval():
+    sunk_documents = []
+    # a zero flush interval passes on each event immediately
+    sink = BatchingDocumentSink(
+        lambda name, doc: sunk_documents.append((name, doc)),
+        batch_size=100,
+        flush_interval=0.0,
+    )
+    for name, doc in compose_documents(event_count=3):
+        sink(name, doc)
+
+    names = [name for name, _ in sunk_documents]
+    assert names.count("event_page") == 3
+
+
+class FlakyStorage:
+    """
+    A document sink that raises an exception while it is unavailable.
+    """
+
+    def __init__(self):
+        self.available = True
+        self.stored_documents = []
+
+    def __call__(self, name, doc):
+        if not self.available:
+            raise ConnectionError("storage is unavailable")
+        self.stored_documents.append((name, doc))
+
+
+def test_async_document_writer(tmp_path):
+    storage = FlakyStorage()
+    spool_path = str(tmp_path / "spool" / "documents.jsonl")
+    writer = AsyncDocumentWriter(storage, spool_path=spool_path, retry_interval=0.01)
+
+    documents = compose_documents(event_count=10)
+    for name, doc in documents:
+        writer(name, doc)
+    writer.close()
+
+    assert [doc["uid"] for _, doc in storage.stored_documents] == [
+        doc["uid"] for _, doc in documents
+    ]
+    assert not os.path.exists(spool_path)
+
+
+def test_async_document_writer_spool(tmp_path):
+    storage = FlakyStorage()
+    spool_path = str(tmp_path / "spool" / "documents.jsonl")
+
+    # documents are spooled while storage is unavailable
+    storage.available = False
+    writer = AsyncDocumentWriter(storage, spool_path=spool_path, retry_interval=0.01)
+    documents = compose_documents(event_count=10)
+    for name, doc in documents[:5]:
+        writer(name, doc)
+    writer.close()
+    assert len(storage.stored_documents) == 0
+    assert os.path.exists(spool_path)
+
+    # a new writer replays the spool before storing new documents
+    storage.available = True
+    writer = AsyncDocumentWriter(storage, spool_path=spool_path, retry_interval=0.01)
+    for name, doc in documents[5:]:
+        writer(name, doc)
+    writer.close()
+
+    assert [doc["uid"] for _, doc in storage.stored_documents] == [
+        doc["uid"] for _, doc in documents
+    ]
+    assert not os.path.exists(spool_path)
+
+
+class RejectingStorage(FlakyStorage):
+    """
+    A document sink that raises an exception for one document.
+    """
+
+    def __init__(self, rejected_uid):
+        super().__init__()
+        self.rejected_uid = rejected_uid
+        self.rejected_count = 0
+
+    def __call__(self, name, doc):
+        if doc["uid"] == self.rejected_uid:
+            self.rejected_count += 1
+            raise ValueError("storage rejects this document")
+        super().__call__(name, doc)
+
+
+def test_async_document_writer_dead_letter(tmp_path):
+    documents = compose_documents(event_count=10)
+    rejected_name, rejected_doc = documents[3]
+    storage = RejectingStorage(rejected_uid=rejected_doc["uid"])
+    spool_path = str(tmp_path / "spool" / "documents.jsonl")
+    dead_letter_path = str(tmp_path / "spool" / "failed.jsonl")
+    writer = AsyncDocumentWriter(
+        storage,
+        spool_path=spool_path,
+        retry_interval=0.01,
+        max_document_retries=2,
+        dead_letter_path=dead_letter_path,
+    )
+    for name, doc in documents:
+        writer(name, doc)
+    writer.close()
+
+    # the rejected document does not hold back the documents after it
+    assert [doc["uid"] for _, doc in storage.stored_documents] == [
+        doc["uid"] for _, doc in documents if doc is not rejected_doc
+    ]
+    assert storage.rejected_count == 4
+    assert not os.path.exists(spool_path)
+    with open(dead_letter_path) as dead_letter_file:
+        dead_letters = [json.loads(line) for line in dead_letter_file]
+    assert dead_letters == [{"name": rejected_name, "doc": rejected_doc}]
+
+
+def test_async_document_writer_spool_error(tmp_path, caplog):
+    storage = FlakyStorage()
+    # the spool can not be created below a regular file
+    (tmp_path / "not_a_directory").write_text("")
+    spool_path = str(tmp_path / "not_a_directory" / "documents.jsonl")
+    writer = AsyncDocumentWriter(storage, spool_path=spool_path, retry_interval=0.01)
+
+    documents = compose_documents(event_count=10)
+    storage.available = False
+    writer(*documents[0])
+    # the writer thread survives the failed spool and stores the later documents
+    time.sleep(0.1)
+    storage.available = True
+    for name, doc in documents[1:]:
+        writer(name, doc)
+    writer.close()
+
+    assert [doc["uid"] for _, doc in storage.stored_documents] == [
+        doc["uid"] for _, doc in documents[1:]
+    ]
+    # the document that could be neither stored nor spooled is reported
+    assert writer.lost_document_count == 1
+    assert "the document is lost" in caplog.text
+
+
+# the writer thread is stopped on purpose
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_async_document_writer_stopped_thread(tmp_path):
+    def stop_thread(name, doc):
+        raise SystemExit()
+
+    spool_path = str(tmp_path / "spool" / "documents.jsonl")
+    writer = AsyncDocumentWriter(stop_thread, spool_path=spool_path)
+    documents = compose_documents(event_count=1)
+    writer(*documents[0])
+    writer._writer_thread.join(timeout=10.0)
+
+    with pytest.raises(RuntimeError):
+        writer(*documents[1])
+    with pytest.raises(RuntimeError):
+        writer.close()
@@ -0,0 +1,99 @@
+import threading
+
+from bluesky.tests.utils import DocCollector as DocumentCollector
+
+from bluesky_cartpole.sweep import (
+    SuccessiveHalvingStopper,
+    get_rung_episodes,
+    grid_search_space,
+    random_search_space,
+    run_sweep,
+)
+
+
+def test_grid_search_space():
+    trial_parameters = grid_search_space(dict(batch_size=[5, 10], horizon=[1, 10, 20]))
+
+    assert len(trial_parameters) == 6
+    assert dict(batch_size=10, horizon=20) in trial_parameters
+
+
+def test_random_search_space():
+    parameter_distributions = dict(
+        batch_size=dict(low=5, high=20),
+        l2_regularization=dict(low=1e-3, high=0.1, log=True),
+        horizon=[1, 5, 10],
+    )
+    trial_parameters = random_search_space(
+        parameter_distributions, trial_count=20, random_state=1
+    )
+
+    assert len(trial_parameters) == 20
+    for parameters in trial_parameters:
+        assert isinstance(parameters["batch_size"], int)
+        assert 5 <= parameters["batch_size"] <= 20
+        assert 1e-3 <= parameters["l2_regularization"] <= 0.1
+        assert parameters["horizon"] in (1, 5, 10)
+
+    # the same seed draws the same trials
+    assert trial_parameters == random_search_space(
+        parameter_distributions, trial_count=20, random_state=1
+    )
+
+
+def test_get_rung_episodes():
+    assert get_rung_episodes(10, 200, 3) == [10, 30, 90]
+    assert get_rung_episodes(10, 10, 3) == []
+
+
+def test_successive_halving_stopper():
+    rung_rewards = {}
+    lock = threading.Lock()
+
+    def evaluate(trial_i, episode_i, reward):
+        stopper = SuccessiveHalvingStopper(
+            trial_i=trial_i,
+            rung_episodes=[10, 30],
+            reduction_factor=3,
+            rung_rewards=rung_rewards,
+            lock=lock,
+        )
+        return stopper(episode_i, [reward, reward])
+
+    # the first trial at a rung always continues
+    assert evaluate(0, 10, 100.0) is None
+    # a trial below the cutoff of the rewards so far is stopped
+    assert "episode 10" in evaluate(1, 10, 20.0)
+    assert evaluate(2, 10, 200.0) is None
+    # evaluations between rungs never stop a trial
+    assert evaluate(1, 20, 0.0) is None
+    assert rung_rewards == {10: [100.0, 20.0, 200.0]}
+
+
+def test_run_sweep():
+    trial_parameters = grid_search_space(dict(batch_size=[5, 10]))
+
+    dc = DocumentCollector()
+    trial_summaries, elapsed_time = run_sweep(
+        agent_name="a2c",
+        trial_parameters=trial_parameters,
+        document_callback=dc.insert,
+        max_episode_count=6,
+        min_episode_count=2,
+        evaluation_episode_count=2,
+    )
+
+    assert len(trial_summaries) == 2
+    # each trial is a run tagged with its parameters
+    assert len(dc.start) == 2
+    assert len({start_doc["sweep"]["uid"] for start_doc in dc.start}) == 1
+    assert sorted(
+        start_doc["sweep"]["parameters"]["batch_size"] for start_doc in dc.start
+    ) == [5, 10]
+    for start_doc in dc.start:
+        assert (
+            start_doc["agent_parameters"]["batch_size"]
+            == start_doc["sweep"]["parameters"]["batch_size"]
+        )
+    for trial_summary in trial_summaries:
+        assert trial_summary["last_reward_mean"] is not None
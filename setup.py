@@ -51,6 +51,8 @@ setup(
     entry_points={
         "console_scripts": [
             "bluesky-cartpole = bluesky_cartpole.run_cartpole:run",
+            "bluesky-cartpole-sweep = bluesky_cartpole.run_sweep:run",
+            "bluesky-cartpole-actor = bluesky_cartpole.run_actor:run",
         ],
         "intake.catalogs": [
             "bluesky-cartpole = bluesky_cartpole:bluesky_cartpole_catalog_instance"